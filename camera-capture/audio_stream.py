@@ -0,0 +1,135 @@
+# audio_stream.py
+import os
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000  # what Whisper expects
+STREAM_WINDOW_SECONDS = float(os.getenv("STREAM_WINDOW_SECONDS", "15"))
+STREAM_PARTIAL_INTERVAL = float(os.getenv("STREAM_PARTIAL_INTERVAL", "1.0"))
+
+
+class StreamingDecoder:
+    """
+    Pipes compressed audio chunks (e.g. MediaRecorder webm/opus) through one
+    long-lived ffmpeg process and collects 16 kHz mono PCM in memory.
+    Only the first MediaRecorder chunk carries the container header, so the
+    chunks must go through a single decoder in order.
+    """
+
+    def __init__(self):
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self.pcm = bytearray()
+        self._reader: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self.proc = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-loglevel", "error",
+            "-fflags", "nobuffer", "-probesize", "4096", "-analyzeduration", "0",
+            "-i", "pipe:0",
+            "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self) -> None:
+        while True:
+            chunk = await self.proc.stdout.read(SAMPLE_RATE)
+            if not chunk:
+                break
+            self.pcm.extend(chunk)
+
+    async def feed(self, data: bytes) -> None:
+        self.proc.stdin.write(data)
+        await self.proc.stdin.drain()
+
+    async def finish(self) -> None:
+        """Flush the decoder and wait for the last samples."""
+        if self.proc.stdin and not self.proc.stdin.is_closing():
+            self.proc.stdin.close()
+        await self._reader
+        await self.proc.wait()
+
+    def close(self) -> None:
+        if self.proc and self.proc.returncode is None:
+            self.proc.kill()
+
+    @property
+    def sample_count(self) -> int:
+        return len(self.pcm) // 2
+
+    def samples(self, last_seconds: Optional[float] = None) -> np.ndarray:
+        """float32 samples in [-1, 1], optionally only the trailing window."""
+        usable = len(self.pcm) - (len(self.pcm) % 2)
+        start = 0
+        if last_seconds is not None:
+            start = max(0, usable - int(last_seconds * SAMPLE_RATE) * 2)
+        pcm = np.frombuffer(bytes(self.pcm[start:usable]), dtype=np.int16)
+        return pcm.astype(np.float32) / 32768.0
+
+
+class AudioStream:
+    """
+    One streaming utterance. Decodes chunks as they arrive and re-transcribes a
+    rolling window every STREAM_PARTIAL_INTERVAL seconds of new audio, so by the
+    time the speaker stops the last partial is usually already the final text.
+    """
+
+    def __init__(
+        self,
+        transcribe: Callable[[np.ndarray], Awaitable[str]],
+        send: Callable[[dict], Awaitable[None]],
+        window_seconds: float = STREAM_WINDOW_SECONDS,
+        partial_interval: float = STREAM_PARTIAL_INTERVAL,
+    ):
+        self.transcribe = transcribe
+        self.send = send
+        self.window_seconds = window_seconds
+        self.partial_interval = partial_interval
+        self.decoder = StreamingDecoder()
+        self.last_text = ""
+        self.last_partial_samples = 0
+        self._partial: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        await self.decoder.start()
+
+    async def add_chunk(self, data: bytes) -> None:
+        await self.decoder.feed(data)
+        new_samples = self.decoder.sample_count - self.last_partial_samples
+        busy = self._partial is not None and not self._partial.done()
+        if not busy and new_samples >= self.partial_interval * SAMPLE_RATE:
+            self._partial = asyncio.create_task(self._emit_partial())
+
+    async def _emit_partial(self) -> None:
+        count = self.decoder.sample_count
+        try:
+            text = await self.transcribe(self.decoder.samples(self.window_seconds))
+        except Exception as e:
+            logger.warning(f"Partial transcription failed: {e}")
+            return
+        self.last_text, self.last_partial_samples = text, count
+        await self.send({"type": "partial", "text": text, "seconds": round(count / SAMPLE_RATE, 2)})
+
+    async def finish(self) -> str:
+        await self.decoder.finish()
+        if self._partial is not None:
+            await self._partial
+        # Nothing new since the last partial and it covered the whole utterance:
+        # it already is the final text. Otherwise do one pass over everything.
+        covered = self.last_partial_samples / SAMPLE_RATE <= self.window_seconds
+        if self.decoder.sample_count and (self.decoder.sample_count > self.last_partial_samples or not covered):
+            self.last_text = await self.transcribe(self.decoder.samples())
+            self.last_partial_samples = self.decoder.sample_count
+        return self.last_text
+
+    def close(self) -> None:
+        if self._partial is not None:
+            self._partial.cancel()
+        self.decoder.close()
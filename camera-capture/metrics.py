@@ -0,0 +1,153 @@
+# metrics.py
+import os
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+router = APIRouter()
+
+# Add a Server-Timing header (per-stage durations) to every HTTP response
+METRICS_SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "true").lower() in ("1", "true", "yes")
+
+# Seconds; covers everything from a JSON parse to a slow vision call
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histogram:
+    """Prometheus-style histogram. Safe to observe from worker threads."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> per-bucket counts (last slot is +Inf), then the sum in a separate dict
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, *labels: str) -> None:
+        slot = bisect_left(self.buckets, seconds)
+        with self._lock:
+            counts = self._counts.get(labels)
+            if counts is None:
+                counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+                self._sums[labels] = 0.0
+            counts[slot] += 1
+            self._sums[labels] += seconds
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(labels, list(counts), self._sums[labels]) for labels, counts in sorted(self._counts.items())]
+        for labels, counts, total in series:
+            pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, labels)]
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + ["+Inf"], counts):
+                cumulative += count
+                le = "+Inf" if bound == "+Inf" else repr(float(bound))
+                bucket_labels = ",".join(pairs + [f'le="{le}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            label_text = "{" + ",".join(pairs) + "}" if pairs else ""
+            lines.append(f"{self.name}_sum{label_text} {total}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "circuit_tutor_stage_seconds",
+    "Time spent in one processing stage (image read, LLM request, JSON extraction, ...).",
+    ("stage", "route"),
+)
+REQUEST_SECONDS = Histogram(
+    "circuit_tutor_http_request_seconds",
+    "HTTP request handling time until the response is complete.",
+    ("method", "endpoint"),
+)
+REGISTRY = [STAGE_SECONDS, REQUEST_SECONDS]
+
+# Stage timings of the request being handled, for its Server-Timing header
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+def record(name: str, seconds: float, route: str = "") -> None:
+    """Record a stage measured elsewhere (e.g. returned by a worker process)."""
+    STAGE_SECONDS.observe(seconds, name, route)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+@contextmanager
+def stage(name: str, route: str = "") -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start, route)
+
+
+def server_timing_header(timings: List[Tuple[str, float]], total: float) -> str:
+    # Repeated stages (e.g. retried LLM calls) are summed
+    merged: Dict[str, float] = {}
+    for name, seconds in timings:
+        merged[name] = merged.get(name, 0.0) + seconds
+    merged["total"] = total
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in merged.items())
+
+
+class ServerTimingMiddleware:
+    """
+    Times every HTTP request into REQUEST_SECONDS and, when enabled, reports the
+    stages that ran during it as a Server-Timing header. Plain ASGI middleware so
+    streaming responses pass through untouched.
+    """
+
+    def __init__(self, app, header: bool = METRICS_SERVER_TIMING):
+        self.app = app
+        self.header = header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: List[Tuple[str, float]] = []
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if self.header and message["type"] == "http.response.start":
+                value = server_timing_header(timings, time.perf_counter() - start)
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", value.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+            endpoint = getattr(scope.get("endpoint"), "__name__", "unmatched")
+            REQUEST_SECONDS.observe(time.perf_counter() - start, scope["method"], endpoint)
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -1,13 +1,18 @@
 import os
 import json
-import base64
+import asyncio
 import logging
 from pathlib import Path
 from typing import Any, Dict, Optional
 import httpx
 from fastapi import FastAPI, HTTPException, Query, APIRouter
+from fastapi import Path as PathParam
 from dotenv import load_dotenv
 
+from metrics import stage
+from netlist_cache import NetlistCache
+from image_preprocess import image_to_data_url
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -19,11 +24,19 @@ BASE_DIR = Path(__file__).parent.parent
 
 SCHEMATIC_DIR = BASE_DIR / "files" / "schematic-diagrams"
 OUTPUT_DIR = BASE_DIR / "files" / "schematic-output"
+# Per-bench schematics live in <dir>/<session_id>/; the default session uses the top-level folders
+DEFAULT_SESSION = "default"
+SESSION_ID_PATTERN = r"^[A-Za-z0-9_-]{1,64}$"
 
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
 OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "openai/gpt-5.2-chat")
 OPENROUTER_SITE_URL = os.getenv("OPENROUTER_SITE_URL", "http://localhost:8000")
 OPENROUTER_APP_NAME = os.getenv("OPENROUTER_APP_NAME", "circuit-tutor-schematic-preprocess")
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1").rstrip("/")
+
+SCHEMATIC_CACHE_PATH = Path(os.getenv("SCHEMATIC_CACHE_PATH", str(OUTPUT_DIR / "cache.sqlite3")))
+SCHEMATIC_CACHE_MAX_ENTRIES = int(os.getenv("SCHEMATIC_CACHE_MAX_ENTRIES", "500"))
+SCHEMATIC_CACHE_MAX_BYTES = int(os.getenv("SCHEMATIC_CACHE_MAX_BYTES", str(20 * 1024 * 1024)))
 
 PROMPT = """You are a schematic-to-netlist transcriber.
 Convert the provided circuit schematic IMAGE into a JSON netlist.
@@ -69,12 +82,10 @@ def guess_mime(path: Path) -> str:
     raise HTTPException(status_code=400, detail="Unsupported image type. Use png/jpg/webp.")
 
 
-def file_to_data_url(image_path: Path) -> str:
+def read_image_bytes(image_path: Path) -> bytes:
     if not image_path.exists():
         raise HTTPException(status_code=500, detail=f"Missing schematic file: {image_path}")
-    mime = guess_mime(image_path)
-    b64 = base64.b64encode(image_path.read_bytes()).decode("utf-8")
-    return f"data:{mime};base64,{b64}"
+    return image_path.read_bytes()
 
 
 def extract_first_json_object(text: str) -> str:
@@ -124,7 +135,8 @@ async def call_openrouter_vision(data_url: str) -> Dict[str, Any]:
     }
     
     async with httpx.AsyncClient(timeout=120) as client:
-        r = await client.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=body)
+        with stage("llm_request", "process-schematic"):
+            r = await client.post(f"{OPENROUTER_BASE_URL}/chat/completions", headers=headers, json=body)
         if r.status_code >= 400:
             error_text = r.text
             try:
@@ -140,46 +152,104 @@ async def call_openrouter_vision(data_url: str) -> Dict[str, Any]:
         if not isinstance(content, str):
             content = json.dumps(content)
         
-        json_text = extract_first_json_object(content)
-        print(json_text)
-        
-        try:
-            obj = json.loads(json_text)
-        except Exception:
-            raise HTTPException(status_code=502, detail=f"Model did not return valid JSON. First 300 chars:\n{content[:300]}")
-        
-        return validate_netlist(obj)
+        with stage("json_extract", "process-schematic"):
+            json_text = extract_first_json_object(content)
+            print(json_text)
+
+            try:
+                obj = json.loads(json_text)
+            except Exception:
+                raise HTTPException(status_code=502, detail=f"Model did not return valid JSON. First 300 chars:\n{content[:300]}")
+
+        with stage("validate", "process-schematic"):
+            return validate_netlist(obj)
 
 
-def find_schematic_file() -> Path:
-    """Find the schematic file in SCHEMATIC_DIR (looks for schematic.png, schematic.jpg, etc.)"""
-    for ext in [".png", ".jpg", ".jpeg", ".webp"]:
-        p = SCHEMATIC_DIR / f"schematic{ext}"
-        if p.exists():
-            return p
-    raise HTTPException(status_code=404, detail=f"Missing schematic file in {SCHEMATIC_DIR}. Expected schematic.png, schematic.jpg, etc.")
+def find_schematic_file(session_id: str = DEFAULT_SESSION) -> Path:
+    """
+    Find the schematic file (schematic.png, schematic.jpg, etc.). A session's own
+    folder is checked first, then the shared SCHEMATIC_DIR.
+    """
+    dirs = [SCHEMATIC_DIR] if session_id == DEFAULT_SESSION else [SCHEMATIC_DIR / session_id, SCHEMATIC_DIR]
+    for directory in dirs:
+        for ext in [".png", ".jpg", ".jpeg", ".webp"]:
+            p = directory / f"schematic{ext}"
+            if p.exists():
+                return p
+    raise HTTPException(status_code=404, detail=f"Missing schematic file in {dirs[0]}. Expected schematic.png, schematic.jpg, etc.")
+
+
+def output_path(session_id: str = DEFAULT_SESSION) -> Path:
+    if session_id == DEFAULT_SESSION:
+        return OUTPUT_DIR / "schematic.json"
+    return OUTPUT_DIR / session_id / "schematic.json"
+
+
+netlist_cache = NetlistCache(
+    SCHEMATIC_CACHE_PATH,
+    max_entries=SCHEMATIC_CACHE_MAX_ENTRIES,
+    max_bytes=SCHEMATIC_CACHE_MAX_BYTES,
+)
+
+
+async def process_session_schematic_file(session_id: str, save: bool, refresh: bool) -> Dict[str, Any]:
+    image_path = find_schematic_file(session_id)
+    guess_mime(image_path)
+    with stage("image_read", "process-schematic"):
+        image_bytes = read_image_bytes(image_path)
+
+    # SQLite is blocking I/O, so it runs off the event loop.
+    cache_key = NetlistCache.make_key(image_bytes, OPENROUTER_MODEL, PROMPT)
+    netlist = None if refresh else await asyncio.to_thread(netlist_cache.get, cache_key)
+    cached = netlist is not None
+    image_stats = None
+    if cached:
+        logger.info(f"Schematic cache hit for {image_path.name}")
+    else:
+        # Pillow decode/resize/re-encode is CPU work; keep it off the event loop
+        data_url, image_stats = await asyncio.to_thread(image_to_data_url, image_bytes)
+        netlist = await call_openrouter_vision(data_url)
+        await asyncio.to_thread(netlist_cache.put, cache_key, netlist)
+    
+    if save:
+        out_path = output_path(session_id)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        with stage("disk_write", "process-schematic"):
+            out_path.write_text(json.dumps(netlist, indent=2), encoding="utf-8")
+    
+    return {"image": image_path.name, "netlist": netlist, "cached": cached, "image_stats": image_stats}
 
 
 @router.get("/process-schematic")
 async def process_schematic(
     save: bool = Query(True, description="If true, save result to schematic-output/schematic.json"),
+    refresh: bool = Query(False, description="If true, ignore the cache and re-transcribe the image"),
 ):
     """
     Process the schematic diagram from files/schematic-diagrams/schematic.{png|jpg|webp}
     and convert it to a JSON netlist using OpenRouter vision API.
+    Repeat uploads of the same image are answered from the on-disk netlist cache.
     """
-    image_path = find_schematic_file()
-    data_url = file_to_data_url(image_path)
-    netlist = await call_openrouter_vision(data_url)
-    
-    if save:
-        OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-        out_path = OUTPUT_DIR / "schematic.json"
-        out_path.write_text(json.dumps(netlist, indent=2), encoding="utf-8")
-    
-    return {"image": image_path.name, "netlist": netlist}
+    return await process_session_schematic_file(DEFAULT_SESSION, save, refresh)
 
 
-@router.get("/health")
+@router.get("/sessions/{session_id}/process-schematic")
+async def process_session_schematic(
+    session_id: str = PathParam(..., pattern=SESSION_ID_PATTERN),
+    save: bool = Query(True, description="If true, save result to schematic-output/<session_id>/schematic.json"),
+    refresh: bool = Query(False, description="If true, ignore the cache and re-transcribe the image"),
+):
+    """/process-schematic for one bench, reading schematic-diagrams/<session_id>/ when it exists."""
+    return await process_session_schematic_file(session_id, save, refresh)
+
+
+# Not /health: routers are included before server.py's own routes, so that path
+# would shadow the app-level health check (Whisper readiness)
+@router.get("/process-schematic/health")
 def health():
-    return {"ok": True, "model": OPENROUTER_MODEL, "schematic_dir": str(SCHEMATIC_DIR)}
+    return {
+        "ok": True,
+        "model": OPENROUTER_MODEL,
+        "schematic_dir": str(SCHEMATIC_DIR),
+        "schematic_cache": netlist_cache.stats(),
+    }
@@ -20,6 +20,21 @@ fs.mkdirSync(uploadsDir, { recursive: true });
 const uploadsLatestDir = path.join(__dirname, "uploads");
 fs.mkdirSync(uploadsLatestDir, { recursive: true });
 
+// Each bench can pass ?session=<id>; its snapshots go to uploads/<id>/latest.jpg
+const DEFAULT_SESSION = "default";
+const SESSION_ID_PATTERN = /^[A-Za-z0-9_-]{1,64}$/;
+
+function sessionFromRequest(req) {
+  return String(req.query.session || DEFAULT_SESSION).trim();
+}
+
+function validateSession(req, res, next) {
+  if (!SESSION_ID_PATTERN.test(sessionFromRequest(req))) {
+    return res.status(400).json({ error: "Invalid session id" });
+  }
+  next();
+}
+
 // CORS - MUST BE FIRST
 app.use(
   cors({
@@ -58,7 +73,7 @@ app.use((req, res, next) => {
  * This prevents the browser from showing an old cached copy.
  */
 app.use((req, res, next) => {
-  if (req.path === "/uploads/latest.jpg" || req.path === "/latest.jpg") {
+  if (/^\/uploads\/([A-Za-z0-9_-]+\/)?latest\.jpg$/.test(req.path) || req.path === "/latest.jpg") {
     res.setHeader("Cache-Control", "no-store, no-cache, must-revalidate, proxy-revalidate");
     res.setHeader("Pragma", "no-cache");
     res.setHeader("Expires", "0");
@@ -87,34 +102,22 @@ async function triggerAnswerUpdate(reason) {
   }
 }
 
-async function triggerImagePipeline() {
+async function triggerImagePipeline(session = DEFAULT_SESSION) {
+  // The backend runs observe -> analyze -> answer in the background and cancels
+  // the previous frame's run if it is still going, so this returns right away.
+  const frameRoute = session === DEFAULT_SESSION ? "/pipeline/frame" : `/sessions/${session}/frame`;
   try {
-    console.log(
-      `[image-pipeline] Calling ${BACKEND_URL}/process-observed then ${BACKEND_URL}/answer`
-    );
-
-    const r1 = await fetch(`${BACKEND_URL}/process-observed`);
-    if (!r1.ok) {
-      const t = await r1.text();
-      console.error(
-        `[image-pipeline] /process-observed failed (${r1.status}): ${t.slice(
-          0,
-          300
-        )}`
-      );
-      return;
-    }
+    console.log(`[image-pipeline] Posting new frame to ${BACKEND_URL}${frameRoute}`);
 
-    const r2 = await fetch(`${BACKEND_URL}/answer`);
-    if (!r2.ok) {
-      const t = await r2.text();
+    const r = await fetch(`${BACKEND_URL}${frameRoute}`, { method: "POST" });
+    if (!r.ok) {
+      const t = await r.text();
       console.error(
-        `[image-pipeline] /answer failed (${r2.status}): ${t.slice(0, 300)}`
+        `[image-pipeline] ${frameRoute} failed (${r.status}): ${t.slice(0, 300)}`
       );
     } else {
-      console.log(
-        "[image-pipeline] Successfully updated answer-output/latest.json"
-      );
+      const run = await r.json();
+      console.log(`[image-pipeline] Queued run ${run.run_id} for session ${session}`);
     }
   } catch (err) {
     console.error("[image-pipeline] Error running image pipeline:", err);
@@ -172,7 +175,13 @@ app.get("/token", async (req, res) => {
 // ---- UPLOAD (existing - DO NOT BREAK) ----
 // Keep your current behavior here exactly.
 const storage = multer.diskStorage({
-  destination: (_, __, cb) => cb(null, uploadsDir),
+  destination: (req, __, cb) => {
+    // ?session=<id> keeps a bench-specific schematic in schematic-diagrams/<id>/
+    const session = sessionFromRequest(req);
+    const dir = session === DEFAULT_SESSION ? uploadsDir : path.join(uploadsDir, session);
+    fs.mkdirSync(dir, { recursive: true });
+    cb(null, dir);
+  },
   filename: (req, file, cb) => {
     // Your existing naming logic
     const ext = path.extname(file.originalname) || ".jpg";
@@ -181,7 +190,7 @@ const storage = multer.diskStorage({
 });
 const upload = multer({ storage });
 
-app.post("/upload", upload.single("photo"), (req, res) => {
+app.post("/upload", validateSession, upload.single("photo"), (req, res) => {
   console.log("Upload request received:", {
     method: req.method,
     headers: req.headers["content-type"],
@@ -196,10 +205,10 @@ app.post("/upload", upload.single("photo"), (req, res) => {
 
   // Your cleanup (unchanged)
   try {
-    const files = fs.readdirSync(uploadsDir);
+    const files = fs.readdirSync(req.file.destination);
     files.forEach((file) => {
-      if (file !== req.file.filename) {
-        const filePath = path.join(uploadsDir, file);
+      const filePath = path.join(req.file.destination, file);
+      if (file !== req.file.filename && fs.statSync(filePath).isFile()) {
         fs.unlinkSync(filePath);
         console.log(`Deleted old file: ${file}`);
       }
@@ -267,23 +276,30 @@ app.get("/check-new-audio", (req, res) => {
 // ---- UPLOAD LATEST (new, safe) ----
 // Only used by the camera snapshots; overwrites latest.jpg only.
 const storageLatest = multer.diskStorage({
-  destination: (_, __, cb) => cb(null, uploadsLatestDir),
+  destination: (req, __, cb) => {
+    const session = sessionFromRequest(req);
+    const dir = session === DEFAULT_SESSION ? uploadsLatestDir : path.join(uploadsLatestDir, session);
+    fs.mkdirSync(dir, { recursive: true });
+    cb(null, dir);
+  },
   filename: (_, __, cb) => cb(null, "latest.jpg"),
 });
 const uploadLatest = multer({ storage: storageLatest });
 
-app.post("/upload-latest", uploadLatest.single("photo"), (req, res) => {
+app.post("/upload-latest", validateSession, uploadLatest.single("photo"), (req, res) => {
   if (!req.file) return res.status(400).json({ error: "No file uploaded" });
+  const session = sessionFromRequest(req);
 
-  // Fire-and-forget: process latest.jpg into observed JSON, then refresh answer-output/latest.json
-  triggerImagePipeline().catch((err) =>
+  // Fire-and-forget: the backend turns latest.jpg into observed JSON, analysis and a fresh answer
+  triggerImagePipeline(session).catch((err) =>
     console.error("[upload-latest] Failed to trigger image pipeline:", err)
   );
 
   res.json({
     ok: true,
+    session,
     savedAs: req.file.filename,
-    url: "/uploads/latest.jpg",
+    url: session === DEFAULT_SESSION ? "/uploads/latest.jpg" : `/uploads/${session}/latest.jpg`,
   });
 });
 
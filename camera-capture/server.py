@@ -1,4 +1,5 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi import Path as PathParam
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, FileResponse
 import uvicorn
@@ -6,11 +7,15 @@ import os
 from pathlib import Path
 from datetime import datetime
 import logging
-import whisper
 import glob
+import re
+import shutil
 
 # Import schematic processing router
 from process_schematic import router as process_schematic_router
+from metrics import ServerTimingMiddleware, stage, router as metrics_router
+from transcription_jobs import QueueFullError, TranscriptionPool
+from audio_stream import AudioStream
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -25,10 +30,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+app.add_middleware(ServerTimingMiddleware)
 
 # Include schematic processing router
 app.include_router(process_schematic_router)
+app.include_router(metrics_router)  # Prometheus /metrics
 
 # Base directory - go up from camera-capture to nexhacks root
 BASE_DIR = Path(__file__).parent.parent
@@ -42,25 +50,59 @@ os.makedirs(TRANSCRIPT_DIR, exist_ok=True)
 logger.info(f"Audio upload directory: {UPLOAD_DIR}")
 logger.info(f"Transcript directory: {TRANSCRIPT_DIR}")
 
-# Load Whisper model (base model for balance between speed and accuracy)
-# This will download the model on first run
-try:
-    model = whisper.load_model("base")
-    logger.info("Whisper model loaded successfully")
-except Exception as e:
-    logger.error(f"Error loading Whisper model: {e}")
-    model = None
+# Each bench (session) gets its own audio/transcript folders under the ones above;
+# the default session keeps using the top-level folders.
+DEFAULT_SESSION = "default"
+SESSION_ID_PATTERN = r"^[A-Za-z0-9_-]{1,64}$"
+
+
+def is_valid_session_id(session_id: str) -> bool:
+    return re.match(SESSION_ID_PATTERN, session_id) is not None
+
+
+def session_dirs(session_id: str) -> tuple:
+    if session_id == DEFAULT_SESSION:
+        return UPLOAD_DIR, TRANSCRIPT_DIR
+    return UPLOAD_DIR / session_id, TRANSCRIPT_DIR / session_id
+
+# Transcription runs in a bounded worker pool so it never blocks the event loop.
+# The speech-to-text model (STT_BACKEND openai-whisper or faster-whisper, WHISPER_MODEL
+# default "base"; downloaded on first run) loads in the background after startup, so
+# the server answers right away; see /health.
+# WHISPER_PRELOAD=false defers loading until the first transcription request.
+WHISPER_PRELOAD = os.getenv("WHISPER_PRELOAD", "true").lower() in ("1", "true", "yes")
+transcription_pool = TranscriptionPool()
+
+
+@app.on_event("startup")
+async def load_whisper_model():
+    if WHISPER_PRELOAD:
+        transcription_pool.start_loading()
+
+
+@app.on_event("shutdown")
+def shutdown_transcription_pool():
+    transcription_pool.shutdown()
 
 
 @app.get("/")
 async def root():
-    return {"message": "Circuit Tutor API is running", "routes": ["/upload-audio", "/transcript", "/process-schematic", "/docs"]}
+    return {
+        "message": "Circuit Tutor API is running",
+        "routes": [
+            "/upload-audio", "/ws/upload-audio", "/transcribe-jobs", "/transcript", "/process-schematic",
+            "/sessions/{session_id}/upload-audio", "/sessions/{session_id}/ws/upload-audio",
+            "/sessions/{session_id}/transcribe-jobs", "/sessions/{session_id}/transcript", "/docs",
+        ],
+    }
 
 
-def cleanup_old_files(directory: str, pattern: str):
-    """Delete all files matching pattern in directory. Only one file should exist at a time."""
+def cleanup_old_files(directory: str, pattern: str, keep: tuple = ()):
+    """Delete all files matching pattern in directory (except keep). Only one file should exist at a time."""
     files = glob.glob(os.path.join(directory, pattern))
     for file in files:
+        if os.path.abspath(file) in keep or not os.path.isfile(file):
+            continue
         try:
             os.remove(file)
             logger.info(f"Deleted old file: {file}")
@@ -68,120 +110,269 @@ def cleanup_old_files(directory: str, pattern: str):
             logger.warning(f"Could not delete file {file}: {e}")
 
 
+def check_ffmpeg():
+    # Whisper shells out to ffmpeg to decode the uploaded audio
+    ffmpeg_path = shutil.which("ffmpeg")
+    if not ffmpeg_path:
+        logger.warning("ffmpeg not found in PATH. Whisper requires ffmpeg to process audio files.")
+        logger.warning("Please install ffmpeg: https://ffmpeg.org/download.html")
+        raise RuntimeError("ffmpeg is required but not found in system PATH. Please install ffmpeg.")
+
+
+async def save_audio_upload(audio: UploadFile, session_id: str = DEFAULT_SESSION) -> dict:
+    """
+    Validate and save an uploaded audio file. Only keeps one audio/transcript file
+    at a time per session; other benches' files are never touched.
+    """
+    if not audio.content_type or not audio.content_type.startswith("audio/"):
+        raise HTTPException(status_code=400, detail="Invalid file type. Expected audio file.")
+
+    upload_dir, transcript_dir = session_dirs(session_id)
+    os.makedirs(str(upload_dir), exist_ok=True)
+    os.makedirs(str(transcript_dir), exist_ok=True)
+
+    # Clean up old files, but not the ones a queued or running job still needs
+    busy = tuple(
+        os.path.abspath(job.audio_path) for job in transcription_pool.jobs.values() if job.finished is None
+    )
+    cleanup_old_files(str(upload_dir), "audio_*", keep=busy)
+    cleanup_old_files(str(transcript_dir), "transcript_*.txt")
+
+    # Generate unique filename with timestamp
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    file_extension = audio.filename.split(".")[-1] if "." in audio.filename else "webm"
+    filename = f"audio_{timestamp}.{file_extension}"
+    filepath = os.path.abspath(str(upload_dir / filename))
+
+    content = await audio.read()
+    with stage("disk_write", "upload-audio"), open(filepath, "wb") as f:
+        f.write(content)
+        f.flush()  # Ensure data is written to disk
+        os.fsync(f.fileno())  # Force write to disk
+
+    logger.info(f"Received audio file: {filename} (session {session_id}), size: {len(content)} bytes")
+    return {
+        "session_id": session_id,
+        "filename": filename,
+        "filepath": filepath,
+        "timestamp": timestamp,
+        "size": len(content),
+    }
+
+
+def write_transcript_file(text: str, timestamp: str, transcript_dir: Path = TRANSCRIPT_DIR) -> str:
+    transcript_filename = f"transcript_{timestamp}.txt"
+    with stage("disk_write", "transcript"), open(str(transcript_dir / transcript_filename), "w", encoding="utf-8") as f:
+        f.write(text)
+    logger.info(f"Transcript saved: {transcript_filename}")
+    logger.info(f"Transcript: {text[:100]}...")  # Log first 100 chars
+    return transcript_filename
+
+
+def save_transcript(job, timestamp: str, session_id: str = DEFAULT_SESSION):
+    _, transcript_dir = session_dirs(session_id)
+    job.result["transcript_filename"] = write_transcript_file(job.transcript, timestamp, transcript_dir)
+
+
+def submit_transcription(saved: dict):
+    check_ffmpeg()
+    try:
+        return transcription_pool.submit(
+            saved["filepath"],
+            language="en",
+            on_done=lambda job: save_transcript(job, saved["timestamp"], saved["session_id"]),
+        )
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
 @app.post("/upload-audio")
 async def upload_audio(audio: UploadFile = File(...)):
     """
     Receive audio file from frontend when user stops speaking for 2 seconds.
-    Transcribes the audio and saves it as a text file.
+    Transcribes the audio in the worker pool and saves it as a text file.
     Only keeps one audio file and one transcript file at a time.
     """
+    return await upload_session_audio(DEFAULT_SESSION, audio)
+
+
+@app.post("/sessions/{session_id}/upload-audio")
+async def upload_session_audio(
+    session_id: str = PathParam(..., pattern=SESSION_ID_PATTERN),
+    audio: UploadFile = File(...),
+):
+    """/upload-audio for one bench; files go to that session's folders."""
     try:
         logger.info("=" * 50)
-        logger.info("UPLOAD-AUDIO ENDPOINT CALLED")
+        logger.info(f"UPLOAD-AUDIO ENDPOINT CALLED (session {session_id})")
         logger.info(f"Audio filename: {audio.filename}")
         logger.info(f"Content type: {audio.content_type}")
-        
-        # Validate file type
-        if not audio.content_type or not audio.content_type.startswith("audio/"):
-            raise HTTPException(status_code=400, detail="Invalid file type. Expected audio file.")
-        
-        # Clean up old audio files (keep only one at a time)
-        cleanup_old_files(str(UPLOAD_DIR), "audio_*")
-        cleanup_old_files(str(TRANSCRIPT_DIR), "transcript_*.txt")
-        
-        # Generate unique filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        file_extension = audio.filename.split(".")[-1] if "." in audio.filename else "webm"
-        filename = f"audio_{timestamp}.{file_extension}"
-        # Convert Path object to string for os.path.join
-        filepath = str(UPLOAD_DIR / filename)
-        
-        # Ensure directory exists
-        os.makedirs(str(UPLOAD_DIR), exist_ok=True)
-        
-        # Save the audio file
-        content = await audio.read()
-        with open(filepath, "wb") as f:
-            f.write(content)
-            f.flush()  # Ensure data is written to disk
-            os.fsync(f.fileno())  # Force write to disk
-        
-        file_size = len(content)
-        logger.info(f"Received audio file: {filename}, size: {file_size} bytes")
-        logger.info(f"Saved to: {filepath}")
-        
-        # Convert to absolute path for Whisper (must be string, not Path object)
-        absolute_filepath = os.path.abspath(str(filepath))
-        logger.info(f"Absolute filepath: {absolute_filepath}")
-        logger.info(f"File exists after save: {os.path.exists(absolute_filepath)}")
-        
+
+        saved = await save_audio_upload(audio, session_id)
+
         # Transcribe audio to text
         transcript_text = ""
         transcript_filename = None
-        
-        if model is None:
-            logger.warning("Whisper model not loaded, skipping transcription")
+
+        if transcription_pool.failed:
+            logger.warning("Whisper model failed to load, skipping transcription")
         else:
             try:
-                if not os.path.exists(absolute_filepath):
-                    raise FileNotFoundError(f"Audio file not found: {absolute_filepath}")
-                
-                logger.info("Starting transcription...")
-                logger.info(f"Attempting to transcribe: {absolute_filepath}")
-                logger.info(f"File size: {os.path.getsize(absolute_filepath)} bytes")
-                
-                # Check if ffmpeg is available (Whisper requires it)
-                import shutil
-                ffmpeg_path = shutil.which("ffmpeg")
-                if not ffmpeg_path:
-                    logger.warning("ffmpeg not found in PATH. Whisper requires ffmpeg to process audio files.")
-                    logger.warning("Please install ffmpeg: https://ffmpeg.org/download.html")
-                    raise RuntimeError("ffmpeg is required but not found in system PATH. Please install ffmpeg.")
-                else:
-                    logger.info(f"ffmpeg found at: {ffmpeg_path}")
-                
-                result = model.transcribe(absolute_filepath, language="en")
-                transcript_text = result["text"].strip()
-                
-                # Save transcript to text file
-                transcript_filename = f"transcript_{timestamp}.txt"
-                transcript_filepath = str(TRANSCRIPT_DIR / transcript_filename)
-                
-                with open(transcript_filepath, "w", encoding="utf-8") as f:
-                    f.write(transcript_text)
-                
-                logger.info(f"Transcript saved: {transcript_filename}")
-                logger.info(f"Transcript: {transcript_text[:100]}...")  # Log first 100 chars
-                
+                job = submit_transcription(saved)
+                await transcription_pool.wait(job)
+                if job.status != "done":
+                    raise RuntimeError(job.error)
+                transcript_text = job.transcript
+                transcript_filename = job.result.get("transcript_filename")
+            except HTTPException:
+                raise
             except Exception as e:
                 logger.error(f"Error during transcription: {str(e)}")
                 transcript_text = f"Error during transcription: {str(e)}"
-        
+
         return JSONResponse(
             status_code=200,
             content={
                 "message": "Audio received and transcribed successfully",
-                "filename": filename,
-                "size": file_size,
-                "timestamp": timestamp,
+                "session_id": session_id,
+                "filename": saved["filename"],
+                "size": saved["size"],
+                "timestamp": saved["timestamp"],
                 "transcript": transcript_text,
                 "transcript_filename": transcript_filename
             }
         )
-    
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing audio: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing audio: {str(e)}")
 
 
+@app.post("/transcribe-jobs", status_code=202)
+async def submit_transcribe_job(audio: UploadFile = File(...)):
+    """
+    Queue an audio file for transcription and return a job id right away.
+    Poll GET /transcribe-jobs/{job_id} for the result.
+    """
+    return await submit_session_transcribe_job(DEFAULT_SESSION, audio)
+
+
+@app.post("/sessions/{session_id}/transcribe-jobs", status_code=202)
+async def submit_session_transcribe_job(
+    session_id: str = PathParam(..., pattern=SESSION_ID_PATTERN),
+    audio: UploadFile = File(...),
+):
+    if transcription_pool.failed:
+        raise HTTPException(status_code=503, detail=f"Whisper model failed to load: {transcription_pool.load_error}")
+    try:
+        saved = await save_audio_upload(audio, session_id)
+        job = submit_transcription(saved)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error queueing audio: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error queueing audio: {str(e)}")
+    return {**job.to_dict(), "session_id": session_id, "filename": saved["filename"], "size": saved["size"]}
+
+
+@app.get("/transcribe-jobs/{job_id}")
+async def get_transcribe_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, le=30, description="Seconds to long-poll for the job to finish"),
+):
+    job = transcription_pool.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    if wait:
+        await transcription_pool.wait(job, timeout=wait)
+    return job.to_dict()
+
+
+@app.websocket("/ws/upload-audio")
+async def upload_audio_stream(websocket: WebSocket):
+    await stream_session_audio(websocket, DEFAULT_SESSION)
+
+
+@app.websocket("/sessions/{session_id}/ws/upload-audio")
+async def upload_session_audio_stream(websocket: WebSocket, session_id: str):
+    if not is_valid_session_id(session_id):
+        await websocket.close(code=1008)
+        return
+    await stream_session_audio(websocket, session_id)
+
+
+async def stream_session_audio(websocket: WebSocket, session_id: str):
+    """
+    Streaming variant of /upload-audio.
+    Send binary audio chunks as MediaRecorder produces them, then the text
+    message {"type": "stop"} when the speaker stops. The server replies with
+    {"type": "partial", "text": ...} while audio arrives and one
+    {"type": "final", "text": ..., "transcript_filename": ...} at the end.
+    Audio is decoded in memory; nothing is written to disk but the transcript.
+    """
+    await websocket.accept()
+    if transcription_pool.failed:
+        await websocket.send_json({"type": "error", "detail": f"Whisper model failed to load: {transcription_pool.load_error}"})
+        await websocket.close()
+        return
+
+    stream = AudioStream(
+        transcribe=lambda samples: transcription_pool.transcribe(samples, language="en"),
+        send=websocket.send_json,
+    )
+    try:
+        check_ffmpeg()
+        await stream.start()
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes"):
+                await stream.add_chunk(message["bytes"])
+            elif message.get("text") and "stop" in message["text"]:
+                break
+
+        text = await stream.finish()
+        _, transcript_dir = session_dirs(session_id)
+        os.makedirs(str(transcript_dir), exist_ok=True)
+        cleanup_old_files(str(transcript_dir), "transcript_*.txt")
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        transcript_filename = write_transcript_file(text, timestamp, transcript_dir) if text else None
+        await websocket.send_json({"type": "final", "text": text, "transcript_filename": transcript_filename})
+        await websocket.close()
+    except WebSocketDisconnect:
+        logger.info(f"Audio stream client disconnected (session {session_id})")
+    except Exception as e:
+        logger.error(f"Error in audio stream: {str(e)}")
+        try:
+            await websocket.send_json({"type": "error", "detail": str(e)})
+            await websocket.close()
+        except Exception:
+            pass
+    finally:
+        stream.close()
+
+
+def latest_transcript_files(session_id: str) -> list:
+    _, transcript_dir = session_dirs(session_id)
+    return glob.glob(os.path.join(transcript_dir, "transcript_*.txt"))
+
+
 @app.get("/transcript")
 async def get_transcript():
     """
     Get the current transcript file.
     Returns the most recent transcript if available.
     """
+    return await get_session_transcript(DEFAULT_SESSION)
+
+
+@app.get("/sessions/{session_id}/transcript")
+async def get_session_transcript(session_id: str = PathParam(..., pattern=SESSION_ID_PATTERN)):
     try:
-        transcript_files = glob.glob(os.path.join(TRANSCRIPT_DIR, "transcript_*.txt"))
+        transcript_files = latest_transcript_files(session_id)
         if not transcript_files:
             return JSONResponse(
                 status_code=404,
@@ -211,8 +402,13 @@ async def download_transcript():
     """
     Download the current transcript file.
     """
+    return await download_session_transcript(DEFAULT_SESSION)
+
+
+@app.get("/sessions/{session_id}/transcript/download")
+async def download_session_transcript(session_id: str = PathParam(..., pattern=SESSION_ID_PATTERN)):
     try:
-        transcript_files = glob.glob(os.path.join(TRANSCRIPT_DIR, "transcript_*.txt"))
+        transcript_files = latest_transcript_files(session_id)
         if not transcript_files:
             raise HTTPException(status_code=404, detail="No transcript found")
         
@@ -233,9 +429,14 @@ async def download_transcript():
 
 @app.get("/health")
 async def health_check():
+    # "ready" is only true once the model has loaded and warmed up; status stays
+    # "healthy" while it loads since everything else already works
     return {
-        "status": "healthy",
-        "whisper_model_loaded": model is not None
+        "status": "healthy" if not transcription_pool.failed else "degraded",
+        "ready": transcription_pool.ready,
+        "whisper_model_loaded": transcription_pool.ready,
+        "whisper": transcription_pool.model_status(),
+        "transcription": transcription_pool.stats(),
     }
 
 
@@ -0,0 +1,247 @@
+# stt_backends.py
+import os
+import time
+import logging
+import subprocess
+from typing import Any, Dict, Optional, Tuple, Type, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000  # what Whisper expects
+
+# Which engine transcribes: "openai-whisper" (PyTorch) or "faster-whisper" (CTranslate2,
+# much faster on CPU with int8)
+STT_BACKEND = os.getenv("STT_BACKEND", "openai-whisper").lower()
+
+# Model size (tiny, base, small, ...) and device (auto, cpu, cuda), for either backend
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base")
+WHISPER_DEVICE = os.getenv("WHISPER_DEVICE", "auto").lower()
+# openai-whisper only: int8 dynamic quantization of the linear layers on CPU
+WHISPER_INT8 = os.getenv("WHISPER_INT8", "false").lower() in ("1", "true", "yes")
+# Run one inference on a second of silence after loading, so the first real request
+# doesn't pay for kernel selection and buffer allocation
+WHISPER_WARMUP = os.getenv("WHISPER_WARMUP", "true").lower() in ("1", "true", "yes")
+
+# faster-whisper only
+FASTER_WHISPER_COMPUTE_TYPE = os.getenv("FASTER_WHISPER_COMPUTE_TYPE", "int8")
+STT_BEAM_SIZE = int(os.getenv("STT_BEAM_SIZE", "1"))
+STT_CPU_THREADS = int(os.getenv("STT_CPU_THREADS", "0"))  # 0 = CTranslate2 default
+
+# Silence handling before inference:
+#   energy - trim leading/trailing silence by frame loudness (cheap, any backend)
+#   silero - faster-whisper's built-in Silero VAD (also drops pauses in the middle);
+#            any other backend refuses to start with it
+#   off    - transcribe the clip as recorded
+STT_VAD = os.getenv("STT_VAD", "energy").lower()
+STT_VAD_THRESHOLD_DB = float(os.getenv("STT_VAD_THRESHOLD_DB", "-40"))
+STT_VAD_PAD = float(os.getenv("STT_VAD_PAD", "0.2"))  # seconds of context kept around speech
+
+VAD_FRAME_SECONDS = 0.03
+
+
+def decode_audio(path: str, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Any ffmpeg-readable file -> mono float32 samples in [-1, 1]."""
+    cmd = [
+        "ffmpeg", "-nostdin", "-threads", "0", "-loglevel", "error",
+        "-i", path,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sample_rate), "-",
+    ]
+    try:
+        out = subprocess.run(cmd, capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to decode audio: {e.stderr.decode(errors='replace').strip()}") from e
+    return np.frombuffer(out, np.int16).astype(np.float32) / 32768.0
+
+
+def trim_silence(
+    samples: np.ndarray,
+    threshold_db: float = STT_VAD_THRESHOLD_DB,
+    pad: float = STT_VAD_PAD,
+    sample_rate: int = SAMPLE_RATE,
+) -> np.ndarray:
+    """
+    Drop leading and trailing frames quieter than threshold_db (dBFS), keeping pad
+    seconds around the speech. Returns an empty array if nothing is above it.
+    """
+    frame = int(VAD_FRAME_SECONDS * sample_rate)
+    n_frames = len(samples) // frame
+    if n_frames == 0:
+        return samples
+    frames = samples[: n_frames * frame].reshape(n_frames, frame)
+    rms = np.sqrt(np.mean(frames * frames, axis=1) + 1e-12)
+    loud = np.flatnonzero(20 * np.log10(rms) > threshold_db)
+    if len(loud) == 0:
+        return samples[:0]
+    keep = int(pad * sample_rate)
+    start = max(0, loud[0] * frame - keep)
+    end = min(len(samples), (loud[-1] + 1) * frame + keep)
+    return samples[start:end]
+
+
+class SttBackend:
+    """
+    A speech-to-text engine behind TranscriptionPool. load() runs once on the worker
+    (thread or process) that will transcribe; instances are picklable until then.
+    """
+
+    name = ""
+    # STT_VAD values this engine can honour
+    vad_modes: Tuple[str, ...] = ("energy", "off")
+
+    def __init__(
+        self,
+        model_name: str = WHISPER_MODEL,
+        device: str = WHISPER_DEVICE,
+        warmup: bool = WHISPER_WARMUP,
+        vad: str = STT_VAD,
+    ):
+        self.model_name = model_name
+        self.device = device
+        self.warmup = warmup
+        if vad not in self.vad_modes:
+            raise ValueError(f"STT_VAD={vad!r} is not supported by {self.name}. Use one of: {', '.join(self.vad_modes)}")
+        self.vad = vad
+        self.model: Any = None
+
+    def _load(self) -> Any:
+        raise NotImplementedError
+
+    def _infer(self, samples: np.ndarray, language: str) -> str:
+        raise NotImplementedError
+
+    def load(self) -> Dict[str, float]:
+        """Load (and warm up) the model. Returns stage timings in seconds."""
+        timings = {}
+        start = time.perf_counter()
+        self.model = self._load()
+        timings["whisper_load"] = time.perf_counter() - start
+        if self.warmup:
+            start = time.perf_counter()
+            self._infer(np.zeros(SAMPLE_RATE, dtype=np.float32), "en")
+            timings["whisper_warmup"] = time.perf_counter() - start
+        return timings
+
+    def transcribe(self, audio: Union[str, np.ndarray], language: str = "en") -> Tuple[str, Dict[str, float]]:
+        """
+        audio is a file path or 16 kHz mono float32 samples. Returns the text and how
+        long decoding (ffmpeg), silence trimming and inference took.
+        """
+        timings = {}
+        if isinstance(audio, str):
+            start = time.perf_counter()
+            audio = decode_audio(audio)
+            timings["whisper_decode"] = time.perf_counter() - start
+        if self.vad == "energy":
+            start = time.perf_counter()
+            audio = trim_silence(audio)
+            timings["vad_trim"] = time.perf_counter() - start
+            if len(audio) == 0:
+                # Nothing but silence; Whisper tends to invent text for these
+                return "", timings
+        start = time.perf_counter()
+        text = self._infer(audio, language)
+        timings["whisper_inference"] = time.perf_counter() - start
+        return text, timings
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "model": self.model_name,
+            "device": self.device,
+            "vad": self.vad,
+            "warmup": self.warmup,
+        }
+
+
+class OpenAIWhisperBackend(SttBackend):
+    name = "openai-whisper"
+
+    def __init__(self, *args, int8: bool = WHISPER_INT8, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.int8 = int8
+
+    def _load(self) -> Any:
+        import whisper
+
+        model = whisper.load_model(self.model_name, device=None if self.device == "auto" else self.device)
+        if self.int8:
+            if str(getattr(model, "device", "cpu")) != "cpu":
+                logger.warning("WHISPER_INT8 only applies to CPU models, ignoring it")
+            else:
+                model = quantize_int8(model)
+        return model
+
+    def _infer(self, samples: np.ndarray, language: str) -> str:
+        return self.model.transcribe(samples, language=language)["text"].strip()
+
+    def describe(self) -> Dict[str, Any]:
+        return {**super().describe(), "int8": self.int8}
+
+
+def quantize_int8(model):
+    import torch
+
+    # whisper's Linear subclass only overrides forward() to cast weights for fp16;
+    # quantize_dynamic matches exact types, so present them as plain nn.Linear (CPU runs fp32).
+    for module in model.modules():
+        if isinstance(module, torch.nn.Linear) and type(module) is not torch.nn.Linear:
+            module.__class__ = torch.nn.Linear
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class FasterWhisperBackend(SttBackend):
+    """CTranslate2 port of the same Whisper weights; int8 on CPU by default."""
+
+    name = "faster-whisper"
+    vad_modes = ("energy", "silero", "off")
+
+    def __init__(
+        self,
+        *args,
+        compute_type: str = FASTER_WHISPER_COMPUTE_TYPE,
+        beam_size: int = STT_BEAM_SIZE,
+        cpu_threads: int = STT_CPU_THREADS,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.compute_type = compute_type
+        self.beam_size = beam_size
+        self.cpu_threads = cpu_threads
+
+    def _load(self) -> Any:
+        from faster_whisper import WhisperModel
+
+        return WhisperModel(
+            self.model_name,
+            device=self.device,
+            compute_type=self.compute_type,
+            cpu_threads=self.cpu_threads,
+        )
+
+    def _infer(self, samples: np.ndarray, language: str) -> str:
+        segments, _ = self.model.transcribe(
+            samples,
+            language=language,
+            beam_size=self.beam_size,
+            vad_filter=self.vad == "silero",
+        )
+        # segments is lazy; decoding happens while iterating
+        return " ".join(s.text.strip() for s in segments).strip()
+
+    def describe(self) -> Dict[str, Any]:
+        return {**super().describe(), "compute_type": self.compute_type, "beam_size": self.beam_size}
+
+
+BACKENDS: Dict[str, Type[SttBackend]] = {
+    OpenAIWhisperBackend.name: OpenAIWhisperBackend,
+    FasterWhisperBackend.name: FasterWhisperBackend,
+}
+
+
+def make_backend(name: Optional[str] = None, **options: Any) -> SttBackend:
+    name = (name or STT_BACKEND).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown STT_BACKEND {name!r}. Use one of: {', '.join(BACKENDS)}")
+    return BACKENDS[name](**options)
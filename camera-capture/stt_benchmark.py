@@ -0,0 +1,108 @@
+# stt_benchmark.py
+"""
+Compare speech-to-text backends on recorded utterances.
+
+    python stt_benchmark.py
+    python stt_benchmark.py --backends openai-whisper,faster-whisper --model small --repeat 3
+    python stt_benchmark.py --files "../files/verbal-input/**/audio_*.webm" --vad off --json
+
+Each file is decoded once (ffmpeg) and the same samples go to every backend, so the
+numbers compare inference (plus silence trimming) only. Backends whose package is not
+installed are reported as skipped.
+"""
+import glob
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from stt_backends import BACKENDS, SAMPLE_RATE, STT_VAD, WHISPER_DEVICE, WHISPER_MODEL, decode_audio, make_backend
+
+BASE_DIR = Path(__file__).parent.parent
+DEFAULT_FILES = str(BASE_DIR / "files" / "verbal-input" / "audio_*.webm")
+
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(p / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def bench_backend(name: str, clips: Dict[str, Any], args: argparse.Namespace) -> Dict[str, Any]:
+    try:
+        backend = make_backend(name, model_name=args.model, device=args.device, vad=args.vad, warmup=True)
+    except ValueError as e:
+        return {"backend": name, "skipped": str(e)}
+    try:
+        load = backend.load()
+    except ImportError as e:
+        return {"backend": name, "skipped": f"not installed ({e.name})"}
+
+    latencies: List[float] = []
+    audio_seconds = 0.0
+    transcripts = {}
+    for path, samples in clips.items():
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            text, _ = backend.transcribe(samples, args.language)
+            latencies.append(time.perf_counter() - start)
+            audio_seconds += len(samples) / SAMPLE_RATE
+        transcripts[Path(path).name] = text
+
+    latencies.sort()
+    total = sum(latencies)
+    ms = lambda v: round(v * 1000, 1) if v is not None else None
+    return {
+        "backend": name,
+        **backend.describe(),
+        "load_s": round(load.get("whisper_load", 0.0), 2),
+        "warmup_s": round(load.get("whisper_warmup", 0.0), 2),
+        "runs": len(latencies),
+        "mean_ms": ms(total / len(latencies)) if latencies else None,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        # Seconds of audio transcribed per second of compute
+        "speed_x_realtime": round(audio_seconds / total, 2) if total else None,
+        "transcripts": transcripts,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark speech-to-text backends on recorded audio.")
+    parser.add_argument("--files", default=DEFAULT_FILES, help="Glob of audio files (recursive ** allowed).")
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--model", default=WHISPER_MODEL)
+    parser.add_argument("--device", default=WHISPER_DEVICE)
+    parser.add_argument("--vad", default=STT_VAD, choices=("energy", "silero", "off"))
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--repeat", type=int, default=3, help="Transcriptions per file per backend.")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(args.files, recursive=True))
+    if not paths:
+        parser.error(f"no audio files match {args.files}")
+    clips = {p: decode_audio(p) for p in paths}
+    print(f"{len(clips)} clips, {sum(len(s) for s in clips.values()) / SAMPLE_RATE:.1f}s of audio")
+
+    results = [bench_backend(name.strip(), clips, args) for name in args.backends.split(",") if name.strip()]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        if "skipped" in r:
+            print(f"{r['backend']}: skipped, {r['skipped']}")
+            continue
+        print(
+            f"{r['backend']} ({r['model']}, {r['device']}, vad={r['vad']}): load {r['load_s']}s, "
+            f"warmup {r['warmup_s']}s, mean {r['mean_ms']}ms, p50 {r['p50_ms']}ms, p95 {r['p95_ms']}ms, "
+            f"{r['speed_x_realtime']}x realtime"
+        )
+        for name, text in r["transcripts"].items():
+            print(f"    {name}: {text!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+# transcription_jobs.py
+import os
+import uuid
+import time
+import asyncio
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+import metrics
+from stt_backends import SttBackend, make_backend
+
+logger = logging.getLogger(__name__)
+
+# "thread" shares one model loaded on the pool's worker thread (one worker by default,
+# since a single Whisper model is not safe to run concurrently). "process" loads one
+# model per worker process so concurrent speakers are spread across cores.
+WHISPER_POOL = os.getenv("WHISPER_POOL", "thread").lower()
+WHISPER_WORKERS = int(os.getenv("WHISPER_WORKERS", "1" if WHISPER_POOL == "thread" else "2"))
+TRANSCRIBE_QUEUE_LIMIT = int(os.getenv("TRANSCRIBE_QUEUE_LIMIT", "8"))
+TRANSCRIBE_TIMEOUT = float(os.getenv("TRANSCRIBE_TIMEOUT", "60"))
+MAX_FINISHED_JOBS = 200
+
+# Engine owned by a process-pool worker (set by _init_worker)
+_worker_backend: Optional[SttBackend] = None
+_worker_timings: Dict[str, float] = {}
+
+
+def _init_worker(backend: SttBackend) -> None:
+    global _worker_backend, _worker_timings
+    _worker_backend = backend
+    _worker_timings = backend.load()
+
+
+def _worker_ready() -> Dict[str, float]:
+    # Submitted once per worker at startup; returns after that worker's model is loaded
+    return _worker_timings
+
+
+def _transcribe_in_worker(audio: Any, language: str) -> Tuple[str, Dict[str, float]]:
+    return _worker_backend.transcribe(audio, language)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class TranscriptionJob:
+    def __init__(self, audio_path: str):
+        self.id = uuid.uuid4().hex
+        self.audio_path = audio_path
+        self.status = "queued"  # queued | running | done | error | timeout
+        self.transcript: Optional[str] = None
+        self.error: Optional[str] = None
+        self.result: Dict[str, Any] = {}
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.done = asyncio.Event()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "transcript": self.transcript,
+            "error": self.error,
+            "created": self.created,
+            "finished": self.finished,
+            **self.result,
+        }
+
+
+class TranscriptionPool:
+    """
+    Bounded worker pool for Whisper with a queue limit, per-job timeout and job lookup.
+    The model is loaded in the background (start_loading, or lazily on first use);
+    requests arriving meanwhile wait for it instead of failing.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[SttBackend] = None,
+        pool: str = WHISPER_POOL,
+        workers: int = WHISPER_WORKERS,
+        queue_limit: int = TRANSCRIBE_QUEUE_LIMIT,
+        timeout: float = TRANSCRIBE_TIMEOUT,
+    ):
+        # Speech-to-text engine (STT_BACKEND); see stt_backends.py
+        self.backend = backend or make_backend()
+        self.pool = pool
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self.jobs: Dict[str, TranscriptionJob] = {}
+        self.active = 0
+        self.state = "idle"  # idle | loading | ready | error
+        self.load_error: Optional[str] = None
+        self.load_timings: Dict[str, float] = {}
+        self._loaded = asyncio.Event()
+        if pool == "process":
+            self.executor: Executor = ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker, initargs=(self.backend,)
+            )
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="whisper")
+        logger.info(f"Transcription pool: {pool} x{workers}, queue limit {queue_limit}, timeout {timeout}s")
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    @property
+    def failed(self) -> bool:
+        return self.state == "error"
+
+    def start_loading(self) -> None:
+        """Begin loading the model in the background. Safe to call more than once."""
+        if self.state == "idle":
+            self.state = "loading"
+            asyncio.ensure_future(self._load())
+
+    async def _load(self) -> None:
+        loop = asyncio.get_running_loop()
+        logger.info(f"Loading speech-to-text model {self.backend.describe()}")
+        try:
+            if self.pool == "process":
+                # Each worker process loads its own copy in its initializer
+                results = await asyncio.gather(
+                    *(loop.run_in_executor(self.executor, _worker_ready) for _ in range(self.workers))
+                )
+                timings = results[0]
+            else:
+                # On the pool's own thread, so jobs queued meanwhile simply run after it
+                timings = await loop.run_in_executor(self.executor, self.backend.load)
+            self.load_timings = {name: round(seconds, 3) for name, seconds in timings.items()}
+            for name, seconds in timings.items():
+                metrics.record(name, seconds, "transcribe")
+            self.state = "ready"
+            logger.info(f"Whisper model ready {self.load_timings}")
+        except Exception as e:
+            self.state = "error"
+            self.load_error = f"{type(e).__name__}: {e}"
+            logger.error(f"Error loading Whisper model: {self.load_error}")
+        finally:
+            self._loaded.set()
+
+    async def wait_loaded(self) -> None:
+        self.start_loading()
+        await self._loaded.wait()
+        if self.failed:
+            raise RuntimeError(f"Whisper model failed to load: {self.load_error}")
+
+    def model_status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            **self.backend.describe(),
+            "timings_s": self.load_timings,
+            "error": self.load_error,
+        }
+
+    async def _run(self, audio: Any, language: str) -> str:
+        loop = asyncio.get_running_loop()
+        if self.pool == "process":
+            text, timings = await loop.run_in_executor(self.executor, _transcribe_in_worker, audio, language)
+        else:
+            text, timings = await loop.run_in_executor(self.executor, self.backend.transcribe, audio, language)
+        for name, seconds in timings.items():
+            metrics.record(name, seconds, "transcribe")
+        return text
+
+    async def transcribe(self, audio: Union[str, Any], language: str = "en") -> str:
+        """Transcribe a path or in-memory array on the pool without creating a job record."""
+        if self.failed:
+            raise RuntimeError(f"Whisper model failed to load: {self.load_error}")
+        if self.active >= self.queue_limit:
+            raise QueueFullError(f"Transcription queue full ({self.active}/{self.queue_limit})")
+        self.active += 1
+        try:
+            await self.wait_loaded()
+            return await asyncio.wait_for(self._run(audio, language), timeout=self.timeout)
+        finally:
+            self.active -= 1
+
+    def submit(
+        self,
+        audio_path: str,
+        language: str = "en",
+        on_done: Optional[Callable[[TranscriptionJob], None]] = None,
+    ) -> TranscriptionJob:
+        """Queue a transcription and return immediately. Raises QueueFullError past the limit."""
+        if self.failed:
+            raise RuntimeError(f"Whisper model failed to load: {self.load_error}")
+        if self.active >= self.queue_limit:
+            raise QueueFullError(f"Transcription queue full ({self.active}/{self.queue_limit})")
+
+        job = TranscriptionJob(audio_path)
+        self.jobs[job.id] = job
+        self.active += 1
+        asyncio.create_task(self._drive(job, language, on_done))
+        self._prune()
+        return job
+
+    async def _drive(self, job: TranscriptionJob, language: str, on_done) -> None:
+        try:
+            # The timeout covers transcription only, not waiting for the model to load
+            await self.wait_loaded()
+            job.status = "running"
+            job.transcript = await asyncio.wait_for(self._run(job.audio_path, language), timeout=self.timeout)
+            job.status = "done"
+            if on_done is not None:
+                on_done(job)
+        except asyncio.TimeoutError:
+            # The worker can't be interrupted; its result is simply discarded.
+            job.status = "timeout"
+            job.error = f"Transcription timed out after {self.timeout}s"
+            logger.error(f"Job {job.id}: {job.error}")
+        except Exception as e:
+            job.status = "error"
+            job.error = str(e)
+            logger.error(f"Job {job.id} failed: {e}")
+        finally:
+            self.active -= 1
+            job.finished = time.time()
+            job.done.set()
+
+    async def wait(self, job: TranscriptionJob, timeout: Optional[float] = None) -> TranscriptionJob:
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return job
+
+    def get(self, job_id: str) -> Optional[TranscriptionJob]:
+        return self.jobs.get(job_id)
+
+    def _prune(self) -> None:
+        finished = [j for j in self.jobs.values() if j.finished is not None]
+        if len(finished) <= MAX_FINISHED_JOBS:
+            return
+        finished.sort(key=lambda j: j.finished)
+        for j in finished[: len(finished) - MAX_FINISHED_JOBS]:
+            del self.jobs[j.id]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pool": self.pool,
+            "workers": self.workers,
+            "active": self.active,
+            "queue_limit": self.queue_limit,
+            "timeout": self.timeout,
+        }
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,18 +1,26 @@
 import os
 import json
+import time
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 from dotenv import load_dotenv
 
-import httpx
-from fastapi import FastAPI, HTTPException, APIRouter
+from fastapi import FastAPI, HTTPException, APIRouter, Query
+from fastapi import Path as PathParam
+
+import llm_gateway
+from metrics import stage
+from board_analyzer import analyze_board
+from board_diff import compare_issues, diff_boards, is_empty, issue_key
+from singleflight import SingleFlight, payload_key
+from breadboard import BOARD
+from session_store import DEFAULT_SESSION, SESSION_ID_PATTERN, sessions
+
 load_dotenv()
 
 router = APIRouter()
 
 BASE_DIR = Path(__file__).parent
-TARGET_PATH = BASE_DIR / "sample-targets"/ "1.json"
-OBSERVED_PATH = BASE_DIR / "sample-observed"/ "1.json"
 
 # -------- LLM Config --------
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
@@ -23,14 +31,14 @@ OPENROUTER_MODEL = os.getenv(
 OPENROUTER_SITE_URL = os.getenv("OPENROUTER_SITE_URL", "http://localhost:8000")
 OPENROUTER_APP_NAME = os.getenv("OPENROUTER_APP_NAME", "circuit-tutor-skeleton")
 
+# The comparison itself is computed locally; the LLM only rewrites it as friendlier prose.
+ANALYZE_PHRASE_WITH_LLM = os.getenv("ANALYZE_PHRASE_WITH_LLM", "false").lower() in ("1", "true", "yes")
+
 
-def load_json(p: Path):
-    if not p.exists():
-        raise HTTPException(status_code=500, detail=f"Missing file: {p.name}")
-    try:
-        return json.loads(p.read_text(encoding="utf-8"))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Invalid JSON in {p.name}: {e}")
+def require(value: Any, what: str):
+    if value is None:
+        raise HTTPException(status_code=500, detail=f"No {what} available yet")
+    return value
 
 
 def extract_first_json_object(text: str) -> str:
@@ -72,54 +80,36 @@ def validate_analysis_shape(obj: Any) -> Dict[str, Any]:
 SYSTEM_PROMPT = """
 You are CircuitTutorAnalyzer.
 
-You will be given:
-1) targetNetlist: intended circuit (abstract nodes N1, N2, ...)
-2) observedBoard: what is currently on the breadboard (component -> coordinates)
-3) optional board_rules: how breadboards connect
+You will be given an analysis of a student's breadboard that has ALREADY been computed
+exactly by comparing the observed board against the target netlist.
 
 Task:
-Compare observedBoard vs targetNetlist and produce a tutoring-style analysis.
+Rewrite the human-readable text so it sounds like a friendly, encouraging lab tutor.
 
 Output MUST be valid JSON only with this exact structure:
 
 {
-  "confidence": number (0..1),
-  "affirmations": string[],
-  "issues": [{
-    "id": string,  // e.g. R1, LED1, V1
-    "type": "missing_component" | "extra_component" | "short" | "open" | "wrong_connection" | "polarity" | "wrong_value" | "multiple components in same hole",
-    "severity": "info" | "warn" | "danger",
-    "observed": string,
-    "expected": string,
-    "locations": string[],  // breadboard coords to highlight (e.g. ["A10","B10"])
-    "fix": string           // one clear action sentence
-  }],
-  "next_steps": string[],    // 1..5 ordered steps
-  "questions": string[]      // ask only if uncertain
+  "affirmations": string[],   // same length and order as the input
+  "issues": [{ "observed": string, "expected": string, "fix": string }],  // same length and order as the input
+  "next_steps": string[]      // same length and order as the input
 }
 
 Rules:
 - JSON ONLY. No markdown. No commentary.
-- Do NOT invent components. Only refer to ids that appear in targetNetlist OR observedBoard.
-- Do NOT invent coordinates. Only use coordinates that appear in observedBoard.
-- Be specific and actionable.
-- Safety: if there is a likely short or polarity risk, severity should be "danger".
-- If mapping component names is ambiguous (e.g., observed has "resistor" but target has R1/R2), ask a question and lower confidence.
+- Do NOT add, remove or reorder items. Do NOT change what is wrong or how to fix it.
+- Keep every component id and breadboard coordinate exactly as written.
+- Each fix and next step is one clear action sentence.
 """.strip()
 
 
-BOARD_RULES = {
-    "coordinate_format": "ColumnLetterRowNumber like A10. Columns A-E are left half, F-J are right half.",
-    "connectivity": [
-        "A-E in the same numbered row are connected together (left node).",
-        "F-J in the same numbered row are connected together (right node).",
-        "Left and right halves are separated by the center gap (not connected).",
-        "Power rails are ignored unless explicitly present in observedBoard."
-    ],
-}
+BOARD_RULES = BOARD.rules()
+
 
+phrase_flights = SingleFlight("analyze")
 
-async def llm_analyze(target: Dict[str, Any], observed: Dict[str, Any]) -> Dict[str, Any]:
+
+async def llm_phrase(analysis: Dict[str, Any]) -> Dict[str, Any]:
+    """Ask the LLM to reword the text fields of a computed analysis. Structure is kept from the input."""
     if not OPENROUTER_API_KEY:
         raise HTTPException(status_code=500, detail="Missing OPENROUTER_API_KEY environment variable")
 
@@ -134,8 +124,12 @@ async def llm_analyze(target: Dict[str, Any], observed: Dict[str, Any]) -> Dict[
                 "role": "user",
                 "content": json.dumps(
                     {
-                        "targetNetlist": target,
-                        "observedBoard": observed,
+                        "affirmations": analysis["affirmations"],
+                        "issues": [
+                            {k: i[k] for k in ("id", "type", "observed", "expected", "locations", "fix")}
+                            for i in analysis["issues"]
+                        ],
+                        "next_steps": analysis["next_steps"],
                         "board_rules": BOARD_RULES,
                     }
                 ),
@@ -143,6 +137,26 @@ async def llm_analyze(target: Dict[str, Any], observed: Dict[str, Any]) -> Dict[
         ],
     }
 
+    # Concurrent /analyze polls for the same board share one rewording request
+    phrased = await phrase_flights.do(payload_key("analyze", payload), lambda: request_phrasing(payload))
+
+    # Only take reworded strings back, and only where the model kept the shape.
+    for key in ("affirmations", "next_steps"):
+        new = phrased.get(key)
+        if isinstance(new, list) and len(new) == len(analysis[key]) and all(isinstance(x, str) for x in new):
+            analysis[key] = new
+    new_issues = phrased.get("issues")
+    if isinstance(new_issues, list) and len(new_issues) == len(analysis["issues"]):
+        for issue, new in zip(analysis["issues"], new_issues):
+            if not isinstance(new, dict):
+                continue
+            for field in ("observed", "expected", "fix"):
+                if isinstance(new.get(field), str) and new[field].strip():
+                    issue[field] = new[field]
+    return analysis
+
+
+async def request_phrasing(payload: Dict[str, Any]) -> Dict[str, Any]:
     headers = {
         "Authorization": f"Bearer {OPENROUTER_API_KEY}",
         "Content-Type": "application/json",
@@ -150,21 +164,20 @@ async def llm_analyze(target: Dict[str, Any], observed: Dict[str, Any]) -> Dict[
         "X-Title": OPENROUTER_APP_NAME,
     }
 
-    async with httpx.AsyncClient(timeout=60) as client:
-        r = await client.post("https://openrouter.ai/api/v1/chat/completions", json=payload, headers=headers)
-        if r.status_code >= 400:
-            raise HTTPException(status_code=502, detail=f"OpenRouter error {r.status_code}: {r.text}")
+    r = await llm_gateway.post_chat_completion("analyze", headers=headers, body=payload)
+    if r.status_code >= 400:
+        raise HTTPException(status_code=502, detail=f"OpenRouter error {r.status_code}: {r.text}")
 
-        data = r.json()
-        content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
+    data = r.json()
+    content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
 
-        if not isinstance(content, str):
-            content = json.dumps(content)
+    if not isinstance(content, str):
+        content = json.dumps(content)
 
+    with stage("json_extract", "analyze"):
         json_text = extract_first_json_object(content)
-
         try:
-            parsed = json.loads(json_text)
+            phrased = json.loads(json_text)
         except Exception:
             # Return a helpful error message (and include snippet for debugging)
             snippet = content[:400]
@@ -172,13 +185,9 @@ async def llm_analyze(target: Dict[str, Any], observed: Dict[str, Any]) -> Dict[
                 status_code=502,
                 detail=f"Model did not return valid JSON. First 400 chars:\n{snippet}",
             )
-
-        parsed = validate_analysis_shape(parsed)
-        # Optional: include raw model metadata in debug mode
-        parsed["_debug"] = {
-            "model": OPENROUTER_MODEL,
-        }
-        return parsed
+    if not isinstance(phrased, dict):
+        raise HTTPException(status_code=502, detail="Model did not return a JSON object")
+    return phrased
 
 
 # @router.get("/health")
@@ -186,12 +195,94 @@ async def llm_analyze(target: Dict[str, Any], observed: Dict[str, Any]) -> Dict[
 #     return {"ok": True}
 
 
-@router.get("/analyze")
-async def analyze():
-    target = load_json(TARGET_PATH)
-    observed = load_json(OBSERVED_PATH)
+async def phrase_incrementally(
+    analysis: Dict[str, Any], memo: Dict[str, Any]
+) -> Tuple[Dict[str, Any], Dict[str, Any], int]:
+    """
+    Reword only the text the LLM hasn't seen yet. memo holds earlier phrasings:
+    {"text": {raw: phrased}, "issues": {issue_key: {observed, expected, fix}}}.
+    Returns (analysis, memo for the current items only, number of items sent).
+    """
+    texts = dict(memo.get("text", {}))
+    issue_texts = dict(memo.get("issues", {}))
+    todo = {
+        "affirmations": [a for a in analysis["affirmations"] if a not in texts],
+        "issues": [dict(i) for i in analysis["issues"] if issue_key(i) not in issue_texts],
+        "next_steps": [n for n in analysis["next_steps"] if n not in texts],
+    }
+    sent = sum(len(v) for v in todo.values())
+    if sent:
+        raw = {key: list(todo[key]) for key in ("affirmations", "next_steps")}
+        phrased = await llm_phrase(todo)
+        for key in ("affirmations", "next_steps"):
+            texts.update(zip(raw[key], phrased[key]))
+        for issue in phrased["issues"]:
+            issue_texts[issue_key(issue)] = {f: issue[f] for f in ("observed", "expected", "fix")}
+
+    new_memo = {"text": {}, "issues": {}}
+    for key in ("affirmations", "next_steps"):
+        new_memo["text"].update({t: texts[t] for t in analysis[key] if t in texts})
+        analysis[key] = [texts.get(t, t) for t in analysis[key]]
+    for issue in analysis["issues"]:
+        k = issue_key(issue)
+        if k in issue_texts:
+            new_memo["issues"][k] = issue_texts[k]
+            issue.update(issue_texts[k])
+    return analysis, new_memo, sent
+
+
+async def analyze_session(session_id: str, phrase: bool) -> Dict[str, Any]:
+    target = require(sessions.netlist(session_id), "target netlist")
+    observed = require(sessions.observed(session_id), "observed board")
+    components = observed.get("components", {})
+
+    start_time = time.perf_counter()
+    state = sessions.get(session_id)
+    baseline = state.baseline
+    # Diff against the last analyzed board; only meaningful for the same target
+    if baseline is not None and baseline["target"] == target:
+        delta = diff_boards(baseline["components"], components)
+    else:
+        baseline, delta = None, None
+
+    if baseline is not None and is_empty(delta) and baseline["phrased"] == phrase:
+        # Nothing moved since the last analysis: reuse it as-is
+        analysis = dict(baseline["analysis"])
+        analysis["changes"] = {**delta, "resolved_issues": [], "introduced_issues": []}
+        analysis["_debug"] = {**analysis["_debug"], "reused": True}
+        analysis["_debug"].pop("phrased_items", None)
+        sessions.update(session_id, analysis=analysis)
+        return {"analysis": analysis}
+
+    with stage("board_analysis", "analyze"):
+        analysis = validate_analysis_shape(analyze_board(target, observed))
+    analysis["_debug"] = {
+        "engine": "local",
+        "elapsed_ms": round((time.perf_counter() - start_time) * 1000, 3),
+        "reused": False,
+    }
 
-    analysis = await llm_analyze(target=target, observed=observed)
+    memo = baseline["memo"] if baseline is not None else {}
+    if phrase:
+        analysis, memo, sent = await phrase_incrementally(analysis, memo)
+        analysis["_debug"]["model"] = OPENROUTER_MODEL
+        analysis["_debug"]["phrased_items"] = sent
+
+    # Issues are matched by type, component and location, so rewording doesn't count as a change
+    if delta is not None:
+        resolved, introduced = compare_issues(baseline["analysis"]["issues"], analysis["issues"])
+        analysis["changes"] = {**delta, "resolved_issues": resolved, "introduced_issues": introduced}
+    else:
+        analysis["changes"] = None
+
+    state.baseline = {
+        "target": target,
+        "components": components,
+        "analysis": analysis,
+        "memo": memo,
+        "phrased": phrase,
+    }
+    sessions.update(session_id, analysis=analysis)
 
     # Return analysis only (clean). If you want to include inputs too, uncomment below.
     return {
@@ -199,3 +290,24 @@ async def analyze():
         # "target": target,
         # "observed": observed
     }
+
+
+@router.get("/analyze")
+async def analyze(
+    phrase: bool = Query(
+        ANALYZE_PHRASE_WITH_LLM,
+        description="If true, have the LLM reword the computed analysis as tutoring prose.",
+    ),
+):
+    return await analyze_session(DEFAULT_SESSION, phrase)
+
+
+@router.get("/sessions/{session_id}/analyze")
+async def analyze_for_session(
+    session_id: str = PathParam(..., pattern=SESSION_ID_PATTERN),
+    phrase: bool = Query(
+        ANALYZE_PHRASE_WITH_LLM,
+        description="If true, have the LLM reword the computed analysis as tutoring prose.",
+    ),
+):
+    return await analyze_session(session_id, phrase)
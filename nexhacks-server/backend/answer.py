@@ -2,13 +2,25 @@ import os
 import json
 import logging
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
 
 import httpx
 from fastapi import HTTPException, APIRouter
+from fastapi import Path as PathParam
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
+import llm_gateway
+from metrics import stage
+from singleflight import SingleFlight, payload_key
+from answer_cache import AnswerCache, CacheKey
+from answer_stream import JsonObjectStream, SentenceSplitter, split_sentences, sse
+from analyze import analyze_session
+from board_analyzer import observed_netlist
+from pipeline import pipeline
+from session_store import DEFAULT_SESSION, SESSION_ID_PATTERN, sessions
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -16,13 +28,7 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 BASE_DIR = Path(__file__).parent
-# Use a proper Path for the shared schematic-output file
-TARGET_PATH = Path(r"C:\Users\srich\nexhacks\files\schematic-output\schematic.json")
-OBSERVED_PATH = BASE_DIR / "observed-output" / "1.json"
-FALLBACK_OBSERVED_PATH = BASE_DIR / "sample-observed" / "1.json"
 QUESTION_PATH = BASE_DIR / "sample-questions" / "1.txt"
-ANSWER_OUTPUT_DIR = BASE_DIR / "answer-output"
-ANSWER_OUTPUT_PATH = ANSWER_OUTPUT_DIR / "latest.json"
 
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
 OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "mistralai/mistral-small-3.1-24b-instruct:free")
@@ -32,18 +38,6 @@ OPENROUTER_APP_NAME = os.getenv("OPENROUTER_APP_NAME", "circuit-tutor-answer")
 ANALYZE_BASE_URL = os.getenv("ANALYZE_BASE_URL", "").rstrip("/")
 
 
-def load_json(p: Path) -> Dict[str, Any]:
-    logger.info(f"[answer] Loading JSON from {p}")
-    if not p.exists():
-        logger.error(f"[answer] Missing JSON file: {p}")
-        raise HTTPException(status_code=500, detail=f"Missing file: {p}")
-    try:
-        return json.loads(p.read_text(encoding="utf-8"))
-    except Exception as e:
-        logger.exception(f"[answer] Invalid JSON in {p}: {e}")
-        raise HTTPException(status_code=500, detail=f"Invalid JSON in {p}: {e}")
-
-
 def load_text(p: Path) -> str:
     logger.info(f"[answer] Loading text from {p}")
     if not p.exists():
@@ -56,12 +50,46 @@ def load_text(p: Path) -> str:
     return text
 
 
-def load_observed_json() -> Dict[str, Any]:
-    # Prefer live output produced by /process-observed; fallback to sample data.
-    if OBSERVED_PATH.exists():
-        return load_json(OBSERVED_PATH)
-    return load_json(FALLBACK_OBSERVED_PATH)
+def load_target(session_id: str) -> Dict[str, Any]:
+    target = sessions.netlist(session_id)
+    if target is None:
+        logger.error(f"[answer] No target netlist for session {session_id}")
+        raise HTTPException(status_code=500, detail="No target netlist available yet")
+    return target
+
+
+def load_observed(session_id: str) -> Dict[str, Any]:
+    # Live output produced by /process-observed; falls back to sample data.
+    observed = sessions.observed(session_id)
+    if observed is None:
+        logger.error(f"[answer] No observed board for session {session_id}")
+        raise HTTPException(status_code=500, detail="No observed board available yet")
+    return observed
+
+
+async def load_analysis(session_id: str) -> Optional[Dict[str, Any]]:
+    # Warm result kept by the snapshot pipeline (waits if the newest frame is still being analyzed)
+    analysis = await pipeline.latest_analysis(session_id)
+    if analysis is not None:
+        return analysis
+    if ANALYZE_BASE_URL:
+        # Analyzer deployed as a separate service
+        return await fetch_latest_analysis_if_configured(session_id)
+    # Nothing analyzed yet; the comparison is local and cheap, so run it in-process
+    try:
+        return (await analyze_session(session_id, phrase=False))["analysis"]
+    except HTTPException as e:
+        logger.warning(f"[answer] No analysis for session {session_id}: {e.detail}")
+        return None
+
 
+def observed_nets(observed: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    # Electrical nets of the observed board (rows joined by wires), so the model
+    # doesn't have to work out connectivity from raw coordinates.
+    components = observed.get("components")
+    if not isinstance(components, dict):
+        return None
+    return observed_netlist(components).to_dict()
 
 
 def extract_first_json_object(text: str) -> str:
@@ -85,7 +113,9 @@ You are CircuitTutorAnswerer, an expert electronics lab assistant and breadboard
 You will receive:
 - targetNetlist: the intended circuit (abstract nodes N1, N2,...)
 - observedBoard: the current breadboard placement (component -> coordinates)
-- optional analysis: detected issues/next steps (if available)
+- observedNets: connectivity computed from observedBoard (net -> breadboard rows and the components on it)
+- optional analysis: detected issues/next steps (if available); analysis.changes lists what moved since
+  the previous frame and which issues that resolved or introduced
 - userQuestion: what the user is asking right now
 
 You must answer the user's question.
@@ -120,26 +150,59 @@ Rules:
 """.strip()
 
 
-async def fetch_latest_analysis_if_configured() -> Optional[Dict[str, Any]]:
+async def fetch_latest_analysis_if_configured(session_id: str = DEFAULT_SESSION) -> Optional[Dict[str, Any]]:
     if not ANALYZE_BASE_URL:
         return None
+    route = "/analyze" if session_id == DEFAULT_SESSION else f"/sessions/{session_id}/analyze"
     try:
-        logger.info(f"[answer] Fetching latest analysis from {ANALYZE_BASE_URL}/analyze")
-        async with httpx.AsyncClient(timeout=30) as client:
-            r = await client.get(f"{ANALYZE_BASE_URL}/analyze")
-            if r.status_code >= 400:
-                logger.warning(
-                    f"[answer] /analyze returned {r.status_code}, ignoring analysis"
-                )
-                return None
-            data = r.json()
-            return data.get("analysis") if isinstance(data, dict) else None
+        logger.info(f"[answer] Fetching latest analysis from {ANALYZE_BASE_URL}{route}")
+        client = llm_gateway.get_client()
+        r = await client.get(f"{ANALYZE_BASE_URL}{route}", timeout=30)
+        if r.status_code >= 400:
+            logger.warning(
+                f"[answer] /analyze returned {r.status_code}, ignoring analysis"
+            )
+            return None
+        data = r.json()
+        return data.get("analysis") if isinstance(data, dict) else None
     except Exception as e:
         logger.exception(f"[answer] Failed to fetch analysis: {e}")
         return None
 
 
+answer_flights = SingleFlight("answer")
+answer_cache = AnswerCache()
+
+
+def forget_old_board(session_id: str, fields: set) -> None:
+    # Invalidation hook: answers about the board a session just left won't be asked for again
+    dropped = answer_cache.board_changed(session_id)
+    if dropped:
+        logger.info(f"[answer] Dropped {dropped} cached answers after session {session_id} changed {sorted(fields)}")
+
+
+sessions.add_listener(forget_old_board)
+
+
+def cached_answer(session_id: str, key: CacheKey) -> Optional[Dict[str, Any]]:
+    # While a newer frame is still in the pipeline the stored board is about to change; ask the model then
+    if pipeline.busy(session_id):
+        return None
+    answer_cache.bind(session_id, key)
+    cached = answer_cache.get(key)
+    if cached is not None:
+        logger.info(f"[answer] Cache hit for session {session_id}")
+        sessions.update(session_id, answer=cached)
+    return cached
+
+
 async def call_openrouter(payload: Dict[str, Any]) -> Dict[str, Any]:
+    # Polling bursts with the same question and board share one OpenRouter request
+    key = payload_key("answer", {"model": OPENROUTER_MODEL, "payload": payload})
+    return await answer_flights.do(key, lambda: _call_openrouter(payload))
+
+
+def openrouter_request(payload: Dict[str, Any]) -> Tuple[Dict[str, str], Dict[str, Any]]:
     if not OPENROUTER_API_KEY:
         logger.error("[answer] OPENROUTER_API_KEY missing in environment")
         raise HTTPException(status_code=500, detail="Missing OPENROUTER_API_KEY in .env")
@@ -160,27 +223,11 @@ async def call_openrouter(payload: Dict[str, Any]) -> Dict[str, Any]:
             {"role": "user", "content": json.dumps(payload)},
         ],
     }
+    return headers, req
 
-    logger.info(f"[answer] Calling OpenRouter model={OPENROUTER_MODEL}")
-    async with httpx.AsyncClient(timeout=60) as client:
-        r = await client.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=req,
-        )
-        if r.status_code >= 400:
-            logger.error(
-                f"[answer] OpenRouter error {r.status_code}: {r.text[:400]}"
-            )
-            raise HTTPException(
-                status_code=502,
-                detail=f"OpenRouter error {r.status_code}: {r.text}",
-            )
-
-        data = r.json()
-        content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
-        text = content if isinstance(content, str) else json.dumps(content)
 
+def parse_answer(text: str) -> Dict[str, Any]:
+    with stage("json_extract", "answer"):
         json_text = extract_first_json_object(text)
         try:
             parsed = json.loads(json_text)
@@ -192,23 +239,105 @@ async def call_openrouter(payload: Dict[str, Any]) -> Dict[str, Any]:
                 status_code=502,
                 detail=f"Model did not return valid JSON. First 400 chars:\n{text[:400]}",
             )
+    with stage("validate", "answer"):
+        return validate_answer(parsed)
 
-        if not isinstance(parsed, dict) or "answer" not in parsed or "actions" not in parsed or "followups" not in parsed:
-            logger.error(f"[answer] Model returned wrong shape: {parsed}")
-            raise HTTPException(
-                status_code=502,
-                detail=f"Model returned wrong shape: {parsed}",
-            )
 
-        if not isinstance(parsed["actions"], list) or not isinstance(parsed["followups"], list):
-            logger.error(f"[answer] Model returned wrong types: {parsed}")
-            raise HTTPException(
-                status_code=502,
-                detail=f"Model returned wrong types: {parsed}",
-            )
+def validate_answer(parsed: Any) -> Dict[str, Any]:
+    if not isinstance(parsed, dict) or "answer" not in parsed or "actions" not in parsed or "followups" not in parsed:
+        logger.error(f"[answer] Model returned wrong shape: {parsed}")
+        raise HTTPException(
+            status_code=502,
+            detail=f"Model returned wrong shape: {parsed}",
+        )
+
+    if not isinstance(parsed["actions"], list) or not isinstance(parsed["followups"], list):
+        logger.error(f"[answer] Model returned wrong types: {parsed}")
+        raise HTTPException(
+            status_code=502,
+            detail=f"Model returned wrong types: {parsed}",
+        )
+    return parsed
+
+
+async def _call_openrouter(payload: Dict[str, Any]) -> Dict[str, Any]:
+    headers, req = openrouter_request(payload)
+
+    logger.info(f"[answer] Calling OpenRouter model={OPENROUTER_MODEL}")
+    r = await llm_gateway.post_chat_completion("answer", headers=headers, body=req)
+    if r.status_code >= 400:
+        logger.error(
+            f"[answer] OpenRouter error {r.status_code}: {r.text[:400]}"
+        )
+        raise HTTPException(
+            status_code=502,
+            detail=f"OpenRouter error {r.status_code}: {r.text}",
+        )
 
-        logger.info("[answer] OpenRouter call succeeded")
-        return parsed
+    data = r.json()
+    content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
+    text = content if isinstance(content, str) else json.dumps(content)
+
+    parsed = parse_answer(text)
+    logger.info("[answer] OpenRouter call succeeded")
+    return parsed
+
+
+async def stream_openrouter(
+    headers: Dict[str, str], req: Dict[str, Any], key: Optional[CacheKey], session_id: str
+) -> AsyncIterator[str]:
+    """
+    SSE events for one answer as the model writes it: "answer" (text deltas),
+    "sentence" (each complete sentence, for TTS), "actions" and "followups" as
+    soon as those arrays close, then "done" with the full validated answer,
+    or "error".
+    """
+    parser = JsonObjectStream("answer")
+    sentences = SentenceSplitter()
+    logger.info(f"[answer] Streaming from OpenRouter model={OPENROUTER_MODEL}")
+    try:
+        async for delta in llm_gateway.stream_chat_completion("answer", headers=headers, body=req):
+            for kind, field, value in parser.feed(delta):
+                if kind == "delta":
+                    yield sse("answer", {"text": value})
+                    for sentence in sentences.push(value):
+                        yield sse("sentence", {"text": sentence})
+                elif field == "answer":
+                    for sentence in sentences.flush():
+                        yield sse("sentence", {"text": sentence})
+                elif field in ("actions", "followups"):
+                    yield sse(field, value)
+        result = parse_answer(parser.text)
+    except httpx.HTTPStatusError as e:
+        logger.error(f"[answer] OpenRouter error {e.response.status_code}: {e.response.text[:400]}")
+        yield sse("error", {"status": 502, "detail": f"OpenRouter error {e.response.status_code}: {e.response.text}"})
+        return
+    except HTTPException as e:
+        yield sse("error", {"status": e.status_code, "detail": e.detail})
+        return
+    except (httpx.HTTPError, llm_gateway.StreamError) as e:
+        logger.error(f"[answer] OpenRouter stream failed: {type(e).__name__}: {e}")
+        yield sse("error", {"status": 502, "detail": f"OpenRouter stream failed: {type(e).__name__}: {e}"})
+        return
+
+    for sentence in sentences.flush():
+        yield sse("sentence", {"text": sentence})
+    if key:
+        answer_cache.put(key, result)
+    sessions.update(session_id, answer=result)
+    logger.info(f"[answer] Stored streamed answer for session {session_id}")
+    yield sse("done", result)
+
+
+async def replay_answer(result: Dict[str, Any]) -> AsyncIterator[str]:
+    # A cached answer goes out in the same event sequence as a streamed one
+    text = str(result["answer"])
+    yield sse("answer", {"text": text})
+    for sentence in split_sentences(text):
+        yield sse("sentence", {"text": sentence})
+    yield sse("actions", result["actions"])
+    yield sse("followups", result["followups"])
+    yield sse("done", result)
 
 
 # @router.get("/health")
@@ -216,24 +345,30 @@ async def call_openrouter(payload: Dict[str, Any]) -> Dict[str, Any]:
 #     return {"ok": True, "model": OPENROUTER_MODEL}
 
 
-# ✅ GET /answer now reads from sample-questions/{id}.txt
-# Example: /answer or /answer?id=2
-@router.get("/answer")
-async def answer_get():
-    logger.info("[answer] GET /answer called")
+async def answer_session(session_id: str) -> Dict[str, Any]:
     try:
-        target = load_json(TARGET_PATH)
-        observed = load_observed_json()
+        # A snapshot pipeline run may already be answering for the newest frame
+        prefetched = await pipeline.pending_answer(session_id)
+        if prefetched is not None:
+            logger.info(f"[answer] Using the answer prepared by the pipeline for session {session_id}")
+            return prefetched
+        target = load_target(session_id)
+        observed = load_observed(session_id)
         question = load_text(QUESTION_PATH)
         logger.info(
             f"[answer] Using question from {QUESTION_PATH.name}: {question[:120]!r}"
         )
-        analysis = await fetch_latest_analysis_if_configured()
+        key = answer_cache.make_key(question, target, observed, OPENROUTER_MODEL)
+        cached = cached_answer(session_id, key)
+        if cached is not None:
+            return cached
+        analysis = await load_analysis(session_id)
 
         payload = {
             "userQuestion": question,
             "targetNetlist": target,
             "observedBoard": observed,
+            "observedNets": observed_nets(observed),
             "analysis": analysis,
         }
         logger.info(
@@ -241,11 +376,9 @@ async def answer_get():
             f"(target keys={list(target.keys())}, observed keys={list(observed.keys())})"
         )
         result = await call_openrouter(payload)
-        ANSWER_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-        ANSWER_OUTPUT_PATH.write_text(
-            json.dumps(result, indent=2), encoding="utf-8"
-        )
-        logger.info(f"[answer] Wrote answer JSON to {ANSWER_OUTPUT_PATH}")
+        answer_cache.put(key, result)
+        sessions.update(session_id, answer=result)
+        logger.info(f"[answer] Stored answer for session {session_id}")
         return result
     except HTTPException as e:
         logger.error(f"[answer] HTTPException in GET /answer: {e.status_code} {e.detail}")
@@ -258,29 +391,31 @@ async def answer_get():
         )
 
 
-# Optional: keep POST /answer for direct questions (useful for later UI)
-@router.post("/answer")
-async def answer_post(req: AnswerRequest):
-    logger.info("[answer] POST /answer called")
+async def answer_session_question(session_id: str, req: AnswerRequest) -> Dict[str, Any]:
     try:
-        target = req.target or load_json(TARGET_PATH)
-        observed = req.observed or load_observed_json()
+        target = req.target or load_target(session_id)
+        observed = req.observed or load_observed(session_id)
         question = req.question or load_text(QUESTION_PATH)
         logger.info(f"[answer] POST question: {str(question)[:120]!r}")
-        analysis = req.analysis or await fetch_latest_analysis_if_configured()
+        # A caller-supplied analysis isn't part of the cache key, so those requests always go to the model
+        key = None if req.analysis else answer_cache.make_key(question, target, observed, OPENROUTER_MODEL)
+        cached = cached_answer(session_id, key) if key else None
+        if cached is not None:
+            return cached
+        analysis = req.analysis or await load_analysis(session_id)
 
         payload = {
             "userQuestion": question,
             "targetNetlist": target,
             "observedBoard": observed,
+            "observedNets": observed_nets(observed),
             "analysis": analysis,
         }
         result = await call_openrouter(payload)
-        ANSWER_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-        ANSWER_OUTPUT_PATH.write_text(
-            json.dumps(result, indent=2), encoding="utf-8"
-        )
-        logger.info(f"[answer] Wrote answer JSON to {ANSWER_OUTPUT_PATH} (POST)")
+        if key:
+            answer_cache.put(key, result)
+        sessions.update(session_id, answer=result)
+        logger.info(f"[answer] Stored answer for session {session_id} (POST)")
         return result
     except HTTPException as e:
         logger.error(f"[answer] HTTPException in POST /answer: {e.status_code} {e.detail}")
@@ -291,3 +426,94 @@ async def answer_post(req: AnswerRequest):
             status_code=500,
             detail=f"answer_post crashed: {type(e).__name__}: {e}",
         )
+
+
+async def answer_session_stream(session_id: str, req: AnswerRequest) -> StreamingResponse:
+    # Everything that can fail before the model is called fails as a normal HTTP error
+    try:
+        target = req.target or load_target(session_id)
+        observed = req.observed or load_observed(session_id)
+        question = req.question or load_text(QUESTION_PATH)
+        logger.info(f"[answer] Stream question: {str(question)[:120]!r}")
+        key = None if req.analysis else answer_cache.make_key(question, target, observed, OPENROUTER_MODEL)
+        cached = cached_answer(session_id, key) if key else None
+        if cached is not None:
+            events = replay_answer(cached)
+        else:
+            analysis = req.analysis or await load_analysis(session_id)
+            payload = {
+                "userQuestion": question,
+                "targetNetlist": target,
+                "observedBoard": observed,
+                "observedNets": observed_nets(observed),
+                "analysis": analysis,
+            }
+            headers, body = openrouter_request(payload)
+            events = stream_openrouter(headers, body, key, session_id)
+    except HTTPException as e:
+        logger.error(f"[answer] HTTPException in /answer/stream: {e.status_code} {e.detail}")
+        raise
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        # Keep proxies (nginx) from buffering the events
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ✅ GET /answer now reads from sample-questions/{id}.txt
+# Example: /answer or /answer?id=2
+@router.get("/answer")
+async def answer_get():
+    logger.info("[answer] GET /answer called")
+    return await answer_session(DEFAULT_SESSION)
+
+
+@router.get("/sessions/{session_id}/answer")
+async def answer_session_get(session_id: str = PathParam(..., pattern=SESSION_ID_PATTERN)):
+    logger.info(f"[answer] GET /sessions/{session_id}/answer called")
+    return await answer_session(session_id)
+
+
+# Server-Sent Events: the answer text arrives as it is generated, so TTS can
+# start on the first sentence. GET (EventSource) uses the sample question.
+@router.get("/answer/stream")
+async def answer_stream_get():
+    logger.info("[answer] GET /answer/stream called")
+    return await answer_session_stream(DEFAULT_SESSION, AnswerRequest(question=load_text(QUESTION_PATH)))
+
+
+@router.post("/answer/stream")
+async def answer_stream_post(req: AnswerRequest):
+    logger.info("[answer] POST /answer/stream called")
+    return await answer_session_stream(DEFAULT_SESSION, req)
+
+
+@router.get("/sessions/{session_id}/answer/stream")
+async def answer_session_stream_get(session_id: str = PathParam(..., pattern=SESSION_ID_PATTERN)):
+    logger.info(f"[answer] GET /sessions/{session_id}/answer/stream called")
+    return await answer_session_stream(session_id, AnswerRequest(question=load_text(QUESTION_PATH)))
+
+
+@router.post("/sessions/{session_id}/answer/stream")
+async def answer_session_stream_post(req: AnswerRequest, session_id: str = PathParam(..., pattern=SESSION_ID_PATTERN)):
+    logger.info(f"[answer] POST /sessions/{session_id}/answer/stream called")
+    return await answer_session_stream(session_id, req)
+
+
+@router.get("/answer/cache")
+async def answer_cache_stats():
+    return {**answer_cache.stats(), "single_flight": answer_flights.stats()}
+
+
+# Optional: keep POST /answer for direct questions (useful for later UI)
+@router.post("/answer")
+async def answer_post(req: AnswerRequest):
+    logger.info("[answer] POST /answer called")
+    return await answer_session_question(DEFAULT_SESSION, req)
+
+
+@router.post("/sessions/{session_id}/answer")
+async def answer_session_post(req: AnswerRequest, session_id: str = PathParam(..., pattern=SESSION_ID_PATTERN)):
+    logger.info(f"[answer] POST /sessions/{session_id}/answer called")
+    return await answer_session_question(session_id, req)
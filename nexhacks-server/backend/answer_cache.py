@@ -0,0 +1,99 @@
+# answer_cache.py
+import os
+import re
+import json
+import time
+import hashlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "256"))
+
+CacheKey = Tuple[str, str, str, str]
+
+
+def normalize_question(question: str) -> str:
+    """'Which way does the LED go?' and 'which way does the  LED go' ask the same thing."""
+    text = re.sub(r"\s+", " ", question.lower()).strip()
+    return text.rstrip(" ?!.")
+
+
+def fingerprint(obj: Any) -> str:
+    """Canonical hash of a JSON value: key order and whitespace don't matter."""
+    blob = json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """
+    TTL + LRU cache of model answers keyed on (question, target netlist, observed
+    board, model). Entries for a board are dropped as soon as no session is on
+    that board any more (see board_changed), and otherwise expire after ttl.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES, ttl: float = ANSWER_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[CacheKey, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.session_boards: Dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def make_key(self, question: str, target: Dict[str, Any], observed: Dict[str, Any], model: str) -> CacheKey:
+        return normalize_question(question), fingerprint(target), fingerprint(observed), model
+
+    def get(self, key: CacheKey) -> Optional[Dict[str, Any]]:
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: CacheKey, value: Dict[str, Any]) -> None:
+        if self.max_entries <= 0:
+            return
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def bind(self, session_id: str, key: CacheKey) -> None:
+        """Remember which board a session is currently asking about."""
+        self.session_boards[session_id] = key[2]
+
+    def board_changed(self, session_id: str) -> int:
+        """
+        Invalidation hook: the session's board moved on. Drops entries for its
+        old board unless another session is still on the same board.
+        Returns how many entries were removed.
+        """
+        old = self.session_boards.pop(session_id, None)
+        if old is None or old in self.session_boards.values():
+            return 0
+        stale = [k for k in self.entries if k[2] == old]
+        for k in stale:
+            del self.entries[k]
+        self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.session_boards.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "invalidated": self.invalidations,
+        }
@@ -0,0 +1,154 @@
+# answer_stream.py
+import re
+import json
+from typing import Any, List, Optional, Tuple
+
+# (kind, key, value): ("delta", field, text) while the streamed string field grows,
+# ("field", key, value) once a top-level field of the object is complete
+StreamEvent = Tuple[str, str, Any]
+
+# An escape sequence cut off at the end of a chunk: "\" or "\u00"
+_PARTIAL_ESCAPE_RE = re.compile(r"(?<!\\)(?:\\\\)*(\\|\\u[0-9a-fA-F]{0,3})$")
+_SENTENCE_RE = re.compile(r"(.+?[.!?]+)(?:\s+|$)", re.S)
+
+
+def sse(event: str, data: Any) -> str:
+    """One Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class JsonObjectStream:
+    """
+    Incremental parser for a JSON object arriving in chunks (a streamed model reply).
+    Reports each top-level field as soon as its value closes, and the decoded text
+    of one string field (stream_field) as it grows, so speech can start before the
+    object is finished. Anything before the first "{" (stray prose) is skipped.
+    """
+
+    def __init__(self, stream_field: str = "answer"):
+        self.stream_field = stream_field
+        self.text = ""
+        self.fields: dict = {}
+        self.closed = False
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key_start: Optional[int] = None
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+        self._streamed = ""
+
+    def feed(self, chunk: str) -> List[StreamEvent]:
+        self.text += chunk
+        text = self.text
+        events: List[StreamEvent] = []
+        i = self._pos
+        while i < len(text) and not self.closed:
+            ch = text[i]
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._key_start is not None:
+                        self._key = json.loads(text[self._key_start:i + 1])
+                        self._key_start = None
+                    elif self._depth == 1 and self._streaming():
+                        self._delta(i, events)
+            elif ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._key is None:
+                    self._key_start = i
+                else:
+                    self._start_value(i)
+            elif ch in "{[":
+                self._start_value(i)
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish_value(i, events)
+                    self.closed = True
+            elif ch == "," and self._depth == 1:
+                self._finish_value(i, events)
+            elif ch not in " \t\r\n:":
+                # number, true, false, null
+                self._start_value(i)
+            i += 1
+        self._pos = i
+        if self._in_string and self._depth == 1 and self._streaming():
+            self._delta(len(text), events)
+        return events
+
+    def _start_value(self, i: int) -> None:
+        if self._depth == 1 and self._key is not None and self._value_start is None:
+            self._value_start = i
+
+    def _streaming(self) -> bool:
+        return (
+            self._key == self.stream_field
+            and self._value_start is not None
+            and self.text[self._value_start] == '"'
+        )
+
+    def _delta(self, end: int, events: List[StreamEvent]) -> None:
+        raw = self.text[self._value_start + 1:end]
+        cut = _PARTIAL_ESCAPE_RE.search(raw)
+        if cut:
+            raw = raw[:cut.start(1)]
+        try:
+            decoded = json.loads(f'"{raw}"')
+        except ValueError:
+            return
+        if decoded and "\ud800" <= decoded[-1] <= "\udbff":
+            # First half of a surrogate pair; wait for the second
+            decoded = decoded[:-1]
+        if len(decoded) > len(self._streamed):
+            events.append(("delta", self.stream_field, decoded[len(self._streamed):]))
+            self._streamed = decoded
+
+    def _finish_value(self, end: int, events: List[StreamEvent]) -> None:
+        if self._key is not None and self._value_start is not None:
+            try:
+                value = json.loads(self.text[self._value_start:end])
+            except ValueError:
+                pass
+            else:
+                self.fields[self._key] = value
+                events.append(("field", self._key, value))
+        self._key = None
+        self._value_start = None
+
+
+class SentenceSplitter:
+    """Buffers streamed text and hands back whole sentences for TTS."""
+
+    def __init__(self):
+        self.pending = ""
+
+    def push(self, text: str) -> List[str]:
+        self.pending += text
+        sentences = []
+        while True:
+            # Only split where whitespace follows, so "3.3V" or a cut-off "..." stays whole
+            m = _SENTENCE_RE.match(self.pending)
+            if m is None or m.end() == len(self.pending) and not self.pending[-1].isspace():
+                break
+            sentences.append(m.group(1).strip())
+            self.pending = self.pending[m.end():]
+        return sentences
+
+    def flush(self) -> List[str]:
+        rest, self.pending = self.pending.strip(), ""
+        return [rest] if rest else []
+
+
+def split_sentences(text: str) -> List[str]:
+    splitter = SentenceSplitter()
+    return splitter.push(text) + splitter.flush()
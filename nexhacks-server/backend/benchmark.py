@@ -0,0 +1,255 @@
+# benchmark.py
+"""
+Offline throughput benchmark. Starts mock_llm.py and the backend (uvicorn main:app)
+on local ports, drives the main routes at a fixed concurrency and reports latency
+percentiles, requests per second and backend memory. No OpenRouter key or quota needed.
+
+    python benchmark.py --requests 200 --concurrency 16 --latency 0.8
+    python benchmark.py --endpoints analyze,answer --concurrency 64 --json
+
+Pass --backend-url to benchmark an already running backend instead (it must have
+been started with OPENROUTER_BASE_URL pointing at a mock or a real provider).
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+BASE_DIR = Path(__file__).parent
+SAMPLE_STATE_PATH = BASE_DIR / "sample-states" / "1.png"
+QUESTION_PATH = BASE_DIR / "sample-questions" / "1.txt"
+
+ENDPOINTS = ("process-schematic", "process-observed", "analyze", "answer")
+
+
+def build_request(endpoint: str, i: int, args: argparse.Namespace) -> Dict[str, Any]:
+    """Method, path and body for the i-th request to an endpoint."""
+    if endpoint == "process-schematic":
+        # refresh skips the netlist cache; save=false leaves schematic-output/ and the live session alone
+        return {"method": "GET", "url": "/process-schematic", "params": {"id": 1, "save": "false", "refresh": "true"}}
+    if endpoint == "process-observed":
+        params = {"image_path": str(SAMPLE_STATE_PATH)}
+        if not args.frame_gate:
+            params["force"] = "true"
+        return {"method": "GET", "url": "/process-observed", "params": params}
+    if endpoint == "analyze":
+        return {"method": "GET", "url": "/analyze", "params": {"phrase": str(args.phrase).lower()}}
+    if endpoint == "answer":
+        question = QUESTION_PATH.read_text(encoding="utf-8").strip()
+        if not args.repeat_questions:
+            # Distinct questions, so the answer cache doesn't turn this into a cache benchmark
+            question = f"{question} (request {i})"
+        return {"method": "POST", "url": "/answer", "json": {"question": question}}
+    raise ValueError(f"Unknown endpoint {endpoint!r}. Use: {', '.join(ENDPOINTS)}")
+
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(p / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def rss_kb(pid: int) -> Dict[str, Optional[int]]:
+    """Current and peak resident memory of a process (Linux /proc), in kB."""
+    out: Dict[str, Optional[int]] = {"rss_kb": None, "peak_rss_kb": None}
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                out["rss_kb"] = int(line.split()[1])
+            elif line.startswith("VmHWM:"):
+                out["peak_rss_kb"] = int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return out
+
+
+async def drive(
+    client: httpx.AsyncClient, endpoint: str, args: argparse.Namespace, on_sample: Callable[[], None]
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < args.requests:
+            i = next_index
+            next_index += 1
+            req = build_request(endpoint, i, args)
+            start = time.perf_counter()
+            try:
+                r = await client.request(req.pop("method"), req.pop("url"), **req)
+                status = str(r.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+            on_sample()
+
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    wall = time.perf_counter() - wall_start
+
+    latencies.sort()
+    ms = lambda v: round(v * 1000, 1) if v is not None else None
+    return {
+        "endpoint": endpoint,
+        "requests": len(latencies),
+        "concurrency": args.concurrency,
+        "statuses": statuses,
+        "rps": round(len(latencies) / wall, 2) if wall else None,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+    }
+
+
+def start_process(cmd: List[str], env: Dict[str, str], log: Path) -> subprocess.Popen:
+    return subprocess.Popen(cmd, cwd=BASE_DIR, env=env, stdout=log.open("w"), stderr=subprocess.STDOUT)
+
+
+async def wait_until_up(url: str, proc: Optional[subprocess.Popen], timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if proc is not None and proc.poll() is not None:
+                raise RuntimeError(f"{url} exited with code {proc.returncode} during startup")
+            try:
+                await client.get(url, timeout=1)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    procs: List[subprocess.Popen] = []
+    backend: Optional[subprocess.Popen] = None
+    backend_url = args.backend_url
+    log_dir = Path(args.log_dir)
+    log_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        if backend_url is None:
+            mock = start_process(
+                [sys.executable, "mock_llm.py", "--port", str(args.mock_port), "--latency", str(args.latency),
+                 "--jitter", str(args.jitter), "--error-rate", str(args.error_rate)],
+                dict(os.environ),
+                log_dir / "mock_llm.log",
+            )
+            procs.append(mock)
+            await wait_until_up(f"http://127.0.0.1:{args.mock_port}/stats", mock)
+
+            env = {
+                **os.environ,
+                "OPENROUTER_BASE_URL": f"http://127.0.0.1:{args.mock_port}/v1",
+                "OPENROUTER_API_KEY": "benchmark",
+                # Analysis in-process, and no writes over the tracked sample/output files
+                "ANALYZE_BASE_URL": "",
+                "SESSION_PERSIST": "false",
+            }
+            backend = start_process(
+                [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.backend_port), "--log-level", "warning"],
+                env,
+                log_dir / "backend.log",
+            )
+            procs.append(backend)
+            backend_url = f"http://127.0.0.1:{args.backend_port}"
+            await wait_until_up(f"{backend_url}/", backend)
+
+        memory_before = rss_kb(backend.pid) if backend else {}
+        peak = {"rss_kb": 0}
+
+        def sample_memory() -> None:
+            if backend:
+                current = rss_kb(backend.pid)["rss_kb"] or 0
+                peak["rss_kb"] = max(peak["rss_kb"], current)
+
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        results = []
+        async with httpx.AsyncClient(base_url=backend_url, limits=limits, timeout=args.timeout) as client:
+            for endpoint in args.endpoints:
+                if args.warmup:
+                    await client.request(**build_request(endpoint, -1, args))
+                results.append(await drive(client, endpoint, args, sample_memory))
+
+        memory = None
+        if backend:
+            memory = {
+                "before_kb": memory_before.get("rss_kb"),
+                "after_kb": rss_kb(backend.pid)["rss_kb"],
+                "sampled_peak_kb": peak["rss_kb"],
+                "process_peak_kb": rss_kb(backend.pid)["peak_rss_kb"],
+            }
+        return {"backend": backend_url, "mock_latency_s": args.latency, "results": results, "memory": memory}
+    finally:
+        for p in reversed(procs):
+            p.terminate()
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+
+def print_table(report: Dict[str, Any]) -> None:
+    cols = ("endpoint", "requests", "concurrency", "rps", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+    rows = [[str(r[c]) for c in cols] + [", ".join(f"{k}x{v}" for k, v in r["statuses"].items())] for r in report["results"]]
+    header = list(cols) + ["statuses"]
+    widths = [max(len(h), *(len(row[i]) for row in rows)) for i, h in enumerate(header)]
+    print("  ".join(h.ljust(w) for h, w in zip(header, widths)))
+    for row in rows:
+        print("  ".join(v.ljust(w) for v, w in zip(row, widths)))
+    memory = report.get("memory")
+    if memory:
+        print(
+            f"backend RSS: {memory['before_kb']} kB before, {memory['after_kb']} kB after, "
+            f"peak {memory['process_peak_kb']} kB"
+        )
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the backend against a local mock LLM.")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="Comma-separated subset of: " + ", ".join(ENDPOINTS))
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint.")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.5, help="Mock LLM seconds per completion.")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of mock completions that return 429.")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request client timeout.")
+    parser.add_argument("--phrase", action="store_true", help="Have /analyze reword through the (mock) LLM.")
+    parser.add_argument("--frame-gate", action="store_true", help="Let /process-observed skip unchanged frames (no force).")
+    parser.add_argument("--repeat-questions", action="store_true", help="Ask the same question every time (answer cache hits).")
+    parser.add_argument("--no-warmup", dest="warmup", action="store_false", help="Skip one untimed request per endpoint.")
+    parser.add_argument("--backend-url", default=None, help="Benchmark this running backend instead of starting one.")
+    parser.add_argument("--backend-port", type=int, default=8100)
+    parser.add_argument("--mock-port", type=int, default=9100)
+    parser.add_argument("--log-dir", default=str(BASE_DIR / "benchmark-logs"))
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args(argv)
+    args.endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    for e in args.endpoints:
+        if e not in ENDPOINTS:
+            parser.error(f"unknown endpoint {e!r}")
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(report)
+
+
+if __name__ == "__main__":
+    main()
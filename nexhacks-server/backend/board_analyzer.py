@@ -0,0 +1,332 @@
+# board_analyzer.py
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from breadboard import BOARD, NO_HOLE, Breadboard, Placement
+from netlist import Netlist
+
+# Breadboard connectivity comes from breadboard.BOARD (BOARD_RULES in analyze.py is
+# generated from the same geometry): A-E in the same numbered row form one node,
+# F-J in the same row form another, and each power rail is one node.
+
+POLARIZED_TYPES = {"led", "source"}
+
+# Observed labels look like "resistor_1", "led_2", "power_1" or "R1 (1k resistor)".
+LABEL_TYPE_PREFIXES = {
+    "resistor": "resistor",
+    "res": "resistor",
+    "led": "led",
+    "diode": "led",
+    "power": "source",
+    "source": "source",
+    "battery": "source",
+    "supply": "source",
+    "button": "pushbutton",
+    "pushbutton": "pushbutton",
+    "switch": "pushbutton",
+    "wire": "wire",
+    "jumper": "wire",
+}
+
+SEVERITY_ORDER = {"danger": 0, "warn": 1, "info": 2}
+
+
+def coord_node(coord: str) -> Optional[str]:
+    """'A10' -> 'L10', 'G10' -> 'R10', 'L+3' -> 'L+'. Returns None for UNKNOWN or unreadable coords."""
+    return BOARD.node(coord)
+
+
+def describe_node(node: str) -> str:
+    side = "A–E" if node[0] == "L" else "F–J"
+    if node[1:2] in ("+", "-"):
+        part = f" (part {node[2:]})" if node[2:] else ""
+        return f"the {node[1]} rail beside {side}{part}"
+    return f"row {node[1:]} ({side})"
+
+
+def label_type(label: str) -> str:
+    word = re.split(r"[^a-z]", label.lower().strip(), maxsplit=1)[0]
+    return LABEL_TYPE_PREFIXES.get(word, "unknown")
+
+
+def label_index(label: str) -> int:
+    m = re.search(r"(\d+)", label)
+    return int(m.group(1)) if m else 0
+
+
+def match_components(
+    target_components: List[Dict[str, Any]], observed_components: Dict[str, List[str]]
+) -> Tuple[Dict[str, str], List[str]]:
+    """
+    Map target component ids to observed labels.
+    Explicit ids in the label win ("R1 (1k resistor)" -> R1); the rest are matched
+    by type in reading order (resistor_1 -> first unmatched resistor).
+    Returns (target_id -> observed_label, unmatched observed labels).
+    """
+    matched: Dict[str, str] = {}
+    used = set()
+
+    for comp in target_components:
+        cid = comp["id"]
+        pattern = re.compile(rf"(?<![A-Za-z0-9]){re.escape(cid)}(?![0-9])", re.IGNORECASE)
+        for label in observed_components:
+            if label not in used and pattern.search(label):
+                matched[cid] = label
+                used.add(label)
+                break
+
+    by_type: Dict[str, List[str]] = {}
+    for label in sorted(observed_components, key=lambda l: (label_type(l), label_index(l), l)):
+        if label not in used:
+            by_type.setdefault(label_type(label), []).append(label)
+
+    for comp in target_components:
+        if comp["id"] in matched:
+            continue
+        candidates = by_type.get(comp.get("type", "unknown"), [])
+        if candidates:
+            label = candidates.pop(0)
+            matched[comp["id"]] = label
+            used.add(label)
+
+    unmatched = [l for l in observed_components if l not in used]
+    return matched, unmatched
+
+
+def observed_netlist(
+    observed_components: Dict[str, List[str]],
+    conductors: Optional[Iterable[str]] = None,
+    placements: Optional[Dict[str, Placement]] = None,
+    board: Breadboard = BOARD,
+) -> Netlist:
+    """
+    Breadboard nets of an observed board: each lead sits on its strip, and
+    conductors (every wire, unless given) join the strips they touch.
+    Pass placements if the board has already been parsed.
+    """
+    if placements is None:
+        placements = board.place_all(observed_components)
+    if conductors is None:
+        conductors = [label for label in placements if label_type(label) == "wire"]
+    return Netlist({label: p.nodes for label, p in placements.items()}, conductors=conductors)
+
+
+def _issue(id: str, type: str, severity: str, observed: str, expected: str, locations: List[str], fix: str) -> Dict[str, Any]:
+    return {
+        "id": id,
+        "type": type,
+        "severity": severity,
+        "observed": observed,
+        "expected": expected,
+        "locations": locations,
+        "fix": fix,
+    }
+
+
+def analyze_board(target: Dict[str, Any], observed: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compare an observed board ({"components": {label: [coord, coord]}}) against a
+    target netlist (schematic-output format) and return the validate_analysis_shape
+    structure: confidence, affirmations, issues, next_steps, questions.
+    """
+    target_components = [c for c in target.get("components", []) if isinstance(c, dict) and "id" in c]
+    observed_components = {
+        label: coords for label, coords in observed.get("components", {}).items() if isinstance(coords, list)
+    }
+    # Parse every coordinate once; everything below works on hole ids and strip names
+    placements = BOARD.place_all(observed_components)
+
+    issues: List[Dict[str, Any]] = []
+    affirmations: List[str] = []
+    questions: List[str] = []
+    confidence = 1.0
+
+    matched, unmatched = match_components(target_components, observed_components)
+
+    # Holes used by more than one lead. Issues are keyed by target id like every other
+    # issue, falling back to the observed label for parts that aren't in the schematic.
+    target_of = {label: cid for cid, label in matched.items()}
+    hole_users: Dict[int, List[str]] = {}
+    for label, p in placements.items():
+        for h in p.holes:
+            if h != NO_HOLE:
+                hole_users.setdefault(h, []).append(label)
+    for hole_id, labels in sorted(hole_users.items(), key=lambda kv: BOARD.coord(kv[0])):
+        hole = BOARD.coord(hole_id)
+        if len(labels) > 1:
+            issue_id = next((target_of[l] for l in labels if l in target_of), labels[0])
+            issues.append(_issue(
+                issue_id, "multiple components in same hole", "warn",
+                f"{', '.join(labels)} share hole {hole}",
+                "one lead per hole",
+                [hole],
+                f"Move one of {', '.join(labels)} to a free hole in the same row.",
+            ))
+
+    # Unreadable coordinates
+    for label, p in placements.items():
+        if p.unreadable:
+            confidence -= 0.1
+            questions.append(f"I couldn't read where {label} is placed. Which holes are its leads in?")
+
+    # Wires that are not part of the target netlist join breadboard nodes
+    board_nets = observed_netlist(
+        observed_components, [label for label in unmatched if label_type(label) == "wire"], placements
+    )
+
+    # target_id -> [(net, observed_node, coord)] for every placed lead, in pin order.
+    # Every strip on a wired-together net is reported as the net's lowest strip.
+    placed: Dict[str, List[Tuple[str, Optional[str], str]]] = {}
+    for comp in target_components:
+        cid = comp["id"]
+        if cid not in matched:
+            continue
+        p = placements[matched[cid]]
+        pins = comp.get("pins", [])
+        placed[cid] = [
+            (pins[i], board_nets.representative(p.nodes[i]), p.coords[i])
+            for i in range(min(len(pins), len(p.coords)))
+        ]
+
+    def majority(leads: Dict[str, List[Tuple[str, Optional[str], str]]]) -> Dict[str, str]:
+        votes: Dict[str, Counter] = {}
+        for entries in leads.values():
+            for net, node, _ in entries:
+                if node:
+                    votes.setdefault(net, Counter())[node] += 1
+        return {net: c.most_common(1)[0][0] for net, c in votes.items()}
+
+    # Orient two-lead parts so they agree with where the rest of each net landed.
+    flipped = set()
+    net_home = majority(placed)
+    for cid, entries in placed.items():
+        if len(entries) != 2:
+            continue
+        (n0, o0, c0), (n1, o1, c1) = entries
+        as_given = (net_home.get(n0) == o0) + (net_home.get(n1) == o1)
+        reversed_ = (net_home.get(n0) == o1) + (net_home.get(n1) == o0)
+        if reversed_ > as_given:
+            placed[cid] = [(n0, o1, c1), (n1, o0, c0)]
+            flipped.add(cid)
+    net_home = majority(placed)
+
+    comp_by_id = {c["id"]: c for c in target_components}
+    flagged = set()
+
+    # Missing components
+    for comp in target_components:
+        if comp["id"] in matched:
+            continue
+        flagged.add(comp["id"])
+        pins = comp.get("pins", [])
+        where = [describe_node(net_home[n]) for n in pins if n in net_home]
+        value = f" {comp['value']}" if comp.get("value") else ""
+        fix = f"Place {comp['id']} ({comp.get('type', 'component')}{value})"
+        fix += f" between {' and '.join(where)}." if where else f" across nets {', '.join(pins)}."
+        issues.append(_issue(
+            comp["id"], "missing_component", "warn",
+            "not found on the board",
+            f"{comp.get('type', 'component')}{value} on {', '.join(pins)}",
+            [],
+            fix,
+        ))
+
+    # Polarity
+    for cid in sorted(flipped):
+        comp = comp_by_id[cid]
+        if comp.get("type") not in POLARIZED_TYPES:
+            continue
+        flagged.add(cid)
+        coords = observed_components[matched[cid]]
+        severity = "danger" if comp.get("type") == "source" else "warn"
+        pol = comp.get("polarity") or {}
+        ends = ("anode", "cathode") if "anode" in pol else ("positive", "negative")
+        issues.append(_issue(
+            cid, "polarity", severity,
+            f"{cid} is reversed ({ends[0]} at {coords[0]}, {ends[1]} at {coords[1]})",
+            f"{ends[0]} on {comp['pins'][0]}, {ends[1]} on {comp['pins'][1]}",
+            list(coords[:2]),
+            f"Flip {cid} so its {ends[0]} goes in {coords[1]} and its {ends[1]} in {coords[0]}.",
+        ))
+
+    # Opens: a lead that did not land where the rest of its net is
+    for cid, entries in placed.items():
+        for net, node, coord in entries:
+            if node is None or net not in net_home or net_home[net] == node:
+                continue
+            others = [
+                other for other, es in placed.items()
+                if other != cid and any(n == net and o == net_home[net] for n, o, _ in es)
+            ]
+            flagged.add(cid)
+            issues.append(_issue(
+                cid, "open", "warn",
+                f"{cid} lead at {coord} is in {describe_node(node)}",
+                f"on {net} with {', '.join(others) or 'the rest of the net'} in {describe_node(net_home[net])}",
+                [coord],
+                f"Move {cid}'s lead from {coord} into {describe_node(net_home[net])}.",
+            ))
+
+    # Shorts: one breadboard node carrying more than one target net
+    nets_at_node: Dict[str, List[str]] = {}
+    for net, node in net_home.items():
+        nets_at_node.setdefault(node, []).append(net)
+    sources = [c for c in target_components if c.get("type") == "source" and len(c.get("pins", [])) >= 2]
+    for node, nets in sorted(nets_at_node.items()):
+        if len(nets) < 2:
+            continue
+        shorted = set(nets)
+        severity = "danger" if any(set(s["pins"][:2]) <= shorted for s in sources) else "warn"
+        involved = sorted({
+            cid for cid, es in placed.items() for n, o, _ in es if o == node
+        })
+        locations = sorted({
+            coord for es in placed.values() for n, o, coord in es if o == node
+        })
+        flagged.update(involved)
+        issues.append(_issue(
+            involved[0] if involved else nets[0], "short", severity,
+            f"{', '.join(sorted(nets))} are all connected in {describe_node(node)} ({', '.join(involved)})",
+            f"{', '.join(sorted(nets))} on separate rows",
+            locations,
+            f"Separate {' and '.join(sorted(nets))}: move leads so each net has its own row.",
+        ))
+
+    # Extra components
+    for label in unmatched:
+        if label_type(label) == "wire":
+            continue
+        confidence -= 0.05
+        issues.append(_issue(
+            label, "extra_component", "info",
+            f"{label} at {', '.join(observed_components[label])}",
+            "not in the schematic",
+            [c for c, h in zip(placements[label].coords, placements[label].holes) if h != NO_HOLE],
+            f"Remove {label} unless it belongs to the circuit.",
+        ))
+        if label_type(label) == "unknown":
+            questions.append(f"What part is {label}?")
+
+    for comp in target_components:
+        cid = comp["id"]
+        if cid in matched and cid not in flagged:
+            coords = observed_components[matched[cid]]
+            affirmations.append(f"{cid} is placed at {', '.join(coords)} and connected correctly.")
+
+    issues.sort(key=lambda i: SEVERITY_ORDER.get(i["severity"], 3))
+
+    next_steps: List[str] = []
+    for issue in issues:
+        if issue["fix"] not in next_steps:
+            next_steps.append(issue["fix"])
+    if not issues:
+        next_steps.append("Everything matches the schematic. Double-check polarity, then power the circuit.")
+
+    return {
+        "confidence": round(max(0.1, min(1.0, confidence)), 2),
+        "affirmations": affirmations,
+        "issues": issues,
+        "next_steps": next_steps[:5],
+        "questions": questions,
+    }
@@ -0,0 +1,82 @@
+# board_calibration.py
+import os
+import time
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+import board_detector
+from board_detector import DetectionError, Frame, GridRegistration
+
+logger = logging.getLogger(__name__)
+
+# "auto" calibrates whenever OpenCV is installed; "off" never does
+BOARD_CALIBRATION = os.getenv("BOARD_CALIBRATION", "auto").lower()
+# A saved registration is kept while this share of the frame's holes still land on it...
+BOARD_DRIFT_MIN_FIT = float(os.getenv("BOARD_DRIFT_MIN_FIT", "0.6"))
+# ...at a median distance (in hole pitches) below this
+BOARD_DRIFT_MAX_OFFSET = float(os.getenv("BOARD_DRIFT_MAX_OFFSET", "0.15"))
+
+
+def enabled() -> bool:
+    return BOARD_CALIBRATION != "off" and board_detector.available()
+
+
+class BoardCalibration:
+    """
+    The grid registration for one bench's camera. The phone is mounted and barely
+    moves, so the board is registered once and reused; each new frame only runs
+    hole detection and a drift check against the saved homography, and the grid is
+    re-fitted when that fails.
+    """
+
+    def __init__(self):
+        self.registration: Optional[GridRegistration] = None
+        self.calibrated_at: Optional[float] = None
+        self.frames = 0
+        self.calibrations = 0
+        self.last_drift: Optional[Dict[str, float]] = None
+        self.last_error: Optional[str] = None
+
+    def update(self, frame: Frame) -> Tuple[GridRegistration, Dict[str, Any]]:
+        """
+        Registration for this frame: the saved one if it still fits, else a new one.
+        Raises DetectionError if the board can't be registered at all.
+        """
+        self.frames += 1
+        start = time.perf_counter()
+        if self.registration is not None:
+            self.last_drift = board_detector.drift(self.registration, frame)
+            if self.last_drift["fit"] >= BOARD_DRIFT_MIN_FIT and self.last_drift["offset"] <= BOARD_DRIFT_MAX_OFFSET:
+                return self.registration, {"calibration": "reused", "drift": self.last_drift,
+                                           "calibration_ms": round((time.perf_counter() - start) * 1000, 1)}
+            logger.info(f"[board-calibration] Drift {self.last_drift}, re-registering the grid")
+
+        try:
+            registration = frame.register()
+        except DetectionError as e:
+            self.last_error = str(e)
+            raise
+        self.registration = registration
+        self.calibrated_at = time.time()
+        self.calibrations += 1
+        self.last_error = None
+        return registration, {"calibration": "new", "drift": self.last_drift,
+                              "calibration_ms": round((time.perf_counter() - start) * 1000, 1)}
+
+    def reset(self) -> None:
+        self.registration = None
+        self.last_drift = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calibrated": self.registration is not None,
+            "calibrated_at": self.calibrated_at,
+            "registration": self.registration.to_dict() if self.registration else None,
+            "crop_box": board_detector.board_crop_box(self.registration) if self.registration else None,
+            "frames": self.frames,
+            "calibrations": self.calibrations,
+            "last_drift": self.last_drift,
+            "last_error": self.last_error,
+            "drift_min_fit": BOARD_DRIFT_MIN_FIT,
+            "drift_max_offset": BOARD_DRIFT_MAX_OFFSET,
+        }
@@ -0,0 +1,701 @@
+# board_detector.py
+"""
+Local, on-CPU alternative to the vision LLM for /process-observed. Turns a top-down
+breadboard photo into the same {"components": {label: [coord, coord]}} shape:
+
+1. detect_holes     - empty holes are small dark squares on the white board
+2. register_grid    - fit a homography from board coordinates (row number, lane)
+                      to pixels using the detected hole lattice
+3. classify_holes   - every predicted hole is empty, holds a lead, or is covered
+                      (heuristic features, or an ONNX patch classifier via cv2.dnn)
+4. components       - group lead holes by the foreground blob (body/wire) they touch
+
+Needs OpenCV (opencv-python-headless) and numpy, imported lazily so the rest of the
+backend runs without them.
+
+Where it stops working (why OBSERVED_MODE=local* is opt-in and falls back to the LLM):
+- The photo must be roughly top-down, with both 5-lane terminal strips in view and
+  row numbers increasing to the right. Oblique or partial views such as
+  camera-capture/uploads/latest.jpg raise DetectionError ("Expected two 5-lane
+  terminal strips").
+- Leads are only seen where the hole around them is visible. Legs hidden under a
+  component body or bent along the board are lost or moved by a few rows; on
+  sample-states/1.png the grid registers but two leads come back UNKNOWN
+  (confidence 0.224), and the reading doesn't match sample-observed/1.json.
+- Component types come from colour alone (resistor body, LED, wire, off-board supply).
+
+    python board_detector.py sample-states/1.png [--debug out.png] [--rectified board.png]
+"""
+import os
+import json
+import time
+import logging
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from breadboard import GEOMETRIES, BREADBOARD_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Frames are processed with the long edge at this many pixels
+LOCAL_DETECTOR_MAX_EDGE = int(os.getenv("LOCAL_DETECTOR_MAX_EDGE", "1000"))
+# Optional ONNX patch classifier: input N x 1 x 24 x 24 grayscale in [0, 1], output
+# N x 3 scores for (empty, lead, covered). Without it the heuristic classifier is used.
+LOCAL_DETECTOR_ONNX = os.getenv("LOCAL_DETECTOR_ONNX", "")
+# How much darker than its surroundings (0-255) a pixel must be to count as part of a hole
+HOLE_DARKNESS = int(os.getenv("LOCAL_DETECTOR_HOLE_DARKNESS", "25"))
+
+PATCH_SIZE = 24
+HOLE_STATES = ("empty", "lead", "covered")
+
+# Lanes across the board from the top of a photo taken with row numbers increasing to
+# the right and F-J above the trench, in hole pitches from lane J. Terminal lanes are
+# fixed by the standard 0.1" grid (the trench is three pitches); rail lanes are
+# measured per frame, since rail offsets differ between board makes.
+TOP_LANES = ("J", "I", "H", "G", "F")
+BOTTOM_LANES = ("E", "D", "C", "B", "A")
+TERMINAL_LANE_POS = {**{c: float(i) for i, c in enumerate(TOP_LANES)}, **{c: 7.0 + i for i, c in enumerate(BOTTOM_LANES)}}
+TOP_RAILS = ("R-", "R+")  # outer, inner (beside F-J)
+BOTTOM_RAILS = ("L-", "L+")  # inner, outer (beside A-E)
+# Rail holes come in groups of five with one skipped position
+RAIL_PERIOD = 6
+
+
+class DetectionError(Exception):
+    """The frame could not be read as a breadboard (no grid, too few holes, ...)."""
+
+
+def _cv():
+    try:
+        import cv2
+        import numpy as np
+    except ImportError as e:
+        raise DetectionError(
+            f"Local detection needs OpenCV and numpy ({e.name} is not installed): "
+            "pip install opencv-python-headless numpy"
+        ) from e
+    return cv2, np
+
+
+def encode_image(image: Any, ext: str = ".png") -> bytes:
+    """Encode an OpenCV image (e.g. from rectify()) to bytes."""
+    cv2, _ = _cv()
+    ok, encoded = cv2.imencode(ext, image)
+    if not ok:
+        raise DetectionError(f"Could not encode image as {ext}")
+    return encoded.tobytes()
+
+
+def available() -> bool:
+    try:
+        _cv()
+    except DetectionError:
+        return False
+    return True
+
+
+def decode_image(image_bytes: bytes):
+    """BGR image with EXIF orientation applied."""
+    cv2, np = _cv()
+    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise DetectionError("Could not decode image")
+    return img
+
+
+def working_scale(img, max_edge: int = LOCAL_DETECTOR_MAX_EDGE) -> float:
+    return min(1.0, max_edge / max(img.shape[:2]))
+
+
+def detect_holes(gray, darkness: int = HOLE_DARKNESS):
+    """
+    Centroids (N x 2, working-scale pixels) of hole-like blobs: small, roughly square
+    and clearly darker than a box-blurred background. Also returns the label image
+    and the ids of the accepted blobs, so callers can mask the holes out.
+    """
+    cv2, np = _cv()
+    background = cv2.blur(gray, (15, 15))
+    dark = ((background.astype(np.int16) - gray) > darkness).astype(np.uint8)
+    n, labels, stats, centroids = cv2.connectedComponentsWithStats(dark)
+    w, h, area = stats[:, 2], stats[:, 3], stats[:, 4]
+    keep = (area >= 3) & (area <= 40) & (w <= 8) & (h <= 8) & (np.abs(w - h) <= 3)
+    keep[0] = False
+    return centroids[keep], labels, np.flatnonzero(keep)
+
+
+def _lattice_axes(points) -> Tuple[float, float]:
+    """Hole pitch (pixels) and grid rotation (radians) from nearest-neighbour vectors."""
+    _, np = _cv()
+    # A few hundred holes are plenty for a median; keeps this O(n) instead of O(n^2)
+    sample = points[:: max(1, len(points) // 200)]
+    d = np.linalg.norm(sample[:, None, :] - points[None, :, :], axis=2)
+    d[d == 0] = np.inf
+    vectors = points[d.argmin(axis=1)] - sample
+    lengths = np.linalg.norm(vectors, axis=1)
+    pitch = float(np.median(lengths))
+    # Only true neighbours vote on the angle, not noise blobs next to a hole
+    vectors = vectors[np.abs(lengths - pitch) < pitch * 0.2]
+    angles = np.arctan2(vectors[:, 1], vectors[:, 0]) % (np.pi / 2)
+    angles = np.where(angles > np.pi / 4, angles - np.pi / 2, angles)
+    return pitch, float(np.median(angles))
+
+
+def _rotate(points, theta: float):
+    _, np = _cv()
+    c, s = np.cos(-theta), np.sin(-theta)
+    return points @ np.array([[c, s], [-s, c]])
+
+
+def _lanes(rotated, pitch: float, min_holes: int = 8) -> List[Tuple[float, Any]]:
+    """Split points into horizontal lanes on gaps in y. Returns (mean y, member indices)."""
+    _, np = _cv()
+    order = np.argsort(rotated[:, 1])
+    ys = rotated[order, 1]
+    breaks = np.flatnonzero(np.diff(ys) > pitch * 0.5) + 1
+    return [(float(ys[g].mean()), order[g]) for g in np.split(np.arange(len(ys)), breaks) if len(g) >= min_holes]
+
+
+class GridRegistration:
+    """
+    Homography from board space (x = row number, y = lane position in pitches from
+    lane J) to pixels of the original frame, plus the lane layout it was fitted with.
+    """
+
+    def __init__(self, homography, lane_pos: Dict[str, float], rail_phase: Dict[str, float], rows: int,
+                 pitch_px: float, angle: float, inliers: int, residual_px: float, frame_size: Tuple[int, int]):
+        self.homography = homography
+        self.lane_pos = lane_pos
+        self.rail_phase = rail_phase
+        self.rows = rows
+        self.pitch_px = pitch_px
+        self.angle = angle
+        self.inliers = inliers
+        self.residual_px = residual_px
+        self.frame_size = frame_size
+
+    def to_image(self, board_points):
+        cv2, np = _cv()
+        pts = np.asarray(board_points, dtype=np.float64).reshape(-1, 1, 2)
+        return cv2.perspectiveTransform(pts, self.homography).reshape(-1, 2)
+
+    def to_board(self, image_points):
+        cv2, np = _cv()
+        pts = np.asarray(image_points, dtype=np.float64).reshape(-1, 1, 2)
+        return cv2.perspectiveTransform(pts, np.linalg.inv(self.homography)).reshape(-1, 2)
+
+    def hole_positions(self) -> Tuple[List[str], Any]:
+        """Every hole on the board ("A1".."J63", "R+12", ...) and its pixel position."""
+        coords, board = [], []
+        for lane, y in self.lane_pos.items():
+            for row in range(1, self.rows + 1):
+                if lane in self.rail_phase and (row - self.rail_phase[lane]) % RAIL_PERIOD == 0:
+                    continue  # the skipped position between two groups of rail holes
+                coords.append(f"{lane}{row}")
+                board.append((row, y))
+        return coords, self.to_image(board)
+
+    @property
+    def confidence(self) -> float:
+        # Share of the terminal holes that fit the lattice, discounted by fit error
+        expected = self.rows * len(TERMINAL_LANE_POS)
+        return round(min(1.0, self.inliers / expected) / (1 + self.residual_px / max(self.pitch_px, 1e-6)), 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "homography": [[round(v, 6) for v in row] for row in self.homography.tolist()],
+            "lane_pos": {k: round(v, 3) for k, v in self.lane_pos.items()},
+            "pitch_px": round(self.pitch_px, 2),
+            "angle_deg": round(float(self.angle) * 57.29578, 2),
+            "inliers": self.inliers,
+            "residual_px": round(self.residual_px, 2),
+            "confidence": self.confidence,
+        }
+
+
+def register_grid(points, scale: float, frame_size: Tuple[int, int], rows: Optional[int] = None) -> GridRegistration:
+    """
+    Fit the board lattice to detected hole centroids (working-scale pixels).
+    The two five-lane blocks are the terminal strips; the leftmost terminal column
+    seen is taken as row 1.
+    """
+    cv2, np = _cv()
+    rows = rows or GEOMETRIES.get(BREADBOARD_SIZE, GEOMETRIES["full"]).rows
+    if len(points) < 40:
+        raise DetectionError(f"Only {len(points)} holes found; is the breadboard in view?")
+    pitch, theta = _lattice_axes(points)
+    rotated = _rotate(points, theta)
+    lanes = _lanes(rotated, pitch)
+
+    # Group lanes one pitch apart into blocks: rails (2 lanes) and terminal strips (5)
+    blocks: List[List[Tuple[float, Any]]] = []
+    for lane in lanes:
+        if blocks and lane[0] - blocks[-1][-1][0] < pitch * 1.5:
+            blocks[-1].append(lane)
+        else:
+            blocks.append([lane])
+    terminal = [i for i, b in enumerate(blocks) if len(b) == 5]
+    if len(terminal) != 2 or terminal[1] != terminal[0] + 1:
+        raise DetectionError(f"Expected two 5-lane terminal strips, found lane blocks {[len(b) for b in blocks]}")
+    top, bottom = blocks[terminal[0]], blocks[terminal[1]]
+
+    lane_members = dict(zip(TOP_LANES + BOTTOM_LANES, top + bottom))
+    idx = np.concatenate([members for _, members in lane_members.values()])
+    lane_y = np.concatenate([np.full(len(m), TERMINAL_LANE_POS[lane]) for lane, (_, m) in lane_members.items()])
+    pixels = points[idx] / scale
+    x0 = rotated[idx, 0].min()
+
+    # Perspective stretches the pitch across the frame, so a single pitch only numbers
+    # the rows near the left edge reliably. Fit there, then renumber every hole through
+    # the fitted homography and refit, widening the window each round.
+    row_guess = np.rint((rotated[idx, 0] - x0) / pitch) + 1
+    window = 16
+    homography = None
+    for _ in range(6):
+        use = (row_guess >= 1) & (row_guess <= min(window, rows))
+        if use.sum() < 20:
+            raise DetectionError("Too few holes to fit the grid")
+        src = np.stack([row_guess[use], lane_y[use]], axis=1)
+        homography, mask = cv2.findHomography(src, pixels[use], cv2.RANSAC, ransacReprojThreshold=pitch / scale * 0.3)
+        if homography is None:
+            raise DetectionError("Could not fit a homography to the hole grid")
+        board = cv2.perspectiveTransform(pixels.reshape(-1, 1, 2), np.linalg.inv(homography)).reshape(-1, 2)
+        row_guess = np.rint(board[:, 0])
+        if window >= rows:
+            break
+        window *= 2
+
+    src = np.stack([row_guess, lane_y], axis=1)
+    projected = cv2.perspectiveTransform(src.reshape(-1, 1, 2), homography).reshape(-1, 2)
+    errors = np.linalg.norm(projected - pixels, axis=1)
+    inliers = (errors < pitch / scale * 0.3) & (row_guess >= 1) & (row_guess <= rows)
+    residual = float(np.median(errors[inliers])) if inliers.any() else float("inf")
+
+    reg = GridRegistration(homography, dict(TERMINAL_LANE_POS), {}, rows, pitch / scale, theta,
+                           int(inliers.sum()), residual, frame_size)
+
+    # Rails: lane position and group phase measured from their holes in board space
+    rail_blocks = [(blocks[terminal[0] - 1], TOP_RAILS)] if terminal[0] > 0 else []
+    if terminal[1] + 1 < len(blocks):
+        rail_blocks.append((blocks[terminal[1] + 1], BOTTOM_RAILS))
+    for block, names in rail_blocks:
+        if len(block) != 2:
+            continue
+        for (_, idx), name in zip(block, names):
+            board = reg.to_board(points[idx] / scale)
+            reg.lane_pos[name] = float(np.median(board[:, 1]))
+            cols = np.rint(board[:, 0]).astype(int)
+            counts = np.bincount(cols % RAIL_PERIOD, minlength=RAIL_PERIOD)
+            reg.rail_phase[name] = float(counts.argmin())
+    return reg
+
+
+class _OnnxClassifier:
+    def __init__(self, path: str):
+        cv2, _ = _cv()
+        self.net = cv2.dnn.readNetFromONNX(path)
+
+    def __call__(self, patches):
+        cv2, np = _cv()
+        blob = patches.astype(np.float32)[:, None, :, :] / 255.0
+        self.net.setInput(blob)
+        return self.net.forward().argmax(axis=1)
+
+
+_onnx: Optional[_OnnxClassifier] = None
+
+
+def _classifier() -> Optional[_OnnxClassifier]:
+    global _onnx
+    if LOCAL_DETECTOR_ONNX and _onnx is None:
+        _onnx = _OnnxClassifier(LOCAL_DETECTOR_ONNX)
+        logger.info(f"[board-detector] Loaded hole classifier {LOCAL_DETECTOR_ONNX}")
+    return _onnx
+
+
+def _board_outline(reg: GridRegistration, scale: float):
+    """Corners of the area spanned by the board's rows and lanes, in working-scale pixels."""
+    _, np = _cv()
+    lanes = list(reg.lane_pos.values())
+    corners = reg.to_image([
+        (0.5, min(lanes) - 0.5), (reg.rows + 0.5, min(lanes) - 0.5),
+        (reg.rows + 0.5, max(lanes) + 0.5), (0.5, max(lanes) + 0.5),
+    ]) * scale
+    return np.rint(corners).astype(np.int32)
+
+
+def foreground_mask(img_small, scale: float, reg: GridRegistration, hole_labels, hole_ids):
+    """
+    Pixels on the board that are not bare board: saturated (bodies, insulation), very
+    dark, or darker than the surrounding board but not part of an empty hole. The
+    printed rail stripes, row numbers and anything off the board are removed.
+    """
+    cv2, np = _cv()
+    hsv = cv2.cvtColor(img_small, cv2.COLOR_BGR2HSV)
+    gray = cv2.cvtColor(img_small, cv2.COLOR_BGR2GRAY)
+    background = cv2.blur(gray, (31, 31)).astype(np.int16)
+    holes = np.isin(hole_labels, hole_ids)
+    mask = ((hsv[:, :, 1] > 70) | (gray < 60) | (((background - gray) > 35) & ~holes)).astype(np.uint8)
+
+    pitch = reg.pitch_px * scale
+    # Rail stripes: long and only a couple of pixels thick (a lying wire is thicker)
+    long_kernel = np.ones((1, max(3, int(pitch * 3))), np.uint8)
+    thick_kernel = np.ones((max(3, int(pitch * 0.3)), 1), np.uint8)
+    stripes = cv2.morphologyEx(mask, cv2.MORPH_OPEN, long_kernel) & ~cv2.morphologyEx(mask, cv2.MORPH_OPEN, thick_kernel)
+    mask &= ~stripes
+
+    # Only the board itself: the area spanned by its lanes and rows
+    board = np.zeros_like(mask)
+    cv2.fillConvexPoly(board, _board_outline(reg, scale), 1)
+    mask &= board
+
+    # Drop specks (hole edges, digits) smaller than about a quarter of a hole cell
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(mask)
+    keep = stats[:, 4] >= max(4, int(pitch * pitch * 0.25))
+    keep[0] = False
+    return keep[labels].astype(np.uint8)
+
+
+def classify_holes(img_small, scale: float, reg: GridRegistration, hole_points, mask) -> Dict[str, str]:
+    """State of every hole on the board: empty, lead (something plugged in) or covered."""
+    cv2, np = _cv()
+    coords, positions = reg.hole_positions()
+    positions = positions * scale
+    pitch = reg.pitch_px * scale
+    h, w = mask.shape
+    inside = (positions[:, 0] >= 0) & (positions[:, 0] < w) & (positions[:, 1] >= 0) & (positions[:, 1] < h)
+
+    # Holes we can see are empty, whatever the classifier would say
+    seen = np.full(mask.shape, 255, np.uint8)
+    for x, y in np.rint(hole_points).astype(int):
+        seen[min(h - 1, y), min(w - 1, x)] = 0
+    to_hole = cv2.distanceTransform(seen, cv2.DIST_L2, 3)
+    px = np.clip(np.rint(positions).astype(int), 0, [w - 1, h - 1])
+    visible = to_hole[px[:, 1], px[:, 0]] < pitch * 0.35
+
+    states: Dict[str, str] = {}
+    classifier = _classifier()
+    if classifier is not None:
+        gray = cv2.cvtColor(img_small, cv2.COLOR_BGR2GRAY)
+        half = PATCH_SIZE // 2
+        padded = cv2.copyMakeBorder(gray, half, half, half, half, cv2.BORDER_REPLICATE)
+        patches = np.stack([
+            padded[int(y):int(y) + PATCH_SIZE, int(x):int(x) + PATCH_SIZE]
+            for x, y in np.clip(positions, 0, [w - 1, h - 1])
+        ])
+        predicted = classifier(patches)
+
+    # Distance to the nearest bare-board pixel: large inside a cable or body lying
+    # over the hole, small on a lead or thin wire ending there
+    depth = cv2.distanceTransform(mask, cv2.DIST_L2, 3)
+    r_in, r_out = max(1, int(pitch * 0.3)), max(2, int(pitch * 0.9))
+    for i, coord in enumerate(coords):
+        if not inside[i] or visible[i]:
+            states[coord] = "empty" if inside[i] else "covered"
+            continue
+        if classifier is not None:
+            states[coord] = HOLE_STATES[int(predicted[i])]
+            continue
+        x, y = int(round(positions[i, 0])), int(round(positions[i, 1]))
+        ring = mask[max(0, y - r_out):y + r_out + 1, max(0, x - r_out):x + r_out + 1]
+        centre = mask[max(0, y - r_in):y + r_in + 1, max(0, x - r_in):x + r_in + 1]
+        around = float(ring.mean()) if ring.size else 0.0
+        # A lead ends at its hole: something on top of it but bare board beside it.
+        # Board all round means we simply missed the hole; foreground all round means
+        # a body or cable lies over it.
+        if centre.mean() < 0.2 and around < 0.1:
+            states[coord] = "empty"
+        elif around > 0.8 or depth[min(h - 1, y), min(w - 1, x)] > pitch * 0.45:
+            states[coord] = "covered"
+        else:
+            states[coord] = "lead"
+    return states
+
+
+def _component_type(hsv, blob) -> str:
+    _, np = _cv()
+    hsv = hsv[blob]
+    hue, sat, val = hsv[:, 0].astype(int), hsv[:, 1].astype(int), hsv[:, 2].astype(int)
+    ys, xs = np.nonzero(blob)
+    if len(xs) == 0:
+        return "wire"
+    width, height = int(np.ptp(xs)) + 1, int(np.ptp(ys)) + 1
+    extent = max(width, height)
+    fill = len(xs) / float(width * height)
+    red = ((hue < 8) | (hue > 170)) & (sat > 120) & (val > 90)
+    tan = (hue >= 8) & (hue <= 25) & (sat > 50) & (val > 90)
+    if red.mean() > 0.4 and fill > 0.5 and extent < 40:
+        return "led"
+    if tan.mean() > 0.25:
+        return "resistor"
+    return "wire"
+
+
+def find_components(img_small, scale: float, reg: GridRegistration, states: Dict[str, str], mask) -> Dict[str, List[str]]:
+    """
+    Attach each lead hole to the foreground blob it touches:
+    - a blob running off the board (a supply or meter lead) plugs in at the lead
+      furthest from where it enters; these become power_N, paired in reading order
+    - any other blob is one component between its two leads furthest apart; with one
+      lead, the nearest unclaimed lead hole is its other end (thin resistor and LED
+      legs often don't show in the mask), or "UNKNOWN"
+    """
+    cv2, np = _cv()
+    leads = [c for c, s in states.items() if s == "lead"]
+    if not leads:
+        return {}
+    pitch = reg.pitch_px * scale
+    lead_px = reg.to_image([_board_xy(c, reg) for c in leads]) * scale
+    # Bridge short gaps between a lead and the body it belongs to
+    grown = cv2.dilate(mask, np.ones((3, 3), np.uint8), iterations=max(1, int(pitch * 0.25)))
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(grown)
+    h, w = labels.shape
+    hsv = cv2.cvtColor(img_small, cv2.COLOR_BGR2HSV)
+    edge = np.zeros_like(mask)
+    cv2.polylines(edge, [_board_outline(reg, scale)], True, 1, thickness=3)
+
+    by_blob: Dict[int, List[int]] = {}
+    unclaimed = []
+    for i, (x, y) in enumerate(lead_px):
+        blob = int(labels[min(h - 1, max(0, int(y))), min(w - 1, max(0, int(x)))])
+        if blob:
+            by_blob.setdefault(blob, []).append(i)
+        else:
+            unclaimed.append(i)
+
+    found = []  # (reading-order key, kind, coords)
+    off_board = []
+    for blob_id, members in by_blob.items():
+        # Work inside the blob's bounding box rather than on full-frame masks
+        x0, y0, bw, bh = stats[blob_id, :4]
+        box = (slice(y0, y0 + bh), slice(x0, x0 + bw))
+        blob = labels[box] == blob_id
+        pts = lead_px[members]
+        entry = np.argwhere(blob & (edge[box] > 0))
+        if len(entry):
+            ey, ex = entry.mean(axis=0) + (y0, x0)
+            far = members[int(np.linalg.norm(pts - (ex, ey), axis=1).argmax())]
+            off_board.append(far)
+            continue
+        if len(members) >= 2:
+            d = np.linalg.norm(pts[:, None, :] - pts[None, :, :], axis=2)
+            a, b = np.unravel_index(d.argmax(), d.shape)
+            ends = [members[a], members[b]]
+        else:
+            ends = [members[0]]
+            if unclaimed:
+                d = np.linalg.norm(lead_px[unclaimed] - lead_px[members[0]], axis=1)
+                if d.min() < pitch * 8:
+                    ends.append(unclaimed.pop(int(d.argmin())))
+        kind = _component_type(hsv[box], blob & (mask[box] > 0))
+        found.append((ends, kind))
+
+    # Off-board leads pair up into supplies
+    off_board.sort(key=lambda i: (lead_px[i][1], lead_px[i][0]))
+    for k in range(0, len(off_board), 2):
+        found.append((off_board[k:k + 2], "power"))
+
+    # Number in reading order (top-to-bottom, left-to-right), like the vision prompt asks for
+    ordered = []
+    for ends, kind in found:
+        ends = sorted(ends, key=lambda i: (lead_px[i][1], lead_px[i][0]))
+        coords = [leads[i] for i in ends] + ["UNKNOWN"] * (2 - len(ends))
+        ordered.append(((lead_px[ends[0]][1], lead_px[ends[0]][0]), kind, coords))
+    ordered.sort(key=lambda f: f[0])
+    counts: Dict[str, int] = {}
+    components = {}
+    for _, kind, coords in ordered:
+        counts[kind] = counts.get(kind, 0) + 1
+        components[f"{kind}_{counts[kind]}"] = coords
+    return components
+
+
+def _board_xy(coord: str, reg: GridRegistration) -> Tuple[float, float]:
+    lane = coord[:2] if coord[:2] in reg.lane_pos else coord[0]
+    return float(coord[len(lane):]), reg.lane_pos[lane]
+
+
+class Frame:
+    """A decoded frame, its working-scale copy and the holes found in it."""
+
+    def __init__(self, image_bytes: bytes):
+        cv2, _ = _cv()
+        start = time.perf_counter()
+        self.image = decode_image(image_bytes)
+        self.scale = working_scale(self.image)
+        if self.scale < 1:
+            self.small = cv2.resize(self.image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        else:
+            self.small = self.image
+        gray = cv2.cvtColor(self.small, cv2.COLOR_BGR2GRAY)
+        self.hole_points, self.hole_labels, self.hole_ids = detect_holes(gray)
+        self.seconds = time.perf_counter() - start
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.image.shape[1], self.image.shape[0]
+
+    def register(self) -> GridRegistration:
+        return register_grid(self.hole_points, self.scale, self.size)
+
+
+def drift(reg: GridRegistration, frame: Frame) -> Dict[str, float]:
+    """
+    How well a saved registration still explains this frame's holes: the share of
+    holes that land on a lattice point (within 0.3 pitch), and the median distance
+    to it in pitches. A bumped phone shows up as both getting worse.
+    """
+    _, np = _cv()
+    if frame.size != reg.frame_size or len(frame.hole_points) == 0:
+        return {"fit": 0.0, "offset": float("inf")}
+    board = reg.to_board(frame.hole_points / frame.scale)
+    lanes = np.array(sorted(reg.lane_pos.values()))
+    dy = np.abs(board[:, 1][:, None] - lanes[None, :]).min(axis=1)
+    dx = np.abs(board[:, 0] - np.rint(board[:, 0]))
+    offset = np.hypot(dx, dy)
+    return {"fit": round(float((offset < 0.3).mean()), 3), "offset": round(float(np.median(offset)), 3)}
+
+
+def board_crop_box(
+    reg: GridRegistration, margin: float = 1.0, rows: Optional[Tuple[int, int]] = None
+) -> Tuple[float, float, float, float]:
+    """
+    The board (plus margin, in pitches) as left, top, right, bottom fractions of the
+    frame. rows=(first, last) keeps only that span of rows, across every lane.
+    """
+    _, np = _cv()
+    lanes = list(reg.lane_pos.values())
+    first, last = rows or (1, reg.rows)
+    corners = reg.to_image([
+        (first - margin, min(lanes) - margin), (last + margin, min(lanes) - margin),
+        (last + margin, max(lanes) + margin), (first - margin, max(lanes) + margin),
+    ])
+    w, h = reg.frame_size
+    left, top = np.clip(corners.min(axis=0) / (w, h), 0, 1)
+    right, bottom = np.clip(corners.max(axis=0) / (w, h), 0, 1)
+    return float(left), float(top), float(right), float(bottom)
+
+
+def rectify(frame: Frame, reg: GridRegistration, px_per_pitch: int = 20, margin: float = 1.0):
+    """
+    Warp the frame to a straight, top-down board: hole (row, lane) lands at
+    ((row - 1 + margin) * px_per_pitch, (lane - top + margin) * px_per_pitch).
+    """
+    cv2, np = _cv()
+    top = min(reg.lane_pos.values())
+    bottom = max(reg.lane_pos.values())
+    # board -> rectified pixels, composed with pixels -> board
+    to_rect = np.array([
+        [px_per_pitch, 0, (margin - 1) * px_per_pitch],
+        [0, px_per_pitch, (margin - top) * px_per_pitch],
+        [0, 0, 1],
+    ])
+    size = (int((reg.rows - 1 + 2 * margin) * px_per_pitch), int((bottom - top + 2 * margin) * px_per_pitch))
+    return cv2.warpPerspective(frame.image, to_rect @ np.linalg.inv(reg.homography), size, flags=cv2.INTER_AREA)
+
+
+def rectified_hole_centres(reg: GridRegistration, px_per_pitch: int = 20, margin: float = 1.0) -> Dict[str, Tuple[int, int]]:
+    """Pixel centre of every hole in the output of rectify() with the same settings."""
+    top = min(reg.lane_pos.values())
+    coords, _ = reg.hole_positions()
+    centres = {}
+    for coord in coords:
+        row, lane = _board_xy(coord, reg)
+        centres[coord] = (int(round((row - 1 + margin) * px_per_pitch)), int(round((lane - top + margin) * px_per_pitch)))
+    return centres
+
+
+def hole_crops(rectified, centres: Dict[str, Tuple[int, int]], px_per_pitch: int = 20) -> Dict[str, Any]:
+    """One pitch-sized square around each hole of a rectified board."""
+    half = px_per_pitch // 2
+    h, w = rectified.shape[:2]
+    return {
+        coord: rectified[max(0, y - half):min(h, y + half), max(0, x - half):min(w, x + half)]
+        for coord, (x, y) in centres.items()
+    }
+
+
+def hole_signatures(frame: Frame, reg: GridRegistration, px_per_pitch: int = 12, cells: int = 3) -> Tuple[List[str], Any]:
+    """
+    A cells x cells grayscale thumbnail of every hole on the rectified board, as
+    (coords, float32 array of shape (holes, cells, cells)). Comparing these between
+    two frames on the same registration shows which holes changed.
+    """
+    cv2, np = _cv()
+    gray = cv2.cvtColor(rectify(frame, reg, px_per_pitch), cv2.COLOR_BGR2GRAY).astype(np.float32)
+    centres = rectified_hole_centres(reg, px_per_pitch)
+    crops = hole_crops(gray, centres, px_per_pitch)
+    coords = list(crops)
+    thumbs = np.zeros((len(coords), cells, cells), np.float32)
+    for i, coord in enumerate(coords):
+        if crops[coord].size:
+            thumbs[i] = cv2.resize(crops[coord], (cells, cells), interpolation=cv2.INTER_AREA)
+    return coords, thumbs
+
+
+def detect(frame: Union[bytes, Frame], registration: Optional[GridRegistration] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Observed board for one frame: ({"components": {...}}, info). info carries the
+    registration, hole counts, confidence and timings. Pass a saved registration
+    (see board_calibration.py) to skip grid fitting when the camera hasn't moved.
+    """
+    timings = {}
+    if not isinstance(frame, Frame):
+        frame = Frame(frame)
+        timings["holes"] = frame.seconds
+    small, scale = frame.small, frame.scale
+
+    start = time.perf_counter()
+    reg = registration or frame.register()
+    timings["register"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    mask = foreground_mask(small, scale, reg, frame.hole_labels, frame.hole_ids)
+    states = classify_holes(small, scale, reg, frame.hole_points, mask)
+    components = find_components(small, scale, reg, states, mask)
+    timings["classify"] = time.perf_counter() - start
+
+    counts = {s: 0 for s in HOLE_STATES}
+    for s in states.values():
+        counts[s] += 1
+    unknown = sum(c == "UNKNOWN" for coords in components.values() for c in coords)
+    confidence = reg.confidence * (0.5 ** unknown)
+    info = {
+        "registration": reg,
+        "holes_detected": int(len(frame.hole_points)),
+        "hole_states": counts,
+        "confidence": round(confidence, 3),
+        "timings_ms": {k: round(v * 1000, 1) for k, v in timings.items()},
+    }
+    return {"components": components}, info
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the local breadboard detector on an image.")
+    parser.add_argument("image")
+    parser.add_argument("--debug", help="Write an annotated copy of the frame here.")
+    parser.add_argument("--rectified", help="Write the rectified (straightened, top-down) board here.")
+    args = parser.parse_args()
+    with open(args.image, "rb") as f:
+        data = f.read()
+    frame = Frame(data)
+    observed, info = detect(frame)
+    reg = info.pop("registration")
+    print(json.dumps({**observed, **info, "registration": reg.to_dict()}, indent=2))
+
+    if args.debug:
+        cv2, _ = _cv()
+        mask = foreground_mask(frame.small, frame.scale, reg, frame.hole_labels, frame.hole_ids)
+        states = classify_holes(frame.small, frame.scale, reg, frame.hole_points, mask)
+        colours = {"empty": (0, 200, 0), "lead": (0, 0, 255), "covered": (200, 120, 0)}
+        img = frame.image.copy()
+        coords, positions = reg.hole_positions()
+        for coord, (x, y) in zip(coords, positions):
+            cv2.circle(img, (int(x), int(y)), 4, colours[states[coord]], -1)
+        cv2.imwrite(args.debug, img)
+    if args.rectified:
+        cv2, _ = _cv()
+        cv2.imwrite(args.rectified, rectify(frame, reg))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# board_diff.py
+from typing import Any, Dict, List, Tuple
+
+from breadboard import BOARD, NO_HOLE, Breadboard
+
+
+def diff_boards(
+    previous: Dict[str, List[str]], current: Dict[str, List[str]], board: Breadboard = BOARD
+) -> Dict[str, Any]:
+    """
+    What changed between two observed boards ({label: [coord, coord]}).
+    Coordinates are compared as hole ids, so "a10" -> "A10" is not a move.
+    affected_nodes lists every strip a changed component left or landed on.
+    """
+    before = board.place_all(previous)
+    after = board.place_all(current)
+
+    added = sorted(label for label in after if label not in before)
+    removed = sorted(label for label in before if label not in after)
+    moved = []
+    for label in sorted(after):
+        if label in before and list(before[label].holes) != list(after[label].holes):
+            moved.append({"label": label, "from": before[label].coords, "to": after[label].coords})
+
+    affected = set()
+    for p in [after[l] for l in added] + [before[l] for l in removed]:
+        affected.update(n for n in p.nodes if n)
+    for m in moved:
+        for p in (before[m["label"]], after[m["label"]]):
+            affected.update(n for n, h in zip(p.nodes, p.holes) if h != NO_HOLE)
+
+    return {
+        "added": added,
+        "removed": removed,
+        "moved": moved,
+        "affected_nodes": sorted(affected),
+    }
+
+
+def is_empty(delta: Dict[str, Any]) -> bool:
+    return not (delta["added"] or delta["removed"] or delta["moved"])
+
+
+def issue_key(issue: Dict[str, Any]) -> Tuple[str, str, Tuple[str, ...]]:
+    """Identity of an issue across frames; wording may change, what and where may not."""
+    return issue.get("type", ""), issue.get("id", ""), tuple(sorted(issue.get("locations", [])))
+
+
+def compare_issues(
+    previous: List[Dict[str, Any]], current: List[Dict[str, Any]]
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Returns (resolved, introduced): issues only in the previous or only in the current list."""
+    before = {issue_key(i) for i in previous}
+    after = {issue_key(i) for i in current}
+    resolved = [i for i in previous if issue_key(i) not in after]
+    introduced = [i for i in current if issue_key(i) not in before]
+    return resolved, introduced
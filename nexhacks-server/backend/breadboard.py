@@ -0,0 +1,184 @@
+# breadboard.py
+import os
+import re
+from array import array
+from operator import itemgetter
+from typing import Dict, List, Optional, Sequence
+
+# Column order inside one numbered row. A-E and F-J are the two terminal halves;
+# the four rail columns are written "L+12", "L-12" (rails beside A-E) and
+# "R+12", "R-12" (rails beside F-J).
+TERMINAL_COLUMNS = "ABCDEFGHIJ"
+RAIL_COLUMNS = ("L+", "L-", "R+", "R-")
+COLUMNS = tuple(TERMINAL_COLUMNS) + RAIL_COLUMNS
+COLUMN_INDEX = {c: i for i, c in enumerate(COLUMNS)}
+
+NO_HOLE = -1
+# Parsed coordinate strings are memoised; the model only ever emits a few hundred distinct ones
+HOLE_CACHE_LIMIT = 4096
+
+COORD_RE = re.compile(r"\s*([A-Ja-j]|[LRlr]\s*[+-])\s*(\d+)\s*")
+
+BREADBOARD_SIZE = os.getenv("BREADBOARD_SIZE", "full").lower()
+
+
+class BoardGeometry:
+    """
+    Physical layout of one breadboard model.
+    split_rails_at: on many full-size boards each rail is cut in the middle;
+    rows up to and including this number form the first half of the rail.
+    """
+
+    __slots__ = ("name", "rows", "split_rails_at")
+
+    def __init__(self, name: str, rows: int, split_rails_at: Optional[int] = None):
+        self.name = name
+        self.rows = rows
+        self.split_rails_at = split_rails_at
+
+    def __repr__(self) -> str:
+        return f"BoardGeometry({self.name!r}, rows={self.rows}, split_rails_at={self.split_rails_at})"
+
+
+GEOMETRIES = {
+    "full": BoardGeometry("full", rows=63),
+    "full-split": BoardGeometry("full-split", rows=63, split_rails_at=31),
+    "half": BoardGeometry("half", rows=30),
+}
+
+
+class Placement:
+    """One observed component: its label, the coords as read, and the parsed hole ids."""
+
+    __slots__ = ("label", "coords", "holes", "nodes")
+
+    def __init__(self, label: str, coords: Sequence[str], holes: array, nodes: List[Optional[str]]):
+        self.label = label
+        self.coords = list(coords)
+        self.holes = holes
+        self.nodes = nodes
+
+    @property
+    def unreadable(self) -> List[str]:
+        return [c for c, h in zip(self.coords, self.holes) if h == NO_HOLE]
+
+    def __repr__(self) -> str:
+        return f"Placement({self.label!r}, {self.coords})"
+
+
+class Breadboard:
+    """
+    Hole and strip lookup tables for one geometry.
+
+    Holes are integer ids (row index * len(COLUMNS) + column index). strip_of is an
+    array('H') mapping every hole id to the id of the metal strip it sits on, so
+    turning leads into electrical nodes is a table lookup instead of string parsing.
+    Strip names match what the analyzer reports: "L10" (row 10, A-E), "R10"
+    (row 10, F-J) and "L+", "L-", "R+", "R-" for rails ("L+1"/"L+2" when split).
+    """
+
+    __slots__ = ("geometry", "strip_of", "strip_names", "_hole_cache")
+
+    def __init__(self, geometry: BoardGeometry):
+        self.geometry = geometry
+        rows = geometry.rows
+        self.strip_names: List[str] = [f"L{r}" for r in range(1, rows + 1)] + [f"R{r}" for r in range(1, rows + 1)]
+
+        rail_strip: Dict[tuple, int] = {}
+        for rail in RAIL_COLUMNS:
+            halves = (1, 2) if geometry.split_rails_at else (None,)
+            for half in halves:
+                rail_strip[rail, half] = len(self.strip_names)
+                self.strip_names.append(rail if half is None else f"{rail}{half}")
+
+        self.strip_of = array("H", bytes(2 * rows * len(COLUMNS)))
+        for r in range(1, rows + 1):
+            for col, ci in COLUMN_INDEX.items():
+                if col in "ABCDE":
+                    strip = r - 1
+                elif col in "FGHIJ":
+                    strip = rows + r - 1
+                else:
+                    half = None
+                    if geometry.split_rails_at:
+                        half = 1 if r <= geometry.split_rails_at else 2
+                    strip = rail_strip[col, half]
+                self.strip_of[(r - 1) * len(COLUMNS) + ci] = strip
+
+        self._hole_cache: Dict[str, int] = {}
+
+    def hole_id(self, coord: Optional[str]) -> int:
+        """'A10' -> hole id, or NO_HOLE for UNKNOWN, malformed or off-board coords."""
+        if not isinstance(coord, str):
+            return NO_HOLE
+        hole = self._hole_cache.get(coord)
+        if hole is None:
+            hole = NO_HOLE
+            m = COORD_RE.fullmatch(coord)
+            if m:
+                col = re.sub(r"\s+", "", m.group(1)).upper()
+                row = int(m.group(2))
+                if 1 <= row <= self.geometry.rows:
+                    hole = (row - 1) * len(COLUMNS) + COLUMN_INDEX[col]
+            if len(self._hole_cache) < HOLE_CACHE_LIMIT:
+                self._hole_cache[coord] = hole
+        return hole
+
+    def coord(self, hole: int) -> str:
+        row, ci = divmod(hole, len(COLUMNS))
+        return f"{COLUMNS[ci]}{row + 1}"
+
+    def strips(self, holes: Sequence[int]) -> List[Optional[int]]:
+        """Strip id for each hole (None where the hole is NO_HOLE), in one batched lookup."""
+        known = [h for h in holes if h != NO_HOLE]
+        if not known:
+            return [None] * len(holes)
+        found = itemgetter(*known)(self.strip_of)
+        found = iter(found if len(known) > 1 else (found,))
+        return [next(found) if h != NO_HOLE else None for h in holes]
+
+    def node(self, coord: Optional[str]) -> Optional[str]:
+        hole = self.hole_id(coord)
+        return self.strip_names[self.strip_of[hole]] if hole != NO_HOLE else None
+
+    def place(self, label: str, coords: Sequence[str]) -> Placement:
+        holes = array("h", (self.hole_id(c) for c in coords))
+        nodes = [self.strip_names[s] if s is not None else None for s in self.strips(holes)]
+        return Placement(label, coords, holes, nodes)
+
+    def place_all(self, components: Dict[str, Sequence[str]]) -> Dict[str, Placement]:
+        """Parse every observed component once: {label: [coord, coord]} -> {label: Placement}."""
+        return {
+            label: self.place(label, coords)
+            for label, coords in components.items()
+            if isinstance(coords, list)
+        }
+
+    def rules(self) -> Dict[str, object]:
+        """Connectivity rules in words, for prompts that still need them."""
+        if self.geometry.split_rails_at:
+            rails = f"Each rail is split after row {self.geometry.split_rails_at}."
+        else:
+            rails = "Each rail runs the full length of the board."
+        return {
+            "coordinate_format": (
+                "ColumnLetterRowNumber like A10. Columns A-E are left half, F-J are right half. "
+                "Rails are L+/L- (beside A-E) and R+/R- (beside F-J), e.g. L+5."
+            ),
+            "rows": self.geometry.rows,
+            "connectivity": [
+                "A-E in the same numbered row are connected together (left node).",
+                "F-J in the same numbered row are connected together (right node).",
+                "Left and right halves are separated by the center gap (not connected).",
+                f"Each of L+, L-, R+, R- is one strip along the board. {rails}",
+            ],
+        }
+
+
+def get_board(size: str = BREADBOARD_SIZE) -> Breadboard:
+    if size not in GEOMETRIES:
+        raise ValueError(f"Unknown BREADBOARD_SIZE {size!r}. Use one of: {', '.join(GEOMETRIES)}")
+    return Breadboard(GEOMETRIES[size])
+
+
+BOARD = get_board()
@@ -0,0 +1,50 @@
+# frame_gate.py
+import io
+import os
+from typing import Optional, Tuple
+
+from PIL import Image
+
+# A frame counts as "changed" when any cell of the downsampled grid moved more than this
+# (0-255 grayscale, after removing the overall brightness shift from auto-exposure).
+FRAME_DIFF_THRESHOLD = float(os.getenv("FRAME_DIFF_THRESHOLD", "12"))
+FRAME_SIGNATURE_SIZE = int(os.getenv("FRAME_SIGNATURE_SIZE", "32"))
+
+
+def frame_signature(image_bytes: bytes, size: int = FRAME_SIGNATURE_SIZE) -> bytes:
+    """Grayscale size x size box-filtered thumbnail of the frame."""
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        thumb = img.convert("L").resize((size, size), Image.BOX)
+        return thumb.tobytes()
+
+
+def diff_score(a: bytes, b: bytes) -> float:
+    """
+    Largest per-cell difference between two signatures, ignoring a uniform
+    brightness change. A single new component moves a few cells a lot, while
+    sensor noise is averaged away inside each cell.
+    """
+    if len(a) != len(b) or not a:
+        return float("inf")
+    offset = (sum(a) - sum(b)) / len(a)
+    return max(abs(x - y - offset) for x, y in zip(a, b))
+
+
+class FrameGate:
+    """Remembers the last frame that was sent to the vision model."""
+
+    def __init__(self, threshold: float = FRAME_DIFF_THRESHOLD):
+        self.threshold = threshold
+        self.last_signature: Optional[bytes] = None
+
+    def check(self, signature: bytes) -> Tuple[bool, Optional[float]]:
+        """Returns (changed, score). The first frame always counts as changed."""
+        if self.last_signature is None:
+            return True, None
+        score = diff_score(self.last_signature, signature)
+        return score > self.threshold, round(score, 2)
+
+    def accept(self, signature: bytes) -> None:
+        # Only call once the frame has actually been transcribed, so a failed
+        # LLM call doesn't make the next identical frame look "unchanged".
+        self.last_signature = signature
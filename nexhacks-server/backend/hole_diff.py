@@ -0,0 +1,125 @@
+# hole_diff.py
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import board_detector
+from board_detector import Frame, GridRegistration
+
+# "auto" diffs holes whenever the board is calibrated; "off" always reads the whole board
+HOLE_DIFF = os.getenv("HOLE_DIFF", "auto").lower()
+# A hole counts as changed when any cell of its thumbnail moved more than this
+# (0-255 grayscale, after removing the overall brightness shift from auto-exposure)
+HOLE_DIFF_THRESHOLD = float(os.getenv("HOLE_DIFF_THRESHOLD", "30"))
+# More than this share of holes changing is a hand, a shadow or a bumped board: read it all
+HOLE_DIFF_MAX_SHARE = float(os.getenv("HOLE_DIFF_MAX_SHARE", "0.15"))
+# Rows of context either side of the changed holes in the image sent to the vision model
+HOLE_DIFF_ROW_MARGIN = int(os.getenv("HOLE_DIFF_ROW_MARGIN", "3"))
+
+
+def enabled() -> bool:
+    return HOLE_DIFF != "off"
+
+
+def signatures(frame: Frame, registration: GridRegistration) -> Tuple[List[str], Any]:
+    return board_detector.hole_signatures(frame, registration)
+
+
+def coord_row(coord: str) -> Optional[int]:
+    m = re.search(r"(\d+)$", coord)
+    return int(m.group(1)) if m else None
+
+
+def read_rows(
+    changed: List[str], previous: Dict[str, Any], rows: int, margin: int = HOLE_DIFF_ROW_MARGIN
+) -> Optional[Tuple[int, int]]:
+    """
+    First and last board row the vision model must see to re-read these holes: the
+    changed holes plus both leads of every known component on one of them, so long
+    parts aren't cut off. None if such a component has an UNKNOWN lead, since its
+    extent isn't known and the whole board has to be read.
+    """
+    changed_set = set(changed)
+    holes = list(changed)
+    for coords in previous["components"].values():
+        if any(c in changed_set for c in coords):
+            if any(coord_row(c) is None for c in coords):
+                return None
+            holes.extend(coords)
+    numbers = [n for n in map(coord_row, holes) if n is not None]
+    return max(1, min(numbers) - margin), min(rows, max(numbers) + margin)
+
+
+def changed_holes(previous: Any, current: Any, coords: List[str], threshold: float = HOLE_DIFF_THRESHOLD) -> Dict[str, float]:
+    """Changed holes and their scores: largest per-cell difference, less the overall brightness shift."""
+    import numpy as np
+
+    delta = current - previous
+    offset = float(np.median(delta))
+    scores = abs(delta - offset).reshape(len(coords), -1).max(axis=1)
+    return {coord: round(float(score), 1) for coord, score in zip(coords, scores) if score > threshold}
+
+
+class HoleDiff:
+    """Remembers the hole thumbnails of the last frame whose board was transcribed."""
+
+    def __init__(self, threshold: float = HOLE_DIFF_THRESHOLD, max_share: float = HOLE_DIFF_MAX_SHARE):
+        self.threshold = threshold
+        self.max_share = max_share
+        self.registration: Optional[GridRegistration] = None
+        self.coords: List[str] = []
+        self.last = None
+
+    def check(self, registration: GridRegistration, coords: List[str], thumbs: Any) -> Optional[Dict[str, float]]:
+        """
+        Changed holes (possibly none) since the last accepted frame, or None when
+        the whole board has to be read: no baseline yet, the grid was re-registered
+        since, or too much of the board changed to trust a partial read.
+        """
+        if self.last is None or registration is not self.registration or coords != self.coords:
+            return None
+        changed = changed_holes(self.last, thumbs, coords, self.threshold)
+        if len(changed) > self.max_share * len(coords):
+            return None
+        return changed
+
+    def accept(self, registration: GridRegistration, coords: List[str], thumbs: Any) -> None:
+        # Like FrameGate.accept: only once the board has actually been transcribed
+        self.registration = registration
+        self.coords = coords
+        self.last = thumbs
+
+
+def _kind(label: str) -> str:
+    return label.rsplit("_", 1)[0] if label.rsplit("_", 1)[-1].isdigit() else label
+
+
+def merge_observed(previous: Dict[str, Any], current: Dict[str, Any], changed: List[str]) -> Dict[str, Any]:
+    """
+    Previous board with the changed holes re-read: components with a lead on a
+    changed hole come from the new reading, the rest stay as they were. Components
+    still in the same holes keep their labels; new ones take the next free number
+    of their kind.
+    """
+    changed_set = set(changed)
+    touches = lambda coords: any(c in changed_set for c in coords)
+    components, replaced = {}, {}
+    counts: Dict[str, int] = {}
+    for label, coords in previous["components"].items():
+        if touches(coords):
+            replaced[(_kind(label), tuple(coords))] = label
+        else:
+            components[label] = coords
+        number = label.rsplit("_", 1)[-1]
+        if number.isdigit():
+            counts[_kind(label)] = max(counts.get(_kind(label), 0), int(number))
+    for label, coords in current["components"].items():
+        if not touches(coords) or coords in components.values():
+            continue
+        kind = _kind(label)
+        label = replaced.get((kind, tuple(coords)))
+        if label is None:
+            counts[kind] = counts.get(kind, 0) + 1
+            label = f"{kind}_{counts[kind]}"
+        components[label] = coords
+    return {"components": components}
@@ -0,0 +1,104 @@
+# image_preprocess.py
+import io
+import os
+import base64
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from PIL import Image, ImageOps
+
+from metrics import stage
+
+# Applied to every image before it is base64-encoded for the vision model.
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1280"))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()  # JPEG or WEBP
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "80"))
+# Optional breadboard region as fractions of the (orientation-fixed) frame: "left,top,right,bottom"
+IMAGE_CROP_BOX = os.getenv("IMAGE_CROP_BOX", "")
+
+MIME_BY_FORMAT = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+ORIGINAL_MIME_BY_FORMAT = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+def parse_crop_box(text: str) -> Optional[Tuple[float, float, float, float]]:
+    if not text.strip():
+        return None
+    parts = [float(x) for x in text.split(",")]
+    if len(parts) != 4 or not (0 <= parts[0] < parts[2] <= 1 and 0 <= parts[1] < parts[3] <= 1):
+        raise ValueError(f"Crop box must be 'left,top,right,bottom' fractions in 0..1, got {text!r}")
+    return parts[0], parts[1], parts[2], parts[3]
+
+
+DEFAULT_CROP_BOX = parse_crop_box(IMAGE_CROP_BOX)
+
+
+def preprocess_image(
+    data: bytes,
+    max_edge: int = IMAGE_MAX_EDGE,
+    fmt: str = IMAGE_FORMAT,
+    quality: int = IMAGE_QUALITY,
+    crop_box: Optional[Tuple[float, float, float, float]] = None,
+) -> Tuple[bytes, str, Dict[str, Any]]:
+    """
+    Fix EXIF orientation, optionally crop to crop_box, shrink so the long edge is
+    at most max_edge and re-encode. Returns (encoded bytes, mime, stats).
+    """
+    fmt = fmt.upper()
+    if fmt not in MIME_BY_FORMAT:
+        raise HTTPException(status_code=500, detail=f"Unsupported IMAGE_FORMAT {fmt!r}. Use JPEG or WEBP.")
+
+    try:
+        img = Image.open(io.BytesIO(data))
+        img.load()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not decode image: {e}")
+
+    original_size = img.size
+    original_format = img.format
+    upright = img.getexif().get(0x0112, 1) == 1  # EXIF Orientation tag
+    img = ImageOps.exif_transpose(img)
+    untouched = upright and crop_box is None
+
+    if crop_box:
+        w, h = img.size
+        left, top, right, bottom = crop_box
+        img = img.crop((int(left * w), int(top * h), int(right * w), int(bottom * h)))
+
+    if max_edge and max(img.size) > max_edge:
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        untouched = False
+
+    if img.mode in ("RGBA", "LA", "P"):
+        # Flatten transparency onto white (schematic PNGs are often transparent)
+        rgba = img.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.split()[-1])
+        img = background
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+
+    out = io.BytesIO()
+    img.save(out, format=fmt, quality=quality)
+    encoded = out.getvalue()
+    mime = MIME_BY_FORMAT[fmt]
+
+    # Small, already-compressed files can grow when re-encoded; send those as-is.
+    if untouched and len(encoded) >= len(data) and original_format in ORIGINAL_MIME_BY_FORMAT:
+        encoded, mime, fmt = data, ORIGINAL_MIME_BY_FORMAT[original_format], original_format
+
+    stats = {
+        "bytes_before": len(data),
+        "bytes_after": len(encoded),
+        "size_before": list(original_size),
+        "size_after": list(img.size),
+        "format": fmt,
+    }
+    return encoded, mime, stats
+
+
+def image_to_data_url(data: bytes, **kwargs) -> Tuple[str, Dict[str, Any]]:
+    with stage("image_preprocess"):
+        encoded, mime, stats = preprocess_image(data, **kwargs)
+    with stage("base64_encode"):
+        b64 = base64.b64encode(encoded).decode("utf-8")
+    return f"data:{mime};base64,{b64}", stats
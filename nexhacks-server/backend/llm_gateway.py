@@ -0,0 +1,191 @@
+# llm_gateway.py
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, Optional
+from dotenv import load_dotenv
+
+import httpx
+
+import metrics
+from llm_scheduler import LLM_MAX_RETRIES, RETRYABLE_STATUS, backoff_delay, scheduler
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Any OpenAI-compatible endpoint works, e.g. the local mock in mock_llm.py for benchmarks
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1").rstrip("/")
+OPENROUTER_CHAT_URL = f"{OPENROUTER_BASE_URL}/chat/completions"
+
+# -------- Pool Config --------
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() in ("1", "true", "yes")
+
+# Read timeout (seconds) per route. Override with LLM_TIMEOUT_<ROUTE>,
+# e.g. LLM_TIMEOUT_ANSWER=30 or LLM_TIMEOUT_PROCESS_OBSERVED=90.
+DEFAULT_ROUTE_TIMEOUTS = {
+    "analyze": 60.0,
+    "answer": 60.0,
+    "process-schematic": 120.0,
+    "process-observed": 120.0,
+    "process-observed2": 120.0,
+}
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def route_timeout(route: str) -> httpx.Timeout:
+    env_key = "LLM_TIMEOUT_" + route.upper().replace("-", "_")
+    read = float(os.getenv(env_key, DEFAULT_ROUTE_TIMEOUTS.get(route, 60.0)))
+    return httpx.Timeout(read, connect=LLM_CONNECT_TIMEOUT)
+
+
+def _build_client() -> httpx.AsyncClient:
+    http2 = LLM_HTTP2 and http2_available()
+    if LLM_HTTP2 and not http2:
+        logger.warning("[llm-gateway] LLM_HTTP2 is on but 'h2' is not installed, using HTTP/1.1")
+
+    limits = httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+    )
+    logger.info(
+        f"[llm-gateway] Opening pooled client http2={http2} "
+        f"max_connections={LLM_MAX_CONNECTIONS} keepalive={LLM_MAX_KEEPALIVE_CONNECTIONS}"
+    )
+    return httpx.AsyncClient(http2=http2, limits=limits, timeout=route_timeout("default"))
+
+
+async def startup() -> None:
+    """Open the shared client. Called from the FastAPI lifespan hook in main.py."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+
+
+async def shutdown() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        logger.info("[llm-gateway] Closed pooled client")
+    _client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    # Lazily open the client so the routers still work when imported outside
+    # the app lifespan (scripts, a bare router mounted somewhere else).
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+def _retry_delay(attempt: int, provider_wait: Optional[float]) -> float:
+    return max(provider_wait or 0.0, backoff_delay(attempt))
+
+
+async def post_chat_completion(route: str, headers: Dict[str, str], body: Dict[str, Any]) -> httpx.Response:
+    """
+    POST a chat completion on the shared pool with the route's timeout, once the
+    scheduler admits it. Rate limits, 5xx and connection errors are retried with
+    jittered backoff; the last response is returned either way.
+    """
+    client = get_client()
+    model = body.get("model", "")
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        async with await scheduler.acquire(route, model) as slot:
+            metrics.record("llm_queue", slot.waited, route)
+            try:
+                with metrics.stage("llm_request", route):
+                    r = await client.post(
+                        OPENROUTER_CHAT_URL,
+                        headers=headers,
+                        json=body,
+                        timeout=route_timeout(route),
+                    )
+            except httpx.TransportError as e:
+                if attempt == LLM_MAX_RETRIES:
+                    raise
+                delay, reason = _retry_delay(attempt, None), type(e).__name__
+            else:
+                provider_wait = scheduler.observe(r.status_code, r.headers)
+                if r.status_code not in RETRYABLE_STATUS or attempt == LLM_MAX_RETRIES:
+                    return r
+                delay, reason = _retry_delay(attempt, provider_wait), str(r.status_code)
+        scheduler.counts["retries"] += 1
+        logger.warning(f"[llm-gateway] {route} got {reason}, retry {attempt + 1}/{LLM_MAX_RETRIES} in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+
+class StreamError(Exception):
+    """The provider reported an error in the middle of a streamed completion."""
+
+
+async def stream_chat_completion(route: str, headers: Dict[str, str], body: Dict[str, Any]) -> AsyncIterator[str]:
+    """
+    POST a chat completion with stream=true and yield the content deltas as they
+    arrive. Rejections are retried like post_chat_completion until the first byte of
+    content; raises httpx.HTTPStatusError if the request is still rejected.
+    """
+    client = get_client()
+    model = body.get("model", "")
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        async with await scheduler.acquire(route, model) as slot:
+            metrics.record("llm_queue", slot.waited, route)
+            start = time.perf_counter()
+            first_token = True
+            async with client.stream(
+                "POST",
+                OPENROUTER_CHAT_URL,
+                headers=headers,
+                json={**body, "stream": True},
+                timeout=route_timeout(route),
+            ) as r:
+                provider_wait = scheduler.observe(r.status_code, r.headers)
+                if r.status_code >= 400:
+                    await r.aread()
+                    if r.status_code not in RETRYABLE_STATUS or attempt == LLM_MAX_RETRIES:
+                        r.raise_for_status()
+                else:
+                    # Once deltas are flowing the request is committed; no retries past here
+                    async for line in r.aiter_lines():
+                        # Skip keep-alive comments (": OPENROUTER PROCESSING") and blank separators
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        try:
+                            chunk = json.loads(data)
+                        except ValueError:
+                            logger.warning(f"[llm-gateway] Skipping unparseable stream line: {data[:200]}")
+                            continue
+                        if "error" in chunk:
+                            raise StreamError(str(chunk["error"]))
+                        delta = (chunk.get("choices") or [{}])[0].get("delta", {}).get("content")
+                        if delta:
+                            if first_token:
+                                metrics.record("llm_first_token", time.perf_counter() - start, route)
+                                first_token = False
+                            yield delta
+                    metrics.record("llm_request", time.perf_counter() - start, route)
+                    return
+        delay = _retry_delay(attempt, provider_wait)
+        scheduler.counts["retries"] += 1
+        logger.warning(f"[llm-gateway] {route} stream got {r.status_code}, retry {attempt + 1}/{LLM_MAX_RETRIES} in {delay:.1f}s")
+        await asyncio.sleep(delay)
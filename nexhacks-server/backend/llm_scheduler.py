@@ -0,0 +1,254 @@
+# llm_scheduler.py
+import os
+import time
+import random
+import asyncio
+import logging
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, Mapping, Optional
+
+from fastapi import APIRouter
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+# -------- Scheduler Config --------
+# Requests per second the token bucket starts at (and never climbs above), and how
+# many may go back to back after a quiet spell.
+LLM_RATE = float(os.getenv("LLM_RATE", "5"))
+LLM_BURST = float(os.getenv("LLM_BURST", "10"))
+# After a 429 the rate halves (down to LLM_MIN_RATE); each success adds LLM_RATE_STEP back.
+LLM_MIN_RATE = float(os.getenv("LLM_MIN_RATE", "0.2"))
+LLM_RATE_STEP = float(os.getenv("LLM_RATE_STEP", "0.1"))
+# In-flight requests per model, and how many of those only interactive routes may use
+LLM_MODEL_CONCURRENCY = int(os.getenv("LLM_MODEL_CONCURRENCY", "4"))
+LLM_INTERACTIVE_RESERVE = int(os.getenv("LLM_INTERACTIVE_RESERVE", "1"))
+# Retries for 429/5xx/connection errors: full-jitter exponential backoff, at least Retry-After
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE = float(os.getenv("LLM_RETRY_BASE", "1.0"))
+LLM_RETRY_MAX = float(os.getenv("LLM_RETRY_MAX", "20"))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Lower runs first. A student waiting on an answer beats snapshot transcription,
+# which beats (re)reading the schematic.
+INTERACTIVE = 0
+BACKGROUND = 1
+BULK = 2
+ROUTE_PRIORITY = {
+    "answer": INTERACTIVE,
+    "analyze": INTERACTIVE,
+    "process-observed": BACKGROUND,
+    "process-observed2": BACKGROUND,
+    "process-schematic": BULK,
+}
+
+
+def route_priority(route: str) -> int:
+    return ROUTE_PRIORITY.get(route, BACKGROUND)
+
+
+def retry_after_seconds(headers: Mapping[str, str], now: Optional[float] = None) -> Optional[float]:
+    """
+    How long the provider asked us to wait: Retry-After (seconds or HTTP date), or
+    X-RateLimit-Reset when X-RateLimit-Remaining is 0. None if it didn't say.
+    """
+    now = time.time() if now is None else now
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - now)
+            except (TypeError, ValueError):
+                pass
+    remaining, reset = headers.get("x-ratelimit-remaining"), headers.get("x-ratelimit-reset")
+    if remaining is not None and reset:
+        try:
+            if float(remaining) > 0:
+                return None
+            reset_at = float(reset)
+        except ValueError:
+            return None
+        # OpenRouter sends epoch milliseconds; others send epoch seconds or a delta
+        if reset_at > 1e12:
+            return max(0.0, reset_at / 1000 - now)
+        if reset_at > 1e9:
+            return max(0.0, reset_at - now)
+        return reset_at
+    return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full jitter: uniform in [0, base * 2^attempt], capped."""
+    return random.uniform(0, min(LLM_RETRY_MAX, LLM_RETRY_BASE * (2 ** attempt)))
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "route", "model", "future", "queued_at")
+
+    def __init__(self, priority: int, seq: int, route: str, model: str, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.route = route
+        self.model = model
+        self.future = future
+        self.queued_at = time.perf_counter()
+
+
+class Slot:
+    """One granted request. Release it (or use `async with`) when the response is read."""
+
+    def __init__(self, scheduler: "LlmScheduler", model: str, waited: float):
+        self.scheduler = scheduler
+        self.model = model
+        self.waited = waited
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self.scheduler._release(self.model)
+
+    async def __aenter__(self) -> "Slot":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.release()
+
+
+class LlmScheduler:
+    """
+    Admission control for all OpenRouter calls in this process. A token bucket paces
+    requests and adapts to the provider: Retry-After / rate-limit headers pause it,
+    429s halve its rate and successes slowly restore it. Waiters are granted strictly
+    by priority then arrival, and each model has bounded concurrency with a few slots
+    that background work may not take, so an interactive question never sits behind
+    a classroom's worth of snapshot transcriptions.
+    """
+
+    def __init__(
+        self,
+        rate: float = LLM_RATE,
+        burst: float = LLM_BURST,
+        min_rate: float = LLM_MIN_RATE,
+        model_concurrency: int = LLM_MODEL_CONCURRENCY,
+        interactive_reserve: int = LLM_INTERACTIVE_RESERVE,
+    ):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.min_rate = min(min_rate, rate)
+        self.model_concurrency = model_concurrency
+        self.interactive_reserve = min(interactive_reserve, model_concurrency - 1)
+        self.tokens = self.burst
+        self.refilled = time.monotonic()
+        self.paused_until = 0.0
+        self.waiters: List[_Waiter] = []
+        self.in_flight: Dict[str, int] = {}
+        self.seq = 0
+        self.counts = {"granted": 0, "rate_limited": 0, "retries": 0}
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _limit(self, priority: int) -> int:
+        if priority == INTERACTIVE:
+            return self.model_concurrency
+        return max(1, self.model_concurrency - self.interactive_reserve)
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        self._refill(now)
+        self.waiters = [w for w in self.waiters if not w.future.done()]
+        self.waiters.sort(key=lambda w: (w.priority, w.seq))
+        wake_in = None
+        for w in list(self.waiters):
+            if now < self.paused_until:
+                wake_in = self.paused_until - now
+                break
+            if self.in_flight.get(w.model, 0) >= self._limit(w.priority):
+                # That model is saturated; someone after us may be asking for another one
+                continue
+            if self.tokens < 1:
+                # Strict priority: lower classes don't get the next token either
+                wake_in = (1 - self.tokens) / self.rate
+                break
+            self.tokens -= 1
+            self.in_flight[w.model] = self.in_flight.get(w.model, 0) + 1
+            self.waiters.remove(w)
+            self.counts["granted"] += 1
+            w.future.set_result(None)
+        if wake_in is not None:
+            self._timer = asyncio.get_running_loop().call_later(wake_in, self._dispatch)
+
+    async def acquire(self, route: str, model: str) -> Slot:
+        """Wait for this route's turn to call the model."""
+        loop = asyncio.get_running_loop()
+        self.seq += 1
+        waiter = _Waiter(route_priority(route), self.seq, route, model, loop.create_future())
+        self.waiters.append(waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted in the same tick we were cancelled; hand the slot back
+                self._release(model)
+            elif waiter in self.waiters:
+                self.waiters.remove(waiter)
+            raise
+        return Slot(self, model, time.perf_counter() - waiter.queued_at)
+
+    def _release(self, model: str) -> None:
+        self.in_flight[model] = max(0, self.in_flight.get(model, 0) - 1)
+        self._dispatch()
+
+    def observe(self, status_code: int, headers: Mapping[str, str]) -> Optional[float]:
+        """
+        Learn from a provider response. Returns how long the provider asked us to
+        wait, if it did.
+        """
+        wait = retry_after_seconds(headers)
+        if wait:
+            self.paused_until = max(self.paused_until, time.monotonic() + wait)
+        if status_code == 429:
+            self.counts["rate_limited"] += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+            logger.warning(f"[llm-scheduler] 429 from provider, rate now {self.rate:.2f}/s, wait {wait}")
+        elif status_code < 400:
+            self.rate = min(self.max_rate, self.rate + LLM_RATE_STEP)
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        queued: Dict[str, int] = {}
+        for w in self.waiters:
+            if not w.future.done():
+                queued[w.route] = queued.get(w.route, 0) + 1
+        return {
+            "rate_per_s": round(self.rate, 3),
+            "max_rate_per_s": self.max_rate,
+            "tokens": round(min(self.burst, self.tokens + (now - self.refilled) * self.rate), 2),
+            "paused_for_s": round(max(0.0, self.paused_until - now), 2),
+            "queued": queued,
+            "in_flight": {m: n for m, n in self.in_flight.items() if n},
+            "model_concurrency": self.model_concurrency,
+            "interactive_reserve": self.interactive_reserve,
+            **self.counts,
+        }
+
+
+scheduler = LlmScheduler()
+
+
+@router.get("/llm/scheduler")
+def scheduler_stats():
+    return scheduler.stats()
@@ -1,12 +1,33 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+import llm_gateway
+from metrics import ServerTimingMiddleware, router as metrics_router
+from llm_scheduler import router as llm_scheduler_router
+from model_router import router as model_router_router
+from session_store import sessions
 from answer import router as answer_router
 from analyze import router as analyze_router
 from process_schematic import router as process_schematic_router
 from process_observed import router as process_observed_router
 from process_observed2 import router as process_observed2_router
+from pipeline import pipeline, router as pipeline_router
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled OpenRouter client shared by every router (keep-alive + HTTP/2)
+    await llm_gateway.startup()
+    yield
+    # Stop in-flight snapshot runs before the HTTP client goes away
+    await pipeline.shutdown()
+    await llm_gateway.shutdown()
+    # Write out anything the session store has not persisted yet
+    await sessions.flush()
+
 
-app = FastAPI(title="Circuit Tutor API")
+app = FastAPI(title="Circuit Tutor API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,7 +40,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let the browser's devtools / JS read per-stage timings
+    expose_headers=["Server-Timing"],
 )
+app.add_middleware(ServerTimingMiddleware)
 
 # Mount both apps under same server
 app.include_router(answer_router)   # provides /answer and /health (from answer)
@@ -27,6 +51,10 @@ app.include_router(analyze_router)  # provides /analyze and /health (from analyz
 app.include_router(process_schematic_router)  # provides /process-schematic and /health (from process_schematic)
 app.include_router(process_observed_router)
 app.include_router(process_observed2_router)
+app.include_router(pipeline_router)  # provides /pipeline/frame and /sessions/{id}/frame
+app.include_router(metrics_router)  # provides /metrics (Prometheus)
+app.include_router(llm_scheduler_router)  # provides /llm/scheduler (queue, rate, in-flight)
+app.include_router(model_router_router)  # provides /llm/models (fallback order, per-model latency)
 
 # Optional: add a root route so / doesn't 404
 @app.get("/")
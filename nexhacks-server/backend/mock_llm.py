@@ -0,0 +1,139 @@
+# mock_llm.py
+"""
+Local stand-in for the OpenRouter chat completions API, for benchmarks and offline
+runs. Point the backend at it with OPENROUTER_BASE_URL=http://127.0.0.1:9100/v1.
+
+    python mock_llm.py --port 9100 --latency 0.8 --jitter 0.2
+
+Replies are canned per caller, recognised from the prompt:
+- observed board transcription  -> sample-observed/1.json
+- schematic transcription       -> sample-targets/1.json
+- /answer                       -> a fixed tutoring answer
+- /analyze rewording            -> the analysis it was sent, unchanged
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+from pathlib import Path
+from typing import Any, Dict, List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+BASE_DIR = Path(__file__).parent
+
+CANNED_ANSWER = {
+    "answer": "The LED's longer leg (anode) goes toward the resistor. The shorter leg goes to ground.",
+    "actions": [{"type": "highlight", "locations": ["E29"], "reason": "LED cathode"}],
+    "followups": ["Is the LED lighting up now?"],
+}
+
+
+def message_text(messages: List[Dict[str, Any]]) -> str:
+    parts = []
+    for m in messages:
+        content = m.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(c.get("text", "") for c in content if isinstance(c, dict))
+    return "\n".join(parts)
+
+
+def canned_reply(body: Dict[str, Any]) -> str:
+    messages = body.get("messages", [])
+    text = message_text(messages)
+    if "breadboard state transcriber" in text or "observed breadboard" in text.lower():
+        return (BASE_DIR / "sample-observed" / "1.json").read_text(encoding="utf-8")
+    if "image_url" in json.dumps(messages):
+        return (BASE_DIR / "sample-targets" / "1.json").read_text(encoding="utf-8")
+    if "CircuitTutorAnswerer" in text:
+        return json.dumps(CANNED_ANSWER)
+    # Analysis rewording: hand the analysis back as if reworded
+    user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "{}")
+    try:
+        echoed = json.loads(user)
+        echoed.pop("board_rules", None)
+        return json.dumps(echoed)
+    except (TypeError, ValueError):
+        return "{}"
+
+
+def completion(model: str, content: str) -> Dict[str, Any]:
+    return {
+        "id": f"mock-{int(time.time() * 1000)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+def create_app(latency: float = 0.5, jitter: float = 0.0, error_rate: float = 0.0, chunk_chars: int = 12) -> FastAPI:
+    app = FastAPI(title="Mock LLM")
+    stats = {"requests": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0}
+
+    async def wait() -> None:
+        await asyncio.sleep(max(0.0, random.uniform(latency - jitter, latency + jitter)))
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "mock")
+        stats["requests"] += 1
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            if random.random() < error_rate:
+                await wait()
+                stats["errors"] += 1
+                return JSONResponse(
+                    {"error": {"message": "Rate limit exceeded (mock)", "code": 429}},
+                    status_code=429,
+                    headers={"Retry-After": "1"},
+                )
+
+            content = canned_reply(body)
+            if not body.get("stream"):
+                await wait()
+                return completion(model, content)
+        finally:
+            stats["in_flight"] -= 1
+
+        async def events():
+            # Time to first token is half the latency; the rest is spread over the chunks
+            await asyncio.sleep(latency / 2)
+            chunks = [content[i:i + chunk_chars] for i in range(0, len(content), chunk_chars)] or [""]
+            for chunk in chunks:
+                delta = {"choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]}
+                yield f"data: {json.dumps(delta)}\n\n"
+                await asyncio.sleep(latency / 2 / len(chunks))
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    def get_stats():
+        return stats
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible mock for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds per completion.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Latency is uniform in latency +/- jitter.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 429.")
+    args = parser.parse_args()
+    app = create_app(args.latency, args.jitter, args.error_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
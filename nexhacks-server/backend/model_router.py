@@ -0,0 +1,168 @@
+# model_router.py
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+# -------- Routing Config --------
+# Per task, models to try after the primary, in order. Override with
+# OPENROUTER_FALLBACK_MODELS_<ROUTE>, e.g.
+#   OPENROUTER_FALLBACK_MODELS_PROCESS_OBSERVED=google/gemini-2.0-flash-001,openai/gpt-4o-mini
+# Hedging (LLM_HEDGE, or LLM_HEDGE_<ROUTE>) also fires the next model early when the
+# current one is slower than its own p90, instead of only after it fails.
+LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() in ("1", "true", "yes")
+# Until a model has this many successful calls its p90 isn't trusted; LLM_HEDGE_DELAY is used instead
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "10"))
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "10"))
+LATENCY_WINDOW = 100
+
+Attempt = Callable[[str], Awaitable[Dict[str, Any]]]
+
+
+def _route_env(prefix: str, route: str) -> Optional[str]:
+    return os.getenv(prefix + "_" + route.upper().replace("-", "_"))
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+class ModelStats:
+    """Latency of recent successes plus outcome counts for one model on one task."""
+
+    def __init__(self):
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.successes = 0
+        self.failures = 0  # HTTP error, invalid JSON or failed validation
+        self.hedges_lost = 0  # cancelled because another model answered first
+
+    def p90(self) -> Optional[float]:
+        if len(self.latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return percentile(list(self.latencies), 90)
+
+    def to_dict(self) -> Dict[str, Any]:
+        latencies = list(self.latencies)
+        ms = lambda v: round(v * 1000, 1) if v is not None else None
+        total = self.successes + self.failures
+        return {
+            "successes": self.successes,
+            "failures": self.failures,
+            "hedges_lost": self.hedges_lost,
+            "success_rate": round(self.successes / total, 3) if total else None,
+            "p50_ms": ms(percentile(latencies, 50)),
+            "p90_ms": ms(percentile(latencies, 90)),
+            "samples": len(latencies),
+        }
+
+
+class ModelRouter:
+    """
+    Runs one task (a vision transcription) against an ordered list of models. The
+    first model is tried first; if it fails, or (with hedging) is still running past
+    its p90 latency, the next one is started. The first result that parses and
+    validates wins and the rest are cancelled.
+    """
+
+    def __init__(self, route: str, primary: str, hedge: Optional[bool] = None):
+        self.route = route
+        fallbacks = _route_env("OPENROUTER_FALLBACK_MODELS", route) or ""
+        models = [primary] + [m.strip() for m in fallbacks.split(",") if m.strip()]
+        # Keep order, drop duplicates
+        self.models = list(dict.fromkeys(models))
+        if hedge is None:
+            override = _route_env("LLM_HEDGE", route)
+            hedge = LLM_HEDGE if override is None else override.lower() in ("1", "true", "yes")
+        self.hedge = hedge
+        self.stats: Dict[str, ModelStats] = {m: ModelStats() for m in self.models}
+        routers[route] = self
+
+    @property
+    def primary(self) -> str:
+        return self.models[0]
+
+    def hedge_delay(self, model: str) -> float:
+        p90 = self.stats[model].p90()
+        return LLM_HEDGE_DELAY if p90 is None else p90
+
+    async def _timed(self, model: str, attempt: Attempt) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            result = await attempt(model)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.stats[model].failures += 1
+            raise
+        self.stats[model].successes += 1
+        self.stats[model].latencies.append(time.perf_counter() - start)
+        return result
+
+    async def run(self, attempt: Attempt) -> Tuple[Dict[str, Any], str]:
+        """
+        attempt(model) makes the request and returns the validated result, raising
+        (HTTPException or anything else) if the output is unusable. Returns the
+        winning result and the model that produced it.
+        """
+        remaining = list(self.models)
+        running: Dict[asyncio.Task, str] = {}
+        last_error: Optional[BaseException] = None
+
+        def launch() -> float:
+            model = remaining.pop(0)
+            running[asyncio.ensure_future(self._timed(model, attempt))] = model
+            return self.hedge_delay(model)
+
+        delay = launch()
+        try:
+            while running:
+                timeout = delay if self.hedge and remaining else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logger.info(f"[model-router] {self.route}: no answer after {delay:.1f}s, hedging with {remaining[0]}")
+                    delay = launch()
+                    continue
+                for task in done:
+                    model = running.pop(task)
+                    if task.exception() is None:
+                        if model != self.primary:
+                            logger.info(f"[model-router] {self.route}: answered by {model}")
+                        return task.result(), model
+                    last_error = task.exception()
+                    logger.warning(f"[model-router] {self.route}: {model} failed: {last_error}")
+                if remaining:
+                    # Fall back straight away; when hedging, a failure doesn't wait for the timer either
+                    delay = launch()
+        finally:
+            for task, model in running.items():
+                task.cancel()
+                self.stats[model].hedges_lost += 1
+
+        if isinstance(last_error, HTTPException):
+            raise last_error
+        raise HTTPException(status_code=502, detail=f"All models failed for {self.route}: {last_error}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "models": self.models,
+            "hedge": self.hedge,
+            "stats": {m: s.to_dict() for m, s in self.stats.items()},
+        }
+
+
+routers: Dict[str, ModelRouter] = {}
+
+
+@router.get("/llm/models")
+def model_stats():
+    return {route: r.to_dict() for route, r in routers.items()}
@@ -0,0 +1,151 @@
+# netlist.py
+import re
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Set
+
+
+def natural_key(value: Any) -> List[Any]:
+    """Sort key that orders 'L2' before 'L10' and 'node_2' before 'node_10'."""
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", str(value))]
+
+
+class DisjointSet:
+    """Union-find with path compression and union by rank."""
+
+    def __init__(self, items: Iterable[Hashable] = ()):
+        self.parent: Dict[Hashable, Hashable] = {}
+        self.rank: Dict[Hashable, int] = {}
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self.parent
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+    def add(self, item: Hashable) -> None:
+        if item not in self.parent:
+            self.parent[item] = item
+            self.rank[item] = 0
+
+    def find(self, item: Hashable) -> Hashable:
+        self.add(item)
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # Point everything on the path straight at the root
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a: Hashable, b: Hashable) -> Hashable:
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return ra
+        if self.rank[ra] < self.rank[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        if self.rank[ra] == self.rank[rb]:
+            self.rank[ra] += 1
+        return ra
+
+    def connected(self, a: Hashable, b: Hashable) -> bool:
+        return self.find(a) == self.find(b)
+
+    def groups(self) -> List[List[Hashable]]:
+        by_root: Dict[Hashable, List[Hashable]] = {}
+        for item in self.parent:
+            by_root.setdefault(self.find(item), []).append(item)
+        return list(by_root.values())
+
+
+class Netlist:
+    """
+    Electrical nets of a board.
+
+    Components land on connection points (breadboard strips like "L10", or named
+    nodes like "node_3"). Conductors such as jumper wires join every point they
+    touch into one net; other parts just sit on the nets of their leads.
+    Nets are labelled prefix1, prefix2, ... in order of their smallest point,
+    so the same board always gets the same labels regardless of input order.
+    """
+
+    def __init__(
+        self,
+        pins: Dict[str, Sequence[Optional[Hashable]]],
+        conductors: Iterable[str] = (),
+        prefix: str = "N",
+    ):
+        self.conductors: Set[str] = set(conductors)
+        dsu = DisjointSet()
+        for points in pins.values():
+            for point in points:
+                if point is not None:
+                    dsu.add(point)
+        for label in self.conductors:
+            points = [p for p in pins.get(label, ()) if p is not None]
+            for point in points[1:]:
+                dsu.union(points[0], point)
+
+        groups = [sorted(g, key=natural_key) for g in dsu.groups()]
+        groups.sort(key=lambda g: natural_key(g[0]))
+
+        self.nets: Dict[str, List[Hashable]] = {}
+        self._net_by_point: Dict[Hashable, str] = {}
+        for i, points in enumerate(groups, start=1):
+            label = f"{prefix}{i}"
+            self.nets[label] = points
+            for point in points:
+                self._net_by_point[point] = label
+
+        # component -> net label of each lead, in lead order (None where the lead is unknown)
+        self.pins: Dict[str, List[Optional[str]]] = {
+            label: [self.net_of(p) for p in points] for label, points in pins.items()
+        }
+
+    @classmethod
+    def from_node_lists(cls, raw_nodes: Dict[str, List[str]], conductors: Iterable[str] = (), prefix: str = "node_"):
+        """
+        Build from {"node_1": [component, ...], ...} as transcribed per junction.
+        A conductor listed at several junctions joins them into one net.
+        """
+        pins: Dict[str, List[str]] = {}
+        for node in sorted(raw_nodes, key=natural_key):
+            for component in raw_nodes[node]:
+                pins.setdefault(component, []).append(node)
+        return cls(pins, conductors=[c for c in conductors if c in pins], prefix=prefix)
+
+    def net_of(self, point: Optional[Hashable]) -> Optional[str]:
+        return self._net_by_point.get(point) if point is not None else None
+
+    def representative(self, point: Optional[Hashable]) -> Optional[Hashable]:
+        """Smallest point on the same net, e.g. the lowest row a wire chain reaches."""
+        net = self.net_of(point)
+        return self.nets[net][0] if net else None
+
+    def connected(self, a: Hashable, b: Hashable) -> bool:
+        net = self.net_of(a)
+        return net is not None and net == self.net_of(b)
+
+    def components_on(self, net: str, include_conductors: bool = True) -> List[str]:
+        return sorted(
+            (
+                label for label, nets in self.pins.items()
+                if net in nets and (include_conductors or label not in self.conductors)
+            ),
+            key=natural_key,
+        )
+
+    def node_lists(self) -> Dict[str, List[str]]:
+        """{net label: [components on it]} - the process_observed2 output shape."""
+        return {net: self.components_on(net) for net in self.nets}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "nets": {
+                net: {"points": [str(p) for p in points], "components": self.components_on(net)}
+                for net, points in self.nets.items()
+            },
+            "pins": self.pins,
+            "conductors": sorted(self.conductors, key=natural_key),
+        }
@@ -0,0 +1,80 @@
+# netlist_cache.py
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+class NetlistCache:
+    """
+    Persistent schematic -> netlist cache in a small SQLite file.
+    Entries are content addressed (image bytes + model + prompt) and evicted
+    least-recently-used once max_entries or max_bytes is exceeded.
+    """
+
+    def __init__(self, path: Path, max_entries: int = 500, max_bytes: int = 20 * 1024 * 1024):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS netlists (
+                    key TEXT PRIMARY KEY,
+                    netlist TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS netlists_last_used ON netlists (last_used)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(str(self.path), timeout=5)
+
+    @staticmethod
+    def make_key(image_bytes: bytes, model: str, prompt: str) -> str:
+        h = hashlib.sha256()
+        for part in (image_bytes, model.encode("utf-8"), prompt.encode("utf-8")):
+            # Length-prefix each part so different splits can't collide
+            h.update(len(part).to_bytes(8, "big"))
+            h.update(part)
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as db:
+            row = db.execute("SELECT netlist FROM netlists WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE netlists SET last_used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key: str, netlist: Dict[str, Any]) -> None:
+        text = json.dumps(netlist)
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO netlists (key, netlist, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, text, len(text.encode("utf-8")), now, now),
+            )
+            self._evict(db)
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        count, total = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM netlists").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        for key, size in db.execute("SELECT key, size FROM netlists ORDER BY last_used ASC").fetchall():
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            db.execute("DELETE FROM netlists WHERE key = ?", (key,))
+            count -= 1
+            total -= size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as db:
+            count, total = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM netlists").fetchone()
+        return {"entries": count, "bytes": total, "max_entries": self.max_entries, "max_bytes": self.max_bytes}
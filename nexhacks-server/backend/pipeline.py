@@ -0,0 +1,187 @@
+# pipeline.py
+import os
+import time
+import uuid
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi import Path as PathParam
+
+from analyze import ANALYZE_PHRASE_WITH_LLM, analyze_session
+from process_observed import observe
+from session_store import DEFAULT_SESSION, SESSION_ID_PATTERN, sessions
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Also prepare the answer once a frame is analyzed, so the next GET /answer is instant
+PIPELINE_PREFETCH_ANSWER = os.getenv("PIPELINE_PREFETCH_ANSWER", "true").lower() in ("1", "true", "yes")
+# How long /answer waits for an in-flight frame's analysis before using what it has
+PIPELINE_ANALYSIS_WAIT = float(os.getenv("PIPELINE_ANALYSIS_WAIT", "20"))
+
+
+class PipelineRun:
+    """One snapshot going through observe -> analyze (-> answer) for a session."""
+
+    def __init__(self, session_id: str, force: bool):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.force = force
+        self.status = "running"  # running | done | error | cancelled
+        self.stage: Optional[str] = None
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        self.changed: Optional[bool] = None
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        # Set once this frame's analysis is in the session store (or the run ended without one)
+        self.analyzed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "run_id": self.id,
+            "session_id": self.session_id,
+            "status": self.status,
+            "stage": self.stage,
+            "error": self.error,
+            "changed": self.changed,
+            "timings_ms": self.timings,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class Pipeline:
+    """
+    Event-driven observe/analyze pipeline. Each new frame for a session cancels
+    that session's in-flight run (its results would be stale anyway) and starts
+    a fresh one; results land in the session store for /analyze and /answer.
+    """
+
+    def __init__(self, prefetch_answer: bool = PIPELINE_PREFETCH_ANSWER):
+        self.prefetch_answer = prefetch_answer
+        self.runs: Dict[str, PipelineRun] = {}
+
+    def trigger(self, session_id: str = DEFAULT_SESSION, force: bool = False) -> PipelineRun:
+        previous = self.runs.get(session_id)
+        if previous is not None and previous.task is not None and not previous.task.done():
+            logger.info(f"[pipeline] session={session_id} cancelling stale run {previous.id} at stage {previous.stage}")
+            previous.task.cancel()
+
+        run = PipelineRun(session_id, force)
+        self.runs[session_id] = run
+        run.task = asyncio.create_task(self._run(run))
+        return run
+
+    async def _stage(self, run: PipelineRun, name: str, coro):
+        run.stage = name
+        start = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            run.timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+    async def _run(self, run: PipelineRun) -> None:
+        sid = run.session_id
+        try:
+            observed = await self._stage(run, "observe", observe(sid, force=run.force))
+            run.changed = observed.get("changed")
+            await self._stage(run, "analyze", analyze_session(sid, ANALYZE_PHRASE_WITH_LLM))
+            run.analyzed.set()
+            if self.prefetch_answer:
+                # Imported here: answer reads analyses through this module
+                from answer import answer_session
+                await self._stage(run, "answer", answer_session(sid))
+            run.status = "done"
+            logger.info(f"[pipeline] session={sid} run {run.id} done {run.timings}")
+        except asyncio.CancelledError:
+            run.status = "cancelled"
+            raise
+        except HTTPException as e:
+            run.status, run.error = "error", f"{e.status_code}: {e.detail}"
+            logger.error(f"[pipeline] session={sid} run {run.id} failed at {run.stage}: {run.error}")
+        except Exception as e:
+            run.status, run.error = "error", f"{type(e).__name__}: {e}"
+            logger.exception(f"[pipeline] session={sid} run {run.id} crashed at {run.stage}")
+        finally:
+            run.stage = None
+            run.finished = time.time()
+            run.analyzed.set()
+
+    def busy(self, session_id: str = DEFAULT_SESSION) -> bool:
+        run = self.runs.get(session_id)
+        return run is not None and run.task is not None and not run.task.done() and run.task is not asyncio.current_task()
+
+    async def latest_analysis(
+        self, session_id: str = DEFAULT_SESSION, timeout: float = PIPELINE_ANALYSIS_WAIT
+    ) -> Optional[Dict[str, Any]]:
+        """
+        The session's current analysis from memory. If a newer frame is still
+        being analyzed, wait (up to timeout) for that instead of answering from
+        the previous board. Follows replacement runs if frames keep arriving.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            run = self.runs.get(session_id)
+            if run is None or run.task is None or run.task is asyncio.current_task() or run.analyzed.is_set():
+                break
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                logger.warning(f"[pipeline] session={session_id} analysis still running, using the previous one")
+                break
+            waiter = asyncio.ensure_future(run.analyzed.wait())
+            await asyncio.wait({waiter, run.task}, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+        return sessions.get(session_id).analysis
+
+    async def pending_answer(
+        self, session_id: str = DEFAULT_SESSION, timeout: float = PIPELINE_ANALYSIS_WAIT
+    ) -> Optional[Dict[str, Any]]:
+        """If a run is still preparing this session's answer, wait for it instead of asking twice."""
+        run = self.runs.get(session_id)
+        if not self.prefetch_answer or run is None or run.task is None:
+            return None
+        if run.task.done() or run.task is asyncio.current_task():
+            return None
+        await asyncio.wait({run.task}, timeout=timeout)
+        if run.status != "done":
+            return None
+        return sessions.get(session_id).answer
+
+    async def shutdown(self) -> None:
+        tasks = [r.task for r in self.runs.values() if r.task is not None and not r.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+pipeline = Pipeline()
+
+
+@router.post("/pipeline/frame", status_code=202)
+async def new_frame(
+    force: bool = Query(False, description="If true, transcribe the frame even if it looks unchanged."),
+):
+    """Call after camera-capture/uploads/latest.jpg is replaced. Runs in the background."""
+    return pipeline.trigger(DEFAULT_SESSION, force).to_dict()
+
+
+@router.post("/sessions/{session_id}/frame", status_code=202)
+async def new_session_frame(
+    session_id: str = PathParam(..., pattern=SESSION_ID_PATTERN),
+    force: bool = Query(False, description="If true, transcribe the frame even if it looks unchanged."),
+):
+    return pipeline.trigger(session_id, force).to_dict()
+
+
+@router.get("/sessions/{session_id}/pipeline")
+async def pipeline_status(session_id: str = PathParam(..., pattern=SESSION_ID_PATTERN)):
+    run = pipeline.runs.get(session_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail=f"No frames processed for session {session_id}")
+    return run.to_dict()
@@ -1,29 +1,56 @@
 # process_observed.py
 import os
 import time
-import asyncio
 import json
-import base64
+import asyncio
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 from dotenv import load_dotenv
 
-import httpx
 from fastapi import APIRouter, HTTPException, Query
+from fastapi import Path as PathParam
+
+import llm_gateway
+import board_detector
+import board_calibration
+import hole_diff
+from board_calibration import BoardCalibration
+from metrics import stage
+from model_router import ModelRouter
+from frame_gate import FrameGate, frame_signature
+from hole_diff import HoleDiff, merge_observed
+from image_preprocess import DEFAULT_CROP_BOX, image_to_data_url
+from session_store import DEFAULT_SESSION, SESSION_ID_PATTERN, sessions
+from singleflight import SingleFlight, payload_key
 
 load_dotenv()
 router = APIRouter()
 
 BASE_DIR = Path(__file__).parent
 
-OBSERVED_IMAGE_PATH = BASE_DIR.parent.parent / "camera-capture" / "uploads" / "latest.jpg"
-OUTPUT_DIR = BASE_DIR / "observed-output"
+UPLOADS_DIR = BASE_DIR.parent.parent / "camera-capture" / "uploads"
+OBSERVED_IMAGE_PATH = UPLOADS_DIR / "latest.jpg"
 
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
 OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "google/gemini-2.0-flash-exp:free")
 OPENROUTER_SITE_URL = os.getenv("OPENROUTER_SITE_URL", "http://localhost:8000")
 OPENROUTER_APP_NAME = os.getenv("OPENROUTER_APP_NAME", "circuit-tutor-observed-preprocess")
 
+# Who reads the board:
+#   remote            - the vision LLM (default)
+#   local             - board_detector.py on this machine's CPU; the LLM only when
+#                       detection fails or is below LOCAL_MIN_CONFIDENCE
+#   local-then-verify - local first; the LLM whenever the local result is unsure
+# The local modes are opt-in: see board_detector.py for where the detector stops working.
+OBSERVED_MODE = os.getenv("OBSERVED_MODE", "remote").lower()
+OBSERVED_MODES = ("remote", "local", "local-then-verify")
+# Local results below this confidence are never returned as the observed board
+LOCAL_MIN_CONFIDENCE = float(os.getenv("LOCAL_MIN_CONFIDENCE", "0.4"))
+# Local results below this confidence (or with UNKNOWN leads) go to the LLM in local-then-verify
+LOCAL_VERIFY_CONFIDENCE = float(os.getenv("LOCAL_VERIFY_CONFIDENCE", "0.6"))
+# With a calibrated board, send the vision model the straightened board instead of a crop of the frame
+OBSERVED_RECTIFY = os.getenv("OBSERVED_RECTIFY", "false").lower() in ("1", "true", "yes")
+
 
 PROMPT = """You are a breadboard state transcriber.
 
@@ -69,12 +96,17 @@ def guess_mime(p: Path) -> str:
     raise HTTPException(status_code=400, detail="Unsupported image type. Use png/jpg/webp.")
 
 
-def file_to_data_url(image_path: Path) -> str:
+def observed_image_path(session_id: str) -> Path:
+    # Each bench's camera uploads to uploads/<session>/latest.jpg
+    if session_id == DEFAULT_SESSION:
+        return OBSERVED_IMAGE_PATH
+    return UPLOADS_DIR / session_id / "latest.jpg"
+
+
+def read_image_bytes(image_path: Path) -> bytes:
     if not image_path.exists():
         raise HTTPException(status_code=500, detail=f"Missing observed image file: {image_path}")
-    mime = guess_mime(image_path)
-    b64 = base64.b64encode(image_path.read_bytes()).decode("utf-8")
-    return f"data:{mime};base64,{b64}"
+    return image_path.read_bytes()
 
 
 def extract_first_json_object(text: str) -> str:
@@ -98,12 +130,21 @@ def validate_observed(obj: Any) -> Dict[str, Any]:
     return obj
 
 
-async def call_openrouter_vision(data_url: str) -> Dict[str, Any]:
+vision_flights = SingleFlight("process-observed")
+# OPENROUTER_MODEL first, then OPENROUTER_FALLBACK_MODELS_PROCESS_OBSERVED
+vision_models = ModelRouter("process-observed", OPENROUTER_MODEL)
+
+
+async def call_openrouter_vision(data_url: str, prompt: str = PROMPT) -> Dict[str, Any]:
+    # The same frame requested twice at once (poller + pipeline) is transcribed once
+    key = payload_key("process-observed", {"models": vision_models.models, "image": data_url, "prompt": prompt})
+    return await vision_flights.do(key, lambda: _call_openrouter_vision(data_url, prompt))
+
+
+async def _call_openrouter_vision(data_url: str, prompt: str = PROMPT) -> Dict[str, Any]:
     if not OPENROUTER_API_KEY:
         raise HTTPException(status_code=500, detail="Missing OPENROUTER_API_KEY in .env")
 
-    print(f"[process-observed] Using OpenRouter model={OPENROUTER_MODEL}")
-
     headers = {
         "Authorization": f"Bearer {OPENROUTER_API_KEY}",
         "Content-Type": "application/json",
@@ -111,79 +152,335 @@ async def call_openrouter_vision(data_url: str) -> Dict[str, Any]:
         "X-Title": OPENROUTER_APP_NAME,
     }
 
-    body = {
-        "model": OPENROUTER_MODEL,
-        "temperature": 0,
-        "response_format": {"type": "json_object"},
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": PROMPT},
-                    {"type": "image_url", "image_url": {"url": data_url}},
-                ],
-            }
-        ],
-    }
-
-    async with httpx.AsyncClient(timeout=120) as client:
-        for attempt in range(3):
-            r = await client.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers=headers,
-                json=body,
-            )
-            if r.status_code == 429 and attempt < 2:
-                delay = 1.5 * (2 ** attempt)
-                print(f"[process-observed] OpenRouter 429 rate limit, retrying in {delay}s")
-                await asyncio.sleep(delay)
-                continue
-            if r.status_code >= 400:
-                print(f"[process-observed] OpenRouter error {r.status_code}: {r.text}")
-                raise HTTPException(status_code=502, detail=f"OpenRouter error {r.status_code}: {r.text}")
-            break
+    async def attempt(model: str) -> Dict[str, Any]:
+        print(f"[process-observed] Using OpenRouter model={model}")
+        body = {
+            "model": model,
+            "temperature": 0,
+            "response_format": {"type": "json_object"},
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt},
+                        {"type": "image_url", "image_url": {"url": data_url}},
+                    ],
+                }
+            ],
+        }
+
+        # Rate limits are retried by the gateway's scheduler
+        r = await llm_gateway.post_chat_completion("process-observed", headers=headers, body=body)
+        if r.status_code >= 400:
+            print(f"[process-observed] OpenRouter error {r.status_code}: {r.text}")
+            raise HTTPException(status_code=502, detail=f"OpenRouter error {r.status_code}: {r.text}")
 
         data = r.json()
         content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
         if not isinstance(content, str):
             content = json.dumps(content)
 
-        json_text = extract_first_json_object(content)
-
+        with stage("json_extract", "process-observed"):
+            json_text = extract_first_json_object(content)
+            try:
+                obj = json.loads(json_text)
+            except Exception:
+                raise HTTPException(
+                    status_code=502,
+                    detail=f"Model did not return valid JSON. First 300 chars:\n{content[:300]}",
+                )
+
+        with stage("validate", "process-observed"):
+            return validate_observed(obj)
+
+    # Falls back (or hedges) across models until one passes validate_observed
+    observed, _ = await vision_models.run(attempt)
+    return observed
+
+
+# One saved grid registration per bench camera (see board_calibration.py)
+calibrations: Dict[str, BoardCalibration] = {}
+
+
+def calibration_for(session_id: str) -> BoardCalibration:
+    if session_id not in calibrations:
+        calibrations[session_id] = BoardCalibration()
+    return calibrations[session_id]
+
+
+def register_frame(session_id: str, image_bytes: bytes) -> Tuple[board_detector.Frame, board_detector.GridRegistration, Dict[str, Any]]:
+    """Decode the frame, find its holes and reuse (or redo) the bench's registration. Blocking."""
+    frame = board_detector.Frame(image_bytes)
+    registration, info = calibration_for(session_id).update(frame)
+    return frame, registration, info
+
+
+def detect_locally(frame: board_detector.Frame, registration: board_detector.GridRegistration) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Run the CPU detector and check its output like an LLM answer."""
+    observed, info = board_detector.detect(frame, registration)
+    info["timings_ms"]["holes"] = round(frame.seconds * 1000, 1)
+    with stage("validate", "process-observed"):
+        validate_observed(observed)
+    info["registration"] = info["registration"].to_dict()
+    return observed, info
+
+
+def local_is_sure(observed: Dict[str, Any], info: Dict[str, Any], mode: str) -> bool:
+    """Whether a local reading may stand in for the vision model in this mode."""
+    if not observed["components"]:
+        return False
+    if mode == "local":
+        return info["confidence"] >= LOCAL_MIN_CONFIDENCE
+    unknown = any(c == "UNKNOWN" for coords in observed["components"].values() for c in coords)
+    return not unknown and info["confidence"] >= LOCAL_VERIFY_CONFIDENCE
+
+
+def board_image(frame: board_detector.Frame, registration: board_detector.GridRegistration) -> bytes:
+    """The rectified board as PNG; image_to_data_url re-encodes it to JPEG at the usual size."""
+    return board_detector.encode_image(board_detector.rectify(frame, registration))
+
+
+def observed_mode(mode: Optional[str]) -> str:
+    mode = (mode or OBSERVED_MODE).lower()
+    if mode not in OBSERVED_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown mode {mode!r}. Use one of: {', '.join(OBSERVED_MODES)}")
+    return mode
+
+
+async def locate_board(session_id: str, image_bytes: bytes, mode: str) -> Tuple[Any, Any, Dict[str, Any]]:
+    """
+    The frame and the bench's saved registration, when the board can be calibrated.
+    Returns (frame, registration, details); both are None if it can't.
+    """
+    details: Dict[str, Any] = {}
+    if mode == "remote" and not board_calibration.enabled():
+        return None, None, details
+    try:
+        with stage("board_register", "process-observed"):
+            frame, registration, details["calibration"] = await asyncio.to_thread(register_frame, session_id, image_bytes)
+    except board_detector.DetectionError as e:
+        details["calibration"] = {"error": str(e)}
+        return None, None, details
+    return frame, registration, details
+
+
+async def read_board(
+    image_bytes: bytes,
+    mode: str,
+    frame: Any = None,
+    registration: Any = None,
+    rows: Optional[Tuple[int, int]] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Observed board for a frame in the given mode. Returns (observed, details).
+    With a registration, rows=(first, last) shows the vision model only that span
+    of the board. details["rows"] is set when it did, and the caller then merges the
+    result into the previous board; local readings always cover the whole board.
+    """
+    details: Dict[str, Any] = {"mode": mode}
+
+    if mode != "remote":
         try:
-            obj = json.loads(json_text)
-        except Exception:
-            raise HTTPException(
-                status_code=502,
-                detail=f"Model did not return valid JSON. First 300 chars:\n{content[:300]}",
-            )
+            if registration is None:
+                raise board_detector.DetectionError("Board not registered (see calibration.error)")
+            with stage("local_detect", "process-observed"):
+                observed, info = await asyncio.to_thread(detect_locally, frame, registration)
+        except (board_detector.DetectionError, HTTPException) as e:
+            # A failed local read is never the observed board; the vision model reads it instead
+            reason = e.detail if isinstance(e, HTTPException) else str(e)
+            print(f"[process-observed] Local detection failed ({reason}), asking the vision model")
+            details["local"] = {"error": reason}
+        else:
+            details["local"] = info
+            if local_is_sure(observed, info, mode):
+                details["source"] = "local"
+                return observed, details
+            print(f"[process-observed] Local result unsure (confidence {info['confidence']}), asking the vision model")
+
+    prompt = PROMPT
+    if registration is not None and rows is not None:
+        # Only the rows around what changed; the rest of the board is already known
+        crop_box = board_detector.board_crop_box(registration, rows=rows)
+        details["rows"] = list(rows)
+        data_url, image_stats = await asyncio.to_thread(image_to_data_url, image_bytes, crop_box=crop_box)
+        prompt += (
+            f"\n\nThis image shows only rows {rows[0]}-{rows[1]} of the board. "
+            "Report only components with at least one lead in those rows."
+        )
+    elif registration is not None and OBSERVED_RECTIFY:
+        board_png = await asyncio.to_thread(board_image, frame, registration)
+        data_url, image_stats = await asyncio.to_thread(image_to_data_url, board_png)
+    elif registration is not None:
+        # Just the board, whatever else the phone sees around it
+        crop_box = board_detector.board_crop_box(registration)
+        data_url, image_stats = await asyncio.to_thread(image_to_data_url, image_bytes, crop_box=crop_box)
+    else:
+        data_url, image_stats = await asyncio.to_thread(image_to_data_url, image_bytes, crop_box=DEFAULT_CROP_BOX)
+    print(
+        f"[process-observed] Image {image_stats['bytes_before']} -> {image_stats['bytes_after']} bytes "
+        f"({image_stats['size_before']} -> {image_stats['size_after']})"
+    )
+    observed = await call_openrouter_vision(data_url, prompt)
+    details.update(source="remote", image_stats=image_stats)
+    return observed, details
 
-        return validate_observed(obj)
 
+# One gate per bench, so a change on one board never masks another
+frame_gates: Dict[str, FrameGate] = {}
 
-@router.get("/process-observed")
-async def process_observed(
-    image_path: Optional[str] = Query(
-        None,
-        description="Optional absolute path to the observed image to process.",
-    ),
-):
+
+def frame_gate_for(session_id: str) -> FrameGate:
+    if session_id not in frame_gates:
+        frame_gates[session_id] = FrameGate()
+    return frame_gates[session_id]
+
+
+# Hole thumbnails of each bench's last transcribed frame (see hole_diff.py)
+hole_diffs: Dict[str, HoleDiff] = {}
+
+
+def hole_diff_for(session_id: str) -> HoleDiff:
+    if session_id not in hole_diffs:
+        hole_diffs[session_id] = HoleDiff()
+    return hole_diffs[session_id]
+
+
+async def observe(
+    session_id: str, image_path: Optional[str] = None, force: bool = False, mode: Optional[str] = None
+) -> Dict[str, Any]:
     start_time = time.perf_counter()
-    observed_path = Path(image_path) if image_path else OBSERVED_IMAGE_PATH
-    print(f"[process-observed] Received request image_path={observed_path}")
-    data_url = file_to_data_url(observed_path)
-    observed = await call_openrouter_vision(data_url)
+    # Checked up front, so a bad mode is a 400 even when the frame turns out unchanged
+    mode = observed_mode(mode)
+    observed_path = Path(image_path) if image_path else observed_image_path(session_id)
+    print(f"[process-observed] session={session_id} image_path={observed_path}")
+    guess_mime(observed_path)
+    with stage("image_read", "process-observed"):
+        image_bytes = read_image_bytes(observed_path)
+
+    state = sessions.get(session_id)
+    out_path = sessions.path_for(session_id, "observed")
+    frame_gate = frame_gate_for(session_id)
+
+    # Skip the vision model when the board looks the same as the last processed frame
+    # Decoding the JPEG is CPU work, so it runs off the event loop like the rest of the frame handling
+    try:
+        signature = await asyncio.to_thread(frame_signature, image_bytes)
+    except Exception as e:
+        # Truncated or corrupt upload; same answer preprocess_image gives
+        raise HTTPException(status_code=400, detail=f"Could not decode image: {e}")
+    changed, diff_score = frame_gate.check(signature)
+    if not changed and not force and state.observed is not None:
+        observed = state.observed
+        print(f"[process-observed] Frame unchanged (diff={diff_score}), reusing last observed board")
+        return {
+            "session_id": session_id,
+            "image": str(observed_path),
+            "observed": observed,
+            "saved_to": str(out_path),
+            "changed": False,
+            "diff_score": diff_score,
+        }
+
+    frame, registration, calibration = await locate_board(session_id, image_bytes, mode)
+
+    # On a calibrated board, find which holes changed and only re-read around those
+    changed_holes = thumbs = None
+    hole_gate = hole_diff_for(session_id)
+    if registration is not None and hole_diff.enabled():
+        with stage("hole_diff", "process-observed"):
+            coords, thumbs = await asyncio.to_thread(hole_diff.signatures, frame, registration)
+            if not force and state.observed is not None:
+                changed_holes = hole_gate.check(registration, coords, thumbs)
+        if changed_holes is not None and not changed_holes:
+            print(f"[process-observed] Frame changed (diff={diff_score}) but no holes did, reusing last observed board")
+            frame_gate.accept(signature)
+            hole_gate.accept(registration, coords, thumbs)
+            return {
+                "session_id": session_id,
+                "image": str(observed_path),
+                "observed": state.observed,
+                "saved_to": str(out_path),
+                "changed": False,
+                "diff_score": diff_score,
+                "changed_holes": {},
+                **calibration,
+            }
 
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    out_path = OUTPUT_DIR / "1.json"
-    out_path.write_text(json.dumps(observed, indent=2), encoding="utf-8")
+    rows = None
+    if changed_holes:
+        rows = hole_diff.read_rows(list(changed_holes), state.observed, registration.rows)
+        print(f"[process-observed] {len(changed_holes)} holes changed, rows to re-read: {rows}")
+    observed, details = await read_board(image_bytes, mode, frame, registration, rows)
+    if changed_holes:
+        details["changed_holes"] = changed_holes
+    if "rows" in details:
+        # The vision model only saw part of the board; a local reading covers all of it
+        observed = merge_observed(state.observed, observed, list(changed_holes))
+
+    # Persisted to observed-output/1.json (or session-state/<id>/) in the background by the session store
+    sessions.update(session_id, observed=observed)
+    frame_gate.accept(signature)
+    if thumbs is not None:
+        hole_gate.accept(registration, coords, thumbs)
 
     duration_ms = int((time.perf_counter() - start_time) * 1000)
     print(
         f"[process-observed] Saved output to {out_path} in {duration_ms}ms"
     )
     return {
+        "session_id": session_id,
         "image": str(observed_path),
         "observed": observed,
         "saved_to": str(out_path),
+        "changed": True,
+        "diff_score": diff_score,
+        **calibration,
+        **details,
     }
+
+
+@router.get("/process-observed")
+async def process_observed(
+    image_path: Optional[str] = Query(
+        None,
+        description="Optional absolute path to the observed image to process.",
+    ),
+    force: bool = Query(
+        False,
+        description="If true, transcribe the frame even if it looks unchanged.",
+    ),
+    mode: Optional[str] = Query(
+        None,
+        description="remote, local or local-then-verify (default: OBSERVED_MODE).",
+    ),
+):
+    return await observe(DEFAULT_SESSION, image_path, force, mode)
+
+
+@router.get("/sessions/{session_id}/observed")
+async def process_session_observed(
+    session_id: str = PathParam(..., pattern=SESSION_ID_PATTERN),
+    force: bool = Query(
+        False,
+        description="If true, transcribe the frame even if it looks unchanged.",
+    ),
+    mode: Optional[str] = Query(
+        None,
+        description="remote, local or local-then-verify (default: OBSERVED_MODE).",
+    ),
+):
+    """Same as /process-observed for one bench, reading camera-capture/uploads/<session_id>/latest.jpg."""
+    return await observe(session_id, force=force, mode=mode)
+
+
+@router.get("/sessions/{session_id}/calibration")
+def get_calibration(session_id: str = PathParam(..., pattern=SESSION_ID_PATTERN)):
+    """The bench's saved breadboard registration and drift-check history."""
+    return {"session_id": session_id, "enabled": board_calibration.enabled(), **calibration_for(session_id).to_dict()}
+
+
+@router.delete("/sessions/{session_id}/calibration")
+def reset_calibration(session_id: str = PathParam(..., pattern=SESSION_ID_PATTERN)):
+    """Forget the registration, so the next frame registers the board from scratch."""
+    calibration_for(session_id).reset()
+    return {"session_id": session_id, "calibrated": False}
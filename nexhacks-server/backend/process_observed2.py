@@ -203,14 +203,20 @@
 # process_observed.py
 import os
 import json
-import base64
+import asyncio
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Tuple
 from dotenv import load_dotenv
 
-import httpx
 from fastapi import APIRouter, HTTPException
 
+import llm_gateway
+from metrics import stage
+from model_router import ModelRouter
+from board_analyzer import label_type
+from image_preprocess import DEFAULT_CROP_BOX, image_to_data_url
+from netlist import Netlist
+
 load_dotenv()
 router = APIRouter()
 
@@ -285,12 +291,13 @@ def guess_mime(p: Path) -> str:
     raise HTTPException(status_code=400, detail="Unsupported image type. Use png/jpg/webp.")
 
 
-def file_to_data_url(image_path: Path) -> str:
+def file_to_data_url(image_path: Path) -> Tuple[str, Dict[str, Any]]:
     if not image_path.exists():
         raise HTTPException(status_code=500, detail=f"Missing observed image file: {image_path}")
-    mime = guess_mime(image_path)
-    b64 = base64.b64encode(image_path.read_bytes()).decode("utf-8")
-    return f"data:{mime};base64,{b64}"
+    guess_mime(image_path)
+    with stage("image_read", "process-observed2"):
+        image_bytes = image_path.read_bytes()
+    return image_to_data_url(image_bytes, crop_box=DEFAULT_CROP_BOX)
 
 
 def extract_first_json_object(text: str) -> str:
@@ -302,22 +309,17 @@ def extract_first_json_object(text: str) -> str:
 
 
 def merge_nodes(raw_nodes: Dict[str, list]) -> Dict[str, list]:
-    """Merge overlapping nodes to produce logical connectivity."""
-    merged_nodes = []
+    """
+    Merge junctions joined by wires into logical nets. Only conductors merge nodes;
+    a resistor or LED listed at two junctions keeps them separate.
+    """
+    components = {c for comps in raw_nodes.values() for c in comps if isinstance(c, str)}
+    wires = [c for c in components if label_type(c) == "wire"]
+    return Netlist.from_node_lists(raw_nodes, conductors=wires).node_lists()
 
-    for comps in raw_nodes.values():
-        found = False
-        for m in merged_nodes:
-            if set(m) & set(comps):  # overlap
-                m.update(comps)
-                found = True
-                break
-        if not found:
-            merged_nodes.append(set(comps))
 
-    # Convert sets to sorted lists and assign node labels
-    final_nodes = {f"node_{i+1}": sorted(list(m)) for i, m in enumerate(merged_nodes)}
-    return final_nodes
+# OPENROUTER_MODEL first, then OPENROUTER_FALLBACK_MODELS_PROCESS_OBSERVED2
+vision_models = ModelRouter("process-observed2", OPENROUTER_MODEL)
 
 
 async def call_openrouter_vision(data_url: str) -> Dict[str, Any]:
@@ -331,23 +333,23 @@ async def call_openrouter_vision(data_url: str) -> Dict[str, Any]:
         "X-Title": OPENROUTER_APP_NAME,
     }
 
-    body = {
-        "model": OPENROUTER_MODEL,
-        "temperature": 0,
-        "response_format": {"type": "json_object"},
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": PROMPT},
-                    {"type": "image_url", "image_url": {"url": data_url}},
-                ],
-            }
-        ],
-    }
-
-    async with httpx.AsyncClient(timeout=120) as client:
-        r = await client.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=body)
+    async def attempt(model: str) -> Dict[str, Any]:
+        body = {
+            "model": model,
+            "temperature": 0,
+            "response_format": {"type": "json_object"},
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": PROMPT},
+                        {"type": "image_url", "image_url": {"url": data_url}},
+                    ],
+                }
+            ],
+        }
+
+        r = await llm_gateway.post_chat_completion("process-observed2", headers=headers, body=body)
         if r.status_code >= 400:
             raise HTTPException(status_code=502, detail=f"OpenRouter error {r.status_code}: {r.text}")
 
@@ -356,34 +358,45 @@ async def call_openrouter_vision(data_url: str) -> Dict[str, Any]:
         if not isinstance(content, str):
             content = json.dumps(content)
 
-        json_text = extract_first_json_object(content)
-
-        try:
-            obj = json.loads(json_text)
-        except Exception:
-            raise HTTPException(
-                status_code=502,
-                detail=f"Model did not return valid JSON. First 300 chars:\n{content[:300]}",
-            )
-
-        # # Merge overlapping nodes
-        # if "nodes" in obj:
-        #     obj["nodes"] = merge_nodes(obj["nodes"])
+        with stage("json_extract", "process-observed2"):
+            json_text = extract_first_json_object(content)
+            try:
+                obj = json.loads(json_text)
+            except Exception:
+                raise HTTPException(
+                    status_code=502,
+                    detail=f"Model did not return valid JSON. First 300 chars:\n{content[:300]}",
+                )
+
+        # Merge junctions that wires connect (the prompt asks for {"node_1": [...], ...} at the top level)
+        nodes = obj.get("nodes", obj)
+        if isinstance(nodes, dict) and all(isinstance(v, list) for v in nodes.values()):
+            merged = merge_nodes(nodes)
+            if "nodes" in obj:
+                obj["nodes"] = merged
+            else:
+                obj = merged
 
         return obj
 
+    # Falls back (or hedges) across models until one returns parseable JSON
+    result, _ = await vision_models.run(attempt)
+    return result
+
 
 @router.get("/process-observed2")
 async def process_observed():
-    data_url = file_to_data_url(OBSERVED_IMAGE_PATH)
+    data_url, image_stats = await asyncio.to_thread(file_to_data_url, OBSERVED_IMAGE_PATH)
     observed = await call_openrouter_vision(data_url)
 
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     out_path = OUTPUT_DIR / "1.json"
-    out_path.write_text(json.dumps(observed, indent=2), encoding="utf-8")
+    with stage("disk_write", "process-observed2"):
+        out_path.write_text(json.dumps(observed, indent=2), encoding="utf-8")
 
     return {
         "image": str(OBSERVED_IMAGE_PATH),
         "observed": observed,
         "saved_to": str(out_path),
+        "image_stats": image_stats,
     }
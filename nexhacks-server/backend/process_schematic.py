@@ -1,13 +1,19 @@
 import os
 import json
-import base64
+import asyncio
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 
-import httpx
 from fastapi import FastAPI, HTTPException, Query, APIRouter
 from dotenv import load_dotenv
 
+import llm_gateway
+from metrics import stage
+from model_router import ModelRouter
+from netlist_cache import NetlistCache
+from image_preprocess import image_to_data_url
+from session_store import DEFAULT_SESSION, sessions
+
 load_dotenv()
 
 router = APIRouter()
@@ -21,6 +27,10 @@ OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "google/gemma-3-27b-it:free")
 OPENROUTER_SITE_URL = os.getenv("OPENROUTER_SITE_URL", "http://localhost:8000")
 OPENROUTER_APP_NAME = os.getenv("OPENROUTER_APP_NAME", "circuit-tutor-schematic-preprocess")
 
+SCHEMATIC_CACHE_PATH = Path(os.getenv("SCHEMATIC_CACHE_PATH", str(OUTPUT_DIR / "cache.sqlite3")))
+SCHEMATIC_CACHE_MAX_ENTRIES = int(os.getenv("SCHEMATIC_CACHE_MAX_ENTRIES", "500"))
+SCHEMATIC_CACHE_MAX_BYTES = int(os.getenv("SCHEMATIC_CACHE_MAX_BYTES", str(20 * 1024 * 1024)))
+
 
 PROMPT = """You are a schematic-to-netlist transcriber.
 
@@ -62,12 +72,10 @@ def guess_mime(path: Path) -> str:
     raise HTTPException(status_code=400, detail="Unsupported image type. Use png/jpg/webp.")
 
 
-def file_to_data_url(image_path: Path) -> str:
+def read_image_bytes(image_path: Path) -> bytes:
     if not image_path.exists():
         raise HTTPException(status_code=500, detail=f"Missing schematic file: {image_path}")
-    mime = guess_mime(image_path)
-    b64 = base64.b64encode(image_path.read_bytes()).decode("utf-8")
-    return f"data:{mime};base64,{b64}"
+    return image_path.read_bytes()
 
 
 def extract_first_json_object(text: str) -> str:
@@ -90,7 +98,12 @@ def validate_netlist(obj: Any) -> Dict[str, Any]:
     return obj
 
 
-async def call_openrouter_vision(data_url: str) -> Dict[str, Any]:
+# OPENROUTER_MODEL first, then OPENROUTER_FALLBACK_MODELS_PROCESS_SCHEMATIC
+schematic_models = ModelRouter("process-schematic", OPENROUTER_MODEL)
+
+
+async def call_openrouter_vision(data_url: str) -> Tuple[Dict[str, Any], str]:
+    """The validated netlist and the model that produced it (a fallback if the primary failed)."""
     if not OPENROUTER_API_KEY:
         raise HTTPException(status_code=500, detail="Missing OPENROUTER_API_KEY in .env")
 
@@ -101,23 +114,23 @@ async def call_openrouter_vision(data_url: str) -> Dict[str, Any]:
         "X-Title": OPENROUTER_APP_NAME,
     }
 
-    body = {
-        "model": OPENROUTER_MODEL,
-        "temperature": 0,
-        "response_format": {"type": "json_object"},
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": PROMPT},
-                    {"type": "image_url", "image_url": {"url": data_url}},
-                ],
-            }
-        ],
-    }
-
-    async with httpx.AsyncClient(timeout=120) as client:
-        r = await client.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=body)
+    async def attempt(model: str) -> Dict[str, Any]:
+        body = {
+            "model": model,
+            "temperature": 0,
+            "response_format": {"type": "json_object"},
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": PROMPT},
+                        {"type": "image_url", "image_url": {"url": data_url}},
+                    ],
+                }
+            ],
+        }
+
+        r = await llm_gateway.post_chat_completion("process-schematic", headers=headers, body=body)
         if r.status_code >= 400:
             raise HTTPException(status_code=502, detail=f"OpenRouter error {r.status_code}: {r.text}")
 
@@ -126,14 +139,19 @@ async def call_openrouter_vision(data_url: str) -> Dict[str, Any]:
         if not isinstance(content, str):
             content = json.dumps(content)
 
-        json_text = extract_first_json_object(content)
-        print(json_text)
-        try:
-            obj = json.loads(json_text)
-        except Exception:
-            raise HTTPException(status_code=502, detail=f"Model did not return valid JSON. First 300 chars:\n{content[:300]}")
+        with stage("json_extract", "process-schematic"):
+            json_text = extract_first_json_object(content)
+            print(json_text)
+            try:
+                obj = json.loads(json_text)
+            except Exception:
+                raise HTTPException(status_code=502, detail=f"Model did not return valid JSON. First 300 chars:\n{content[:300]}")
 
-        return validate_netlist(obj)
+        with stage("validate", "process-schematic"):
+            return validate_netlist(obj)
+
+    # Falls back (or hedges) across models until one passes validate_netlist
+    return await schematic_models.run(attempt)
 
 
 def find_schematic_file(id: int) -> Path:
@@ -150,19 +168,52 @@ def find_schematic_file(id: int) -> Path:
 #     return {"ok": True, "model": OPENROUTER_MODEL}
 
 
+netlist_cache = NetlistCache(
+    SCHEMATIC_CACHE_PATH,
+    max_entries=SCHEMATIC_CACHE_MAX_ENTRIES,
+    max_bytes=SCHEMATIC_CACHE_MAX_BYTES,
+)
+
+
 @router.get("/process-schematic")
 async def process_schematic(
     id: int = Query(1, description="Schematic id (reads sample-schematics/{id}.png/jpg/webp)"),
     save: bool = Query(True, description="If true, save result to schematic-output/{id}.json"),
+    refresh: bool = Query(False, description="If true, ignore the cache and re-transcribe the image"),
 ):
     image_path = find_schematic_file(id)
-    data_url = file_to_data_url(image_path)
-
-    netlist = await call_openrouter_vision(data_url)
+    guess_mime(image_path)
+    with stage("image_read", "process-schematic"):
+        image_bytes = read_image_bytes(image_path)
+
+    # Same image + model + prompt always gives the same netlist, so skip the vision call.
+    # Entries are keyed by the model that actually answered; look up in routing order,
+    # primary first. SQLite is blocking I/O, so it runs off the event loop.
+    netlist, model = None, None
+    if not refresh:
+        for candidate in schematic_models.models:
+            key = NetlistCache.make_key(image_bytes, candidate, PROMPT)
+            netlist = await asyncio.to_thread(netlist_cache.get, key)
+            if netlist is not None:
+                model = candidate
+                break
+    cached = netlist is not None
+    image_stats = None
+    if not cached:
+        # Pillow decode/resize/re-encode is CPU work; keep it off the event loop
+        data_url, image_stats = await asyncio.to_thread(image_to_data_url, image_bytes)
+        netlist, model = await call_openrouter_vision(data_url)
+        key = NetlistCache.make_key(image_bytes, model, PROMPT)
+        await asyncio.to_thread(netlist_cache.put, key, netlist)
 
     if save:
         OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
         out_path = OUTPUT_DIR / f"{id}.json"
-        out_path.write_text(json.dumps(netlist, indent=2), encoding="utf-8")
+        with stage("disk_write", "process-schematic"):
+            out_path.write_text(json.dumps(netlist, indent=2), encoding="utf-8")
+
+        # The saved schematic becomes the target for /analyze and /answer. Non-saving
+        # calls (benchmarks, previews) leave the live session alone.
+        sessions.update(DEFAULT_SESSION, netlist=netlist)
 
-    return {"id": id, "image": image_path.name, "netlist": netlist}
+    return {"id": id, "image": image_path.name, "netlist": netlist, "model": model, "cached": cached, "image_stats": image_stats}
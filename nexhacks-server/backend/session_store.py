@@ -0,0 +1,236 @@
+# session_store.py
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from dotenv import load_dotenv
+
+from metrics import stage
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).parent
+DEFAULT_SESSION = "default"
+# Session ids end up in file paths, so keep them to one safe path segment
+SESSION_ID_PATTERN = r"^[A-Za-z0-9_-]{1,64}$"
+
+SCHEMATIC_OUTPUT_DIR = BASE_DIR.parent.parent / "files" / "schematic-output"
+# Netlist written by camera-capture's /process-schematic, then the backend's own output, then the sample
+SHARED_NETLIST_PATHS = [
+    SCHEMATIC_OUTPUT_DIR / "schematic.json",
+    BASE_DIR / "schematic-output" / "1.json",
+    BASE_DIR / "sample-targets" / "1.json",
+]
+FALLBACK_OBSERVED_PATH = BASE_DIR / "sample-observed" / "1.json"
+
+# The default session keeps writing the files the rest of the tooling already knows about
+LEGACY_PATHS = {
+    "observed": BASE_DIR / "observed-output" / "1.json",
+    "answer": BASE_DIR / "answer-output" / "latest.json",
+}
+SESSION_STATE_DIR = BASE_DIR / "session-state"
+
+SESSION_PERSIST = os.getenv("SESSION_PERSIST", "true").lower() in ("1", "true", "yes")
+SESSION_FLUSH_DELAY = float(os.getenv("SESSION_FLUSH_DELAY", "0.5"))
+
+FIELDS = ("netlist", "observed", "analysis", "answer")
+
+# Called as listener(session_id, changed_fields) when a session's board or target changes
+ChangeListener = Callable[[str, Set[str]], None]
+
+
+def is_valid_session_id(session_id: str) -> bool:
+    return re.match(SESSION_ID_PATTERN, session_id) is not None
+
+
+def netlist_paths(session_id: str) -> List[Path]:
+    """A bench's own schematic first; benches without one share the class-wide target."""
+    if session_id == DEFAULT_SESSION:
+        return SHARED_NETLIST_PATHS
+    return [SCHEMATIC_OUTPUT_DIR / session_id / "schematic.json", *SHARED_NETLIST_PATHS]
+
+
+def read_json(p: Path) -> Optional[Dict[str, Any]]:
+    try:
+        return json.loads(p.read_text(encoding="utf-8"))
+    except Exception as e:
+        logger.warning(f"[session-store] Could not read {p}: {e}")
+        return None
+
+
+class SessionState:
+    """Parsed pipeline state for one bench: target netlist, observed board, last analysis, last answer."""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.netlist: Optional[Dict[str, Any]] = None
+        self.observed: Optional[Dict[str, Any]] = None
+        self.analysis: Optional[Dict[str, Any]] = None
+        self.answer: Optional[Dict[str, Any]] = None
+        self.updated: Dict[str, float] = {}
+        # Last analyzed board, its analysis and phrasings, for incremental re-analysis (memory only)
+        self.baseline: Optional[Dict[str, Any]] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            **{field: getattr(self, field) for field in FIELDS},
+            "updated": self.updated,
+        }
+
+
+class SessionStore:
+    """
+    Process-wide state keyed by session id. Readers get parsed objects from memory;
+    writes are persisted to disk in the background (write-behind) when enabled.
+    """
+
+    def __init__(self, persist: bool = SESSION_PERSIST, flush_delay: float = SESSION_FLUSH_DELAY):
+        self.persist = persist
+        self.flush_delay = flush_delay
+        self.sessions: Dict[str, SessionState] = {}
+        self._dirty: Dict[str, set] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._file_mtimes: Dict[Tuple[str, Path], float] = {}
+        self._fallback_observed: Optional[Dict[str, Any]] = None
+        self._listeners: List[ChangeListener] = []
+
+    def add_listener(self, listener: ChangeListener) -> None:
+        self._listeners.append(listener)
+
+    def _notify(self, session_id: str, fields: Set[str]) -> None:
+        for listener in self._listeners:
+            try:
+                listener(session_id, fields)
+            except Exception:
+                logger.exception(f"[session-store] Change listener failed for session {session_id}")
+
+    def path_for(self, session_id: str, field: str) -> Path:
+        if session_id == DEFAULT_SESSION and field in LEGACY_PATHS:
+            return LEGACY_PATHS[field]
+        return SESSION_STATE_DIR / session_id / f"{field}.json"
+
+    def get(self, session_id: str = DEFAULT_SESSION) -> SessionState:
+        if not is_valid_session_id(session_id):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+        state = self.sessions.get(session_id)
+        if state is None:
+            state = self.sessions[session_id] = SessionState(session_id)
+            self._restore(state)
+        return state
+
+    def _restore(self, state: SessionState) -> None:
+        # Pick up whatever a previous run persisted for this session
+        for field in FIELDS:
+            p = self.path_for(state.session_id, field)
+            if p.exists():
+                setattr(state, field, read_json(p))
+                state.updated[field] = p.stat().st_mtime
+
+    def update(self, session_id: str = DEFAULT_SESSION, **fields: Any) -> SessionState:
+        state = self.get(session_id)
+        now = time.time()
+        for field, value in fields.items():
+            if field not in FIELDS:
+                raise KeyError(f"Unknown session field: {field}")
+            setattr(state, field, value)
+            state.updated[field] = now
+            self._dirty.setdefault(session_id, set()).add(field)
+        # A new board or target makes the old analysis stale
+        board_fields = {"observed", "netlist"} & set(fields)
+        if board_fields and "analysis" not in fields and state.analysis is not None:
+            state.analysis = None
+            state.updated.pop("analysis", None)
+            self._dirty.setdefault(session_id, set()).add("analysis")
+        self._schedule_flush()
+        if board_fields:
+            self._notify(session_id, board_fields)
+        return state
+
+    def netlist(self, session_id: str = DEFAULT_SESSION) -> Optional[Dict[str, Any]]:
+        """
+        Current target netlist. The schematic can be written by another process
+        (camera-capture), so the first existing file from netlist_paths is re-parsed
+        only when its mtime moves past what the session already holds.
+        """
+        state = self.get(session_id)
+        for p in netlist_paths(session_id):
+            if not p.exists():
+                continue
+            mtime = p.stat().st_mtime
+            seen = max(state.updated.get("netlist", 0), self._file_mtimes.get((session_id, p), 0))
+            if state.netlist is None or mtime > seen:
+                loaded = read_json(p)
+                if loaded is not None:
+                    self._file_mtimes[session_id, p] = mtime
+                    changed = state.netlist is not None and loaded != state.netlist
+                    state.netlist = loaded
+                    state.updated["netlist"] = mtime
+                    if changed:
+                        self._notify(session_id, {"netlist"})
+            break
+        return state.netlist
+
+    def observed(self, session_id: str = DEFAULT_SESSION) -> Optional[Dict[str, Any]]:
+        """Live board from /process-observed, or the sample board until the first frame arrives."""
+        state = self.get(session_id)
+        if state.observed is not None:
+            return state.observed
+        if self._fallback_observed is None and FALLBACK_OBSERVED_PATH.exists():
+            self._fallback_observed = read_json(FALLBACK_OBSERVED_PATH)
+        return self._fallback_observed
+
+    def _schedule_flush(self) -> None:
+        if not self.persist:
+            self._dirty.clear()
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write_dirty()
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self) -> None:
+        # Coalesce bursts of updates into one write per field. Updates that land while
+        # a write is running don't schedule their own flush (this task isn't done yet),
+        # so keep going until nothing is left.
+        while True:
+            await asyncio.sleep(self.flush_delay)
+            await self.flush()
+            if not self._dirty:
+                break
+
+    async def flush(self) -> None:
+        if self._dirty:
+            await asyncio.to_thread(self._write_dirty)
+
+    def _write_dirty(self) -> None:
+        dirty, self._dirty = self._dirty, {}
+        for session_id, fields in dirty.items():
+            state = self.sessions[session_id]
+            for field in fields:
+                value = getattr(state, field)
+                p = self.path_for(session_id, field)
+                if value is None:
+                    # Cleared (e.g. a stale analysis); don't let a restart restore it
+                    p.unlink(missing_ok=True)
+                    continue
+                p.parent.mkdir(parents=True, exist_ok=True)
+                tmp = p.with_suffix(".tmp")
+                with stage("disk_write", "session-store"):
+                    tmp.write_text(json.dumps(value, indent=2), encoding="utf-8")
+                    tmp.replace(p)
+
+    def session_ids(self) -> List[str]:
+        return sorted(self.sessions)
+
+
+sessions = SessionStore()
@@ -0,0 +1,66 @@
+# singleflight.py
+import copy
+import json
+import asyncio
+import hashlib
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+def payload_key(route: str, payload: Any) -> str:
+    """Stable hash of a JSON-serializable request payload, namespaced by route."""
+    blob = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return f"{route}:{hashlib.sha256(blob.encode('utf-8')).hexdigest()}"
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: the first caller for a key starts the
+    work, everyone else arriving before it finishes awaits the same result.
+    The work runs as its own task, so one caller being cancelled (e.g. a stale
+    pipeline run) doesn't fail the others; it is only cancelled once nobody waits.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.flights: Dict[str, _Flight] = {}
+        self.started = 0
+        self.shared = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self.flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = self.flights[key] = _Flight(asyncio.ensure_future(fn()))
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.started += 1
+        else:
+            self.shared += 1
+            logger.info(f"[single-flight] {self.name}: joining in-flight call ({flight.waiters} already waiting)")
+
+        flight.waiters += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+        # Callers may keep and modify what they get back; only the leader gets the original
+        return result if leader else copy.deepcopy(result)
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": len(self.flights), "started": self.started, "shared": self.shared}